@@ -1,4 +1,5 @@
 import facereclib
+import multiprocessing
 
 # define the queue using all the default parameters
 grid = facereclib.utils.GridParameters(
@@ -16,4 +17,18 @@ grid_p16 = facereclib.utils.GridParameters(
 
   grid = 'local',
   number_of_parallel_processes = 4
-)
\ No newline at end of file
+)
+# define a setup in which one local worker process per core executes all jobs, keeping their tools loaded;
+# jobs of independent stages are executed concurrently, as long as the memory of their queues fits into the memory of the machine
+# (the training processes and threads of a single job are limited to the cores per worker, i.e., to one)
+grid_workers = facereclib.utils.GridParameters(
+  grid = 'workers',
+  number_of_parallel_processes = multiprocessing.cpu_count()
+)
+
+# define a setup in which the work queue is stored in the temp directory, so that workers on other machines can join
+grid_filesystem = facereclib.utils.GridParameters(
+  grid = 'workers',
+  work_queue = 'filesystem',
+  number_of_parallel_processes = 4
+)
@@ -18,6 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import shutil
 from .. import utils
 
 class File:
@@ -35,6 +36,10 @@ class File:
     # compare two File objects by comparing their IDs
     return self.id < other.id
 
+  def make_path(self, directory = None, extension = None):
+    """Returns the full path of the file, using the given base directory and file extension"""
+    return os.path.join(directory or '', self.path + (extension or ''))
+
 
 class FileSet:
   """This class defines the minimum interface of a file set that needs to be exported"""
@@ -67,6 +72,7 @@ class Database:
      annotation_directory = None,
      annotation_extension = '.pos',
      annotation_type = None,
+     annotation_cache = None,
      protocol = 'Default',
      **kwargs
   ):
@@ -88,6 +94,10 @@ class Database:
     annotation_directory
       The file extension of the annotation files.
 
+    annotation_cache
+      If given, the annotations of all files are parsed once and stored in an index in this directory (see :py:class:`facereclib.utils.annotations.AnnotationIndex`),
+      from which all further annotations are read.
+
     protocol
       The name of the protocol that defines the default experimental setup for this database.
 
@@ -101,6 +111,8 @@ class Database:
     self.annotation_directory = annotation_directory
     self.annotation_extension = annotation_extension
     self.annotation_type = annotation_type
+    self.annotation_cache = annotation_cache
+    self.m_annotation_index = None
     self.protocol = protocol
 
 
@@ -108,7 +120,7 @@ class Database:
     """This function returns a string containing all parameters of this class."""
     params = "name=%s, protocol=%s, original_directory=%s, original_extension=%s" % (self.name, self.protocol, self.original_directory, self.original_extension)
     if self.annotation_type is not None:
-      params += ", annotation_type=%s" % annotation_type
+      params += ", annotation_type=%s" % self.annotation_type
       if self.annotation_directory: params += ", annotation_directory=%s" % self.annotation_directory
       params += ", annotation_extension=%s" % self.annotation_extension
     return "%s(%s)" % (str(self.__class__), params)
@@ -141,9 +153,40 @@ class Database:
     return files_by_clients
 
 
+  def annotation_index(self):
+    """Returns the index of the annotations of all files of this database, which is created in the annotation_cache directory, if it does not exist yet.
+    If the index was created from a different annotation directory, extension or type, it is recreated.
+    For annotation types that cannot be stored in an index, a warning is printed, the annotation cache is disabled and None is returned."""
+    if self.m_annotation_index is None:
+      if not utils.annotations.AnnotationIndex.supports(self.annotation_type):
+        utils.warn("The annotations of type '%s' cannot be stored in an annotation index; they are read from the annotation files" % self.annotation_type)
+        self.annotation_cache = None
+        return None
+
+      source = (self.annotation_directory, self.annotation_extension, self.annotation_type)
+      if os.path.isdir(self.annotation_cache):
+        self.m_annotation_index = utils.annotations.AnnotationIndex(self.annotation_cache)
+        if self.m_annotation_index.source != tuple(str(s) for s in source):
+          utils.warn("The annotation index in '%s' was created from different annotations; recreating it" % self.annotation_cache)
+          shutil.rmtree(self.annotation_cache)
+          self.m_annotation_index = None
+
+      if self.m_annotation_index is None:
+        utils.info("Creating annotation index in '%s'" % self.annotation_cache)
+        utils.ensure_dir(os.path.dirname(os.path.abspath(self.annotation_cache)))
+        annotation_files = dict((file.path, os.path.join(self.annotation_directory, file.path + self.annotation_extension)) for file in self.all_files())
+        self.m_annotation_index = utils.annotations.AnnotationIndex.create(self.annotation_cache, annotation_files, self.annotation_type, source)
+    return self.m_annotation_index
+
+
   def annotations(self, file):
-    """Returns the annotations for the given File object, if available."""
+    """Returns the annotations for the given File object, if available.
+    If an annotation cache is specified, the annotations are read from the annotation index."""
     if self.annotation_directory:
+      if self.annotation_cache is not None:
+        index = self.annotation_index()
+        if index is not None and file.path in index:
+          return index.annotations(file.path)
       annotation_path = os.path.join(self.annotation_directory, file.path + self.annotation_extension)
       return utils.read_annotations(annotation_path, self.annotation_type)
     else:
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+import os
+import cPickle
+import tempfile
+import numpy
+
+from .Database import File, FileSet, Database, DatabaseZT
+from .. import utils
+
+
+class DatabaseSnapshot (DatabaseZT):
+  """This class provides the file lists of another database from a snapshot file, which is created once from the other database.
+  All file lists are precomputed for the stored protocols and groups, so that no database queries are required after the snapshot is created."""
+
+  # the training steps for which the training files are stored
+  TRAINING_STEPS = (None, 'train_extractor', 'train_projector', 'train_enroller')
+
+  def __init__(
+      self,
+      snapshot_file,   # The file containing the snapshot
+      database = None, # The database from which the snapshot is created, if the snapshot file does not exist
+      protocols = None,  # The protocols that are stored in the snapshot (default: only the protocol of the given database)
+      groups = None, # The groups that are stored in the snapshot (default: only the 'dev' group)
+      **kwargs  # Parameters of the base class that replace the ones of the snapshot
+  ):
+    """
+    Parameters of the constructor of this database:
+
+    snapshot_file
+      The file containing the snapshot, see :py:meth:`create`.
+
+    database
+      The :py:class:`facereclib.databases.Database` from which the snapshot is created, if the snapshot file does not exist yet.
+      If the existing snapshot was created from a different database, or for different protocols or groups, it is recreated.
+
+    protocols, groups
+      The protocols and groups of the given database that are stored when the snapshot is created.
+      If no database is given, but protocols or groups are, they need to be identical to the ones of the snapshot.
+
+    kwargs
+      Parameters of the :py:class:`facereclib.databases.Database` base class (e.g. the original_directory) that replace the ones that are stored in the snapshot.
+    """
+    snapshot = DatabaseSnapshot.__load__(snapshot_file) if os.path.exists(snapshot_file) else None
+    if database is not None:
+      source = DatabaseSnapshot.source(database, protocols, groups)
+      if snapshot is not None and snapshot.get('source') != source:
+        utils.warn("The database snapshot '%s' was created from a different database, or for different protocols or groups; recreating it" % snapshot_file)
+        snapshot = None
+      if snapshot is None:
+        DatabaseSnapshot.create(database, snapshot_file, protocols, groups)
+        snapshot = DatabaseSnapshot.__load__(snapshot_file)
+    elif snapshot is None:
+      raise IOError("The database snapshot '%s' does not exist, and no database is given to create it" % snapshot_file)
+    elif 'source' in snapshot:
+      if protocols is not None and tuple(sorted(protocols)) != snapshot['source'][1]:
+        raise ValueError("The database snapshot '%s' contains the protocols %s, but %s were requested" % (snapshot_file, list(snapshot['source'][1]), list(protocols)))
+      if groups is not None and tuple(sorted(groups)) != snapshot['source'][2]:
+        raise ValueError("The database snapshot '%s' contains the groups %s, but %s were requested" % (snapshot_file, list(snapshot['source'][2]), list(groups)))
+
+    parameters = dict(snapshot['parameters'])
+    parameters.update(kwargs)
+    Database.__init__(self, **parameters)
+
+    self.snapshot_file = snapshot_file
+    self.source = snapshot.get('source')
+    self.m_files = [File(file_id, client_id, path) for (file_id, client_id, path) in snapshot['files']]
+    self.m_file_sets = []
+    for (file_set_id, client_id, name, indices) in snapshot['file_sets']:
+      file_set = FileSet(file_set_id, client_id, name)
+      file_set.files = self.__files__(indices)
+      self.m_file_sets.append(file_set)
+    self.m_annotations = snapshot['annotations']
+    self.m_protocols = snapshot['protocols']
+
+
+  def __str__(self):
+    """This function returns a string containing all parameters of this class."""
+    params = "snapshot_file=%s, name=%s, protocol=%s, original_directory=%s, original_extension=%s" % (self.snapshot_file, self.name, self.protocol, self.original_directory, self.original_extension)
+    if self.annotation_type is not None:
+      params += ", annotation_type=%s" % self.annotation_type
+      if self.annotation_directory: params += ", annotation_directory=%s" % self.annotation_directory
+      params += ", annotation_extension=%s" % self.annotation_extension
+    return "%s(%s)" % (str(self.__class__), params)
+
+
+  ###########################################################################
+  ### Creation of the snapshot
+  ###########################################################################
+
+  @staticmethod
+  def __load__(snapshot_file):
+    """Reads the snapshot dictionary from the given file"""
+    utils.debug("Loading database snapshot '%s'" % snapshot_file)
+    with open(snapshot_file, 'rb') as f:
+      return cPickle.load(f)
+
+
+  @staticmethod
+  def source(database, protocols = None, groups = None):
+    """Returns the description of the origin of a snapshot of the given database, protocols and groups, which is stored in the snapshot.
+    It is used to check if an existing snapshot is up to date."""
+    protocols = [database.protocol] if protocols is None else protocols
+    groups = ('dev',) if groups is None else groups
+    return (str(database), tuple(sorted(protocols)), tuple(sorted(groups)))
+
+
+  @staticmethod
+  def create(database, snapshot_file, protocols = None, groups = None):
+    """Queries all file lists of the given database for the given protocols and groups and writes them to the given snapshot file.
+    By default, only the current protocol of the database and the 'dev' group are stored.
+    The file lists of the ZT score normalization are stored only, if the database provides them."""
+    source = DatabaseSnapshot.source(database, protocols, groups)
+    protocols = [database.protocol] if protocols is None else list(protocols)
+    groups = ('dev',) if groups is None else groups
+    utils.info("Creating database snapshot '%s' for protocol(s) %s and group(s) %s" % (snapshot_file, protocols, list(groups)))
+
+    files = []
+    file_indices = {}
+    def indices(file_list):
+      # returns the indices of the given files in the file table, adding new files to the table
+      result = []
+      for file in file_list:
+        if file.id not in file_indices:
+          file_indices[file.id] = len(files)
+          files.append((file.id, file.client_id, file.path))
+        result.append(file_indices[file.id])
+      return numpy.array(result, numpy.int32)
+
+    file_sets = []
+    def set_indices(file_set_list):
+      # stores the given file sets and returns their indices
+      first = len(file_sets)
+      file_sets.extend([(file_set.id, file_set.client_id, file_set.path, indices(file_set.files)) for file_set in file_set_list])
+      return numpy.arange(first, len(file_sets), dtype = numpy.int32)
+
+    original_protocol = database.protocol
+    snapshot_protocols = {}
+    try:
+      for protocol in protocols:
+        database.protocol = protocol
+        uses_file_sets = database.uses_probe_file_sets()
+        section = {
+            'uses_probe_file_sets' : uses_file_sets,
+            'all_files' : indices(database.all_files()),
+            'training_files' : dict((step, indices(database.training_files(step))) for step in DatabaseSnapshot.TRAINING_STEPS),
+            'model_ids' : {},
+            'client_ids' : {},
+            'enroll_files' : {},
+            'probe_files' : {},
+            't_model_ids' : {},
+            't_enroll_files' : {},
+            'z_probe_files' : {}
+        }
+        for group in groups:
+          model_ids = database.model_ids(group)
+          section['model_ids'][group] = model_ids
+          probes = database.probe_file_sets if uses_file_sets else database.probe_files
+          probe_indices = set_indices if uses_file_sets else indices
+          section['probe_files'][(group, None)] = probe_indices(probes(group = group))
+          for model_id in model_ids:
+            section['client_ids'][model_id] = database.client_id_from_model_id(model_id)
+            section['enroll_files'][(group, model_id)] = indices(database.enroll_files(model_id, group))
+            section['probe_files'][(group, model_id)] = probe_indices(probes(model_id = model_id, group = group))
+
+          if isinstance(database, DatabaseZT):
+            t_model_ids = database.t_model_ids(group)
+            section['t_model_ids'][group] = t_model_ids
+            for model_id in t_model_ids:
+              section['client_ids'][model_id] = database.client_id_from_model_id(model_id)
+              section['t_enroll_files'][(group, model_id)] = indices(database.t_enroll_files(model_id, group))
+            section['z_probe_files'][group] = set_indices(database.z_probe_file_sets(group = group)) if uses_file_sets else indices(database.z_probe_files(group = group))
+
+        snapshot_protocols[protocol] = section
+    finally:
+      database.protocol = original_protocol
+
+    # annotations that are stored inside the database are stored in the snapshot as well
+    annotations = None
+    if getattr(database, 'has_internal_annotations', False):
+      annotations = dict((file_id, database.annotations(File(file_id, client_id, path))) for (file_id, client_id, path) in files)
+
+    snapshot = {
+        'source' : source,
+        'parameters' : {
+            'name' : database.name,
+            'original_directory' : database.original_directory,
+            'original_extension' : database.original_extension,
+            'annotation_directory' : database.annotation_directory,
+            'annotation_extension' : database.annotation_extension,
+            'annotation_type' : database.annotation_type,
+            'annotation_cache' : database.annotation_cache,
+            'protocol' : original_protocol
+        },
+        'files' : files,
+        'file_sets' : file_sets,
+        'annotations' : annotations,
+        'protocols' : snapshot_protocols
+    }
+
+    # write the snapshot to a temporary file first, so that concurrent jobs never read an incomplete snapshot
+    directory = os.path.dirname(os.path.abspath(snapshot_file))
+    utils.ensure_dir(directory)
+    handle, temp_file = tempfile.mkstemp(dir = directory, prefix = '.snapshot_')
+    try:
+      with os.fdopen(handle, 'wb') as f:
+        cPickle.dump(snapshot, f, cPickle.HIGHEST_PROTOCOL)
+      os.rename(temp_file, snapshot_file)
+    except:
+      if os.path.exists(temp_file):
+        os.remove(temp_file)
+      raise
+
+
+  ###########################################################################
+  ### Access to the file lists of the snapshot
+  ###########################################################################
+
+  def __files__(self, indices):
+    return [self.m_files[i] for i in indices]
+
+
+  def __file_sets__(self, indices):
+    return [self.m_file_sets[i] for i in indices]
+
+
+  def __section__(self):
+    """Returns the file lists for the current protocol"""
+    if self.protocol not in self.m_protocols:
+      raise ValueError("The protocol '%s' is not stored in the database snapshot '%s', which contains the protocols %s" % (self.protocol, self.snapshot_file, sorted(self.m_protocols.keys())))
+    return self.m_protocols[self.protocol]
+
+
+  def __lookup__(self, entry, key):
+    """Returns the entry of the current protocol for the given key"""
+    section = self.__section__()
+    if key not in section[entry]:
+      raise ValueError("The database snapshot '%s' does not contain the %s for %s in protocol '%s'" % (self.snapshot_file, entry.replace('_', ' '), key, self.protocol))
+    return section[entry][key]
+
+
+  def uses_probe_file_sets(self):
+    """Defines if, for the current protocol, the database uses several probe files to generate a score."""
+    return self.__section__()['uses_probe_file_sets']
+
+
+  def all_files(self):
+    """Returns all File objects of the database for the current protocol."""
+    return self.__files__(self.__section__()['all_files'])
+
+
+  def training_files(self, step = None, arrange_by_client = False):
+    """Returns all training File objects of the database for the current protocol."""
+    if step not in DatabaseSnapshot.TRAINING_STEPS:
+      raise ValueError("The given step '%s' must be one of ('train_extractor', 'train_projector', 'train_enroller')" % step)
+    files = self.__files__(self.__lookup__('training_files', step))
+    if arrange_by_client:
+      return self.arrange_by_client(files)
+    else:
+      return files
+
+
+  def model_ids(self, group = 'dev'):
+    """Returns the model ids for the given group and the current protocol."""
+    return list(self.__lookup__('model_ids', group))
+
+
+  def client_id_from_model_id(self, model_id):
+    """Returns the client id for the given model id."""
+    return self.__lookup__('client_ids', model_id)
+
+
+  def enroll_files(self, model_id, group = 'dev'):
+    """Returns the list of enrollment File objects for the given model id."""
+    return self.__files__(self.__lookup__('enroll_files', (group, model_id)))
+
+
+  def probe_files(self, model_id = None, group = 'dev'):
+    """Returns the list of probe File objects (for the given model id, if given)."""
+    return self.__files__(self.__lookup__('probe_files', (group, model_id)))
+
+
+  def probe_file_sets(self, model_id = None, group = 'dev'):
+    """Returns the list of probe FileSet objects (for the given model id, if given)."""
+    return self.__file_sets__(self.__lookup__('probe_files', (group, model_id)))
+
+
+  def t_model_ids(self, group = 'dev'):
+    """Returns the T-Norm model ids for the given group and the current protocol."""
+    return list(self.__lookup__('t_model_ids', group))
+
+
+  def t_enroll_files(self, model_id, group = 'dev'):
+    """Returns the list of enrollment File objects for the given T-Norm model id."""
+    return self.__files__(self.__lookup__('t_enroll_files', (group, model_id)))
+
+
+  def z_probe_files(self, group = 'dev'):
+    """Returns the list of Z-probe File objects."""
+    return self.__files__(self.__lookup__('z_probe_files', group))
+
+
+  def z_probe_file_sets(self, group = 'dev'):
+    """Returns the list of Z-probe FileSet objects."""
+    return self.__file_sets__(self.__lookup__('z_probe_files', group))
+
+
+  def annotations(self, file):
+    """Returns the annotations for the given File object, if available."""
+    if self.m_annotations is not None:
+      return self.m_annotations.get(file.id)
+    # call base class implementation
+    return Database.annotations(self, file)
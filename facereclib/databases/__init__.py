@@ -6,3 +6,4 @@
 
 from Database import File, FileSet, Database, DatabaseZT
 from DatabaseXBob import DatabaseXBob, DatabaseXBobZT
+from DatabaseSnapshot import DatabaseSnapshot
@@ -6,7 +6,6 @@
 
 import numpy
 import math
-import bob
 from .. import utils
 
 from .Extractor import Extractor
@@ -21,7 +20,8 @@ class DCTBlocks (Extractor):
       number_of_dct_coefficients = 45,
       normalize_blocks = True,
       normalize_dcts = True,
-      auto_reduce_coefficients = False
+      auto_reduce_coefficients = False,
+      batch_size = 16     # number of images that are transformed at once by extract_batch
   ):
 
     # call base class constructor
@@ -33,7 +33,8 @@ class DCTBlocks (Extractor):
         number_of_dct_coefficients = number_of_dct_coefficients,
         normalize_blocks = normalize_blocks,
         normalize_dcts = normalize_dcts,
-        auto_reduce_coefficients = auto_reduce_coefficients
+        auto_reduce_coefficients = auto_reduce_coefficients,
+        batch_size = batch_size
     )
 
     # block parameters
@@ -49,15 +50,85 @@ class DCTBlocks (Extractor):
         self.m_number_of_dct_coefficients = self.m_block_size[0] * self.m_block_size[1] - 1
       else:
         raise ValueError("You selected more coefficients %d than your blocks have %d. This won't work. Please check your setup!"%(self.m_number_of_dct_coefficients, self.m_block_size[0] * self.m_block_size[1]))
+    self.m_block_size = tuple(self.m_block_size)
+    self.m_block_overlap = tuple(self.m_block_overlap)
+    self.m_batch_size = batch_size
+
+    # DCT basis matrices and zigzag indices, which compute the same features as bob.ip.DCTFeatures
+    self.m_basis = (self.__basis__(self.m_block_size[0]), self.__basis__(self.m_block_size[1]))
+    self.m_zigzag = self.__zigzag__()
+    if self.norm_block:
+      # as in bob.ip.DCTFeatures, the DC coefficient of normalized blocks (which is always zero) is dropped
+      self.m_zigzag = self.m_zigzag[1:]
+    self.m_epsilon = 10. * numpy.finfo(numpy.float64).eps
 
   def __call__(self, image):
     """Computes and returns DCT blocks for the given input image"""
+    return self.extract_batch(image[numpy.newaxis])[0]
+
+
+  def __basis__(self, size):
+    """Returns the orthonormal DCT-II matrix for blocks of the given size"""
+    k = numpy.arange(size)[:,numpy.newaxis]
+    basis = numpy.sqrt(2. / size) * numpy.cos(math.pi * (2. * numpy.arange(size)[numpy.newaxis,:] + 1.) * k / (2. * size))
+    basis[0] /= math.sqrt(2.)
+    return basis
+
+
+  def __zigzag__(self):
+    """Returns the flat block indices of the first DCT coefficients in the zigzag order of bob.ip.DCTFeatures (the first step goes to the right)"""
+    height, width = self.m_block_size
+    indices = []
+    for d in range(height + width - 1):
+      rows = range(max(0, d - width + 1), min(d, height - 1) + 1)
+      for y in (rows if d % 2 else rows[::-1]):
+        indices.append(y * width + d - y)
+    return numpy.array(indices[:self.m_number_of_dct_coefficients])
+
+
+  def __blocks__(self, images):
+    """Returns a strided view of shape (images, blocks in y, blocks in x, block height, block width) onto the given stack of images"""
+    shape = images.shape[1:]
+    steps = (self.m_block_size[0] - self.m_block_overlap[0], self.m_block_size[1] - self.m_block_overlap[1])
+    counts = ((shape[0] - self.m_block_overlap[0]) // steps[0], (shape[1] - self.m_block_overlap[1]) // steps[1])
+    return numpy.lib.stride_tricks.as_strided(
+        images,
+        shape = (images.shape[0],) + counts + self.m_block_size,
+        strides = (images.strides[0], images.strides[1] * steps[0], images.strides[2] * steps[1], images.strides[1], images.strides[2])
+    )
 
-    # Initializes cropper and destination array
-    extractor = bob.ip.DCTFeatures(self.m_block_size[0], self.m_block_size[1], self.m_block_overlap[0], self.m_block_overlap[1], self.m_number_of_dct_coefficients, self.norm_block, self.norm_dct)
 
-    # Computes DCT features
-    return extractor(image)
+  def extract_batch(self, images):
+    """Computes the DCT blocks for a stack (or a list) of images of identical size at once.
+    Returns an array of shape (images, blocks, coefficients), where each entry is identical to the features of a single image."""
+    images = numpy.ascontiguousarray(images, numpy.float64)
+    if images.ndim != 3:
+      raise ValueError("The DCT block extraction requires a stack of 2D images, but the given data has shape %s" % str(images.shape))
+    view = self.__blocks__(images)
+    block_count = view.shape[1] * view.shape[2]
+    # the buffer for the normalized blocks is allocated per call, so that single images need only the memory of their own blocks
+    buffer = numpy.ndarray((min(self.m_batch_size, len(images)),) + view.shape[1:], numpy.float64)
+    features = numpy.ndarray((len(images), block_count, len(self.m_zigzag)), numpy.float64)
+    for first in range(0, len(images), self.m_batch_size):
+      blocks = buffer[:min(self.m_batch_size, len(images) - first)]
+      blocks[:] = view[first : first + len(blocks)]
+      if self.norm_block:
+        # normalize each block to zero mean and unit variance
+        blocks -= numpy.mean(blocks, axis=(3,4), keepdims=True)
+        std = numpy.sqrt(numpy.mean(blocks ** 2, axis=(3,4), keepdims=True))
+        std[std < self.m_epsilon] = 1.
+        blocks /= std
+      # separable 2D DCT: D_y * block * D_x^T
+      dcts = numpy.matmul(numpy.matmul(self.m_basis[0], blocks), self.m_basis[1].T)
+      coefficients = dcts.reshape(len(blocks), block_count, -1)[:,:,self.m_zigzag]
+      if self.norm_dct:
+        # normalize each coefficient over all blocks of the image
+        coefficients -= numpy.mean(coefficients, axis=1, keepdims=True)
+        std = numpy.sqrt(numpy.mean(coefficients ** 2, axis=1, keepdims=True))
+        std[std < self.m_epsilon] = 1.
+        coefficients /= std
+      features[first : first + len(blocks)] = coefficients
+    return features
 
 
 class DCTBlocksVideo(DCTBlocks):
@@ -65,6 +136,13 @@ class DCTBlocksVideo(DCTBlocks):
   def __init__(self, **kwargs):
     # call base class constructor with its required parameters
     DCTBlocks.__init__(self, **kwargs)
+    # the frames from which features are extracted (None = all frames)
+    self.m_frame_selector = None
+
+
+  def select_frames(self, frame_selector):
+    """Restricts the feature extraction to the frames that are selected by the given frame selector, see :py:meth:`facereclib.tools.UBMGMMVideo.frame_selector`"""
+    self.m_frame_selector = frame_selector
 
 
   def read_feature(self, filename):
@@ -75,10 +153,25 @@ class DCTBlocksVideo(DCTBlocks):
   def __call__(self, frame_container):
     """Returns local DCT features computed from each frame in the input video.FrameContainer"""
 
+    if self.m_frame_selector is not None:
+      frame_container = frame_container.subset(self.m_frame_selector.indices(frame_container))
+    frames = list(frame_container.frames())
     output_frame_container = utils.video.FrameContainer()
-    for (frame_id, image, quality) in frame_container.frames():
-      frame_dcts = DCTBlocks._dct_features(self,image)
-      output_frame_container.add_frame(frame_id,frame_dcts,quality)
+    if not frames:
+      return output_frame_container
+
+    images = [image for (frame_id, image, quality) in frames]
+    # frames of the same size are processed as one stack
+    shapes = {}
+    for index, image in enumerate(images):
+      shapes.setdefault(image.shape, []).append(index)
+    frame_dcts = [None] * len(images)
+    for indices in shapes.values():
+      for index, dcts in zip(indices, self.extract_batch([images[index] for index in indices])):
+        frame_dcts[index] = dcts
+
+    for (frame_id, image, quality), dcts in zip(frames, frame_dcts):
+      output_frame_container.add_frame(frame_id, dcts, quality)
 
     return output_frame_container
 
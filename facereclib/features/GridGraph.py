@@ -6,6 +6,7 @@ import bob
 import numpy
 import math
 from .Extractor import Extractor
+from .. import utils
 
 class GridGraph (Extractor):
   """Extracts grid graphs from the images"""
@@ -20,6 +21,7 @@ class GridGraph (Extractor):
       gabor_frequency_step = math.sqrt(.5),
       gabor_power_of_k = 0,
       gabor_dc_free = True,
+      gabor_cache_directory = None, # if given, the Gabor wavelet transforms of the images are stored in this directory
 
       # what kind of information to extract
       normalize_gabor_jets = True,
@@ -49,6 +51,7 @@ class GridGraph (Extractor):
         gabor_frequency_step = gabor_frequency_step,
         gabor_power_of_k = gabor_power_of_k,
         gabor_dc_free = gabor_dc_free,
+        gabor_cache_directory = gabor_cache_directory,
         normalize_gabor_jets = normalize_gabor_jets,
         extract_gabor_phases = extract_gabor_phases,
         eyes = eyes,
@@ -62,16 +65,18 @@ class GridGraph (Extractor):
     )
     # TODO: write my own __str__ function instead of reporting all parameters, even if they are not used
 
-    # create Gabor wavelet transform class
-    self.m_gwt = bob.ip.GaborWaveletTransform(
-        number_of_scales = gabor_scales,
-        number_of_angles = gabor_directions,
-        sigma = gabor_sigma,
-        k_max = gabor_maximum_frequency,
-        k_fac = gabor_frequency_step,
-        pow_of_k = gabor_power_of_k,
-        dc_free = gabor_dc_free
+    # get the Gabor wavelet transform, which is shared with all other extractors using the same parameters
+    self.m_gabor = utils.gabor.gabor_transform(
+        gabor_directions = gabor_directions,
+        gabor_scales = gabor_scales,
+        gabor_sigma = gabor_sigma,
+        gabor_maximum_frequency = gabor_maximum_frequency,
+        gabor_frequency_step = gabor_frequency_step,
+        gabor_power_of_k = gabor_power_of_k,
+        gabor_dc_free = gabor_dc_free,
+        cache_directory = gabor_cache_directory
     )
+    self.m_gwt = self.m_gabor.gwt()
 
     # create graph extractor
     if eyes is not None:
@@ -103,7 +108,6 @@ class GridGraph (Extractor):
           step = node_distance
       )
 
-    self.m_jet_image = None
     self.m_normalize_jets = normalize_gabor_jets
     if isinstance(extract_gabor_phases, bool):
       self.m_extract_phases = extract_gabor_phases
@@ -112,40 +116,51 @@ class GridGraph (Extractor):
       self.m_extract_phases = extract_gabor_phases == 'inline'
       self.m_inline_phases = self.m_extract_phases
 
-    # preallocate memory for the face graph
+    # the shape of a single face graph; the inline phase layout is a reshaped view of it
     if self.m_extract_phases:
-      self.m_face_graph = numpy.ndarray((self.m_graph_machine.number_of_nodes, 2, self.m_gwt.number_of_kernels), 'float64')
-      if self.m_inline_phases:
-        self.m_reshaped_graph = numpy.ndarray((self.m_graph_machine.number_of_nodes, 2 * self.m_gwt.number_of_kernels), 'float64')
+      self.m_graph_shape = (self.m_graph_machine.number_of_nodes, 2, self.m_gwt.number_of_kernels)
     else:
-      self.m_face_graph = numpy.ndarray((self.m_graph_machine.number_of_nodes, self.m_gwt.number_of_kernels), 'float64')
+      self.m_graph_shape = (self.m_graph_machine.number_of_nodes, self.m_gwt.number_of_kernels)
 
 
-  def __call__(self, image):
-    if self.m_jet_image == None or self.m_jet_image.shape[0:1] != image.shape:
-      # create jet image
-      self.m_jet_image = self.m_gwt.empty_jet_image(image, self.m_extract_phases)
+  def __normalize__(self, graphs):
+    """Normalizes the absolute values of all Gabor jets in the given array of graphs (in the last dimensions) to unit length, in place"""
+    absolute = graphs[...,0,:] if self.m_extract_phases else graphs
+    norms = numpy.sqrt(numpy.sum(absolute ** 2, axis=-1))
+    # jets without any response are left untouched
+    norms[norms == 0.] = 1.
+    absolute /= norms[...,numpy.newaxis]
+
+
+  def __arrange__(self, graphs):
+    """Returns the graphs in the desired layout; the inline phase layout concatenates the absolute values and the phases of each node"""
+    if self.m_inline_phases:
+      return graphs.reshape(graphs.shape[:-2] + (2 * self.m_gwt.number_of_kernels,))
+    return graphs
 
-    # compute jets (Do not normalize the Gabor jets of the whole image)
-    self.m_gwt.compute_jets(image, self.m_jet_image, False)
-    # extract face graph
-    self.m_graph_machine(self.m_jet_image, self.m_face_graph)
+
+  def __call__(self, image):
+    """Extracts the (normalized) Gabor graph of the given image; a newly allocated array is returned for each image"""
+    face_graph = numpy.ndarray(self.m_graph_shape, numpy.float64)
+    # extract face graph from the jets of the image (Do not normalize the Gabor jets of the whole image)
+    self.m_graph_machine(self.m_gabor.jet_image(image, self.m_extract_phases), face_graph)
 
     # normalize the Gabor jets of the graph only
     if self.m_normalize_jets:
-      for n in range(self.m_face_graph.shape[0]):
-        if self.m_extract_phases:
-          bob.ip.normalize_gabor_jet(self.m_face_graph[n,:,:])
-        else:
-          bob.ip.normalize_gabor_jet(self.m_face_graph[n,:])
+      self.__normalize__(face_graph)
 
-    if self.m_inline_phases:
-      # reshape Gabor jets of the graph, if desired
-      for i in range(self.m_graph_machine.number_of_nodes):
-        self.m_reshaped_graph[i,:] = self.m_face_graph[i].flatten()
-      return self.m_reshaped_graph
+    return self.__arrange__(face_graph)
 
-    else:
-      # return the extracted face graph
-      return self.m_face_graph
 
+  def extract_batch(self, images):
+    """Extracts the Gabor graphs of several images with identical resolution at once.
+    Returns an array of graphs, where the first dimension corresponds to the given images."""
+    face_graphs = numpy.ndarray((len(images),) + self.m_graph_shape, numpy.float64)
+    for i, image in enumerate(images):
+      self.m_graph_machine(self.m_gabor.jet_image(image, self.m_extract_phases), face_graphs[i])
+
+    # normalize the Gabor jets of all graphs at once
+    if self.m_normalize_jets:
+      self.__normalize__(face_graphs)
+
+    return self.__arrange__(face_graphs)
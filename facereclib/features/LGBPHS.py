@@ -25,6 +25,7 @@ class LGBPHS (Extractor):
       gabor_frequency_step = math.sqrt(.5),
       gabor_power_of_k = 0,
       gabor_dc_free = True,
+      gabor_cache_directory = None, # if given, the Gabor wavelet transforms of the images are stored in this directory
       use_gabor_phases = False,
       # LBP parameters
       lbp_radius = 2,
@@ -53,6 +54,7 @@ class LGBPHS (Extractor):
         gabor_frequency_step = gabor_frequency_step,
         gabor_power_of_k = gabor_power_of_k,
         gabor_dc_free = gabor_dc_free,
+        gabor_cache_directory = gabor_cache_directory,
         use_gabor_phases = use_gabor_phases,
         lbp_radius = lbp_radius,
         lbp_neighbor_count = lbp_neighbor_count,
@@ -71,17 +73,19 @@ class LGBPHS (Extractor):
     if self.m_block_size[0] < self.m_block_overlap[0] or self.m_block_size[1] < self.m_block_overlap[1]:
       raise ValueError("The overlap is bigger than the block size. This won't work. Please check your setup!")
 
-    # Gabor wavelet transform class
-    self.m_gwt = bob.ip.GaborWaveletTransform(
-        number_of_scales = gabor_scales,
-        number_of_angles = gabor_directions,
-        sigma = gabor_sigma,
-        k_max = gabor_maximum_frequency,
-        k_fac = gabor_frequency_step,
-        pow_of_k = gabor_power_of_k,
-        dc_free = gabor_dc_free
+    # Gabor wavelet transform, which is shared with all other extractors using the same parameters
+    self.m_gabor = utils.gabor.gabor_transform(
+        gabor_directions = gabor_directions,
+        gabor_scales = gabor_scales,
+        gabor_sigma = gabor_sigma,
+        gabor_maximum_frequency = gabor_maximum_frequency,
+        gabor_frequency_step = gabor_frequency_step,
+        gabor_power_of_k = gabor_power_of_k,
+        gabor_dc_free = gabor_dc_free,
+        cache_directory = gabor_cache_directory
     )
-    self.m_trafo_image = None
+    self.m_gwt = self.m_gabor.gwt()
+    self.m_abs_image = None
     self.m_use_phases = use_gabor_phases
 
 
@@ -111,75 +115,50 @@ class LGBPHS (Extractor):
       raise ValueError("Sparse histograms cannot be split! Check your setup!")
 
 
-  def __fill__(self, lgbphs_array, lgbphs_blocks, j):
-    """Copies the given array into the given blocks"""
-    # fill array in the desired shape
+  def __arrange__(self, histograms):
+    """Arranges the histograms of shape (kernels, blocks, bins) in the desired split layout; reshaping does not copy the data (except for the 'blocks' split)"""
+    jet_length, n_blocks, n_bins = histograms.shape
     if self.m_split == None:
-      start = j * self.m_n_bins * self.m_n_blocks
-      for b in range(self.m_n_blocks):
-        lgbphs_array[start + b * self.m_n_bins : start + (b+1) * self.m_n_bins] = lgbphs_blocks[b][:]
+      return histograms.reshape((jet_length * n_blocks * n_bins,))
     elif self.m_split == 'blocks':
-      for b in range(self.m_n_blocks):
-        lgbphs_array[b, j * self.m_n_bins : (j+1) * self.m_n_bins] = lgbphs_blocks[b][:]
+      return histograms.transpose((1,0,2)).reshape((n_blocks, jet_length * n_bins))
     elif self.m_split == 'wavelets':
-      for b in range(self.m_n_blocks):
-        lgbphs_array[j, b * self.m_n_bins : (b+1) * self.m_n_bins] = lgbphs_blocks[b][:]
+      return histograms.reshape((jet_length, n_blocks * n_bins))
     elif self.m_split == 'both':
-      for b in range(self.m_n_blocks):
-        lgbphs_array[j * self.m_n_blocks + b, 0 : self.m_n_bins] = lgbphs_blocks[b][:]
+      return histograms.reshape((jet_length * n_blocks, n_bins))
+    else:
+      raise ValueError("The split parameter must be one of ['blocks', 'wavelets', 'both'] or None")
 
   def __call__(self, image):
     """Extracts the local Gabor binary pattern histogram sequence from the given image"""
-    # perform GWT on image
-    if self.m_trafo_image is None or self.m_trafo_image.shape[1:2] != image.shape:
-      # create trafo image
-      self.m_trafo_image = self.m_gwt.empty_trafo_image(image)
-
-    # convert image to complex
-    image = image.astype(numpy.complex128)
-    self.m_gwt(image, self.m_trafo_image)
-
-    jet_length = self.m_gwt.number_of_kernels * (2 if self.m_use_phases else 1)
-
-    lgbphs_array = None
-    # iterate through the layers of the trafo image
-    for j in range(self.m_gwt.number_of_kernels):
-      # compute absolute part of complex response
-      abs_image = numpy.abs(self.m_trafo_image[j])
+    # perform GWT on image; the transform might have been computed already by another Gabor extractor
+    trafo_image = self.m_gabor.trafo_image(image)
+    if self.m_abs_image is None or self.m_abs_image.shape != trafo_image.shape:
+      # create the buffers for the absolute values and phases of the transform
+      self.m_abs_image = numpy.ndarray(trafo_image.shape, numpy.float64)
+      self.m_phase_image = numpy.ndarray(trafo_image.shape, numpy.float64) if self.m_use_phases else None
+
+    # compute the absolute values (and phases) of all kernel responses at once
+    numpy.abs(trafo_image, self.m_abs_image)
+    layers = list(self.m_abs_image)
+    if self.m_use_phases:
+      # same as numpy.angle, but without allocating a new array
+      numpy.arctan2(trafo_image.imag, trafo_image.real, self.m_phase_image)
+      # the phases are stored after all absolute values
+      layers.extend(self.m_phase_image)
+
+    histograms = None
+    for j, layer in enumerate(layers):
       # Computes LBP histograms
-      abs_blocks = self.m_lgbphs_extractor(abs_image)
-
-      # Converts to Blitz array (of different dimensionalities)
-      self.m_n_bins = self.m_lgbphs_extractor.n_bins
-      self.m_n_blocks = len(abs_blocks)
-
-      if self.m_split == None:
-        shape = (self.m_n_blocks * self.m_n_bins * jet_length,)
-      elif self.m_split == 'blocks':
-        shape = (self.m_n_blocks, self.m_n_bins * jet_length)
-      elif self.m_split == 'wavelets':
-        shape = (jet_length, self.m_n_bins * self.m_n_blocks)
-      elif self.m_split == 'both':
-        shape = (jet_length * self.m_n_blocks, self.m_n_bins)
-      else:
-        raise ValueError("The split parameter must be one of ['blocks', 'wavelets', 'both'] or None")
-
-      # create new array if not done yet
-      if lgbphs_array == None:
-        lgbphs_array = numpy.ndarray(shape, 'float64')
-
-      # fill the array with the absolute values of the Gabor wavelet transform
-      self.__fill__(lgbphs_array, abs_blocks, j)
-
-      if self.m_use_phases:
-        # compute phase part of complex response
-        phase_image = numpy.angle(self.m_trafo_image[j])
-        # Computes LBP histograms
-        phase_blocks = self.m_lgbphs_extractor(phase_image)
-        # fill the array with the phases at the end of the blocks
-        self.__fill__(lgbphs_array, phase_blocks, j + self.m_gwt.number_of_kernels)
+      blocks = self.m_lgbphs_extractor(layer)
+      if histograms is None:
+        # the output is allocated once, when the number of blocks and bins is known
+        self.m_n_bins = self.m_lgbphs_extractor.n_bins
+        self.m_n_blocks = len(blocks)
+        histograms = numpy.ndarray((len(layers), self.m_n_blocks, self.m_n_bins), numpy.float64)
+      histograms[j] = blocks
 
+    lgbphs_array = self.__arrange__(histograms)
 
     # return the concatenated list of all histograms
     return utils.histogram.sparsify(lgbphs_array) if self.m_sparse else lgbphs_array
-
@@ -4,11 +4,21 @@
 
 """Features for face recognition"""
 
-from Extractor import Extractor
-from Linearize import Linearize
-from DCT import DCTBlocks, DCTBlocksVideo
-from LGBPHS import LGBPHS
-from GridGraph import GridGraph
-from Eigenface import Eigenface
-from SIFTKeypoints import SIFTKeypoints
-from SIFTBobKeypoints import SIFTBobKeypoints
+import sys
+from ..utils.lazy import LazyModule
+
+# the classes are imported from their modules only when they are used, which keeps the start-up of the scripts fast
+sys.modules[__name__] = LazyModule(
+    sys.modules[__name__],
+    {
+        'Extractor' : 'Extractor',
+        'Linearize' : 'Linearize',
+        'DCTBlocks' : 'DCT',
+        'DCTBlocksVideo' : 'DCT',
+        'LGBPHS' : 'LGBPHS',
+        'GridGraph' : 'GridGraph',
+        'Eigenface' : 'Eigenface',
+        'SIFTKeypoints' : 'SIFTKeypoints',
+        'SIFTBobKeypoints' : 'SIFTBobKeypoints'
+    }
+)
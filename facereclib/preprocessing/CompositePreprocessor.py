@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+from .. import utils
+from .Preprocessor import Preprocessor
+
+class CompositePreprocessor (Preprocessor):
+  """Applies several photometric normalizations to each original image, which is read and cropped only once.
+  Normalizations with identical face cropping parameters share the cropped image.
+  The result of each normalization is written to its own sub-directory of the preprocessed directory, see :py:meth:`facereclib.toolchain.ToolChain.preprocess_data`."""
+
+  def __init__(self, normalizations):
+    """Parameters of the constructor of this preprocessor:
+
+    normalizations
+      A dictionary (or a list of pairs) of output names and :py:class:`facereclib.preprocessing.FaceCrop` derived preprocessors.
+      The output names are used as the sub-directories of the preprocessed data.
+    """
+    normalizations = sorted(normalizations.items()) if isinstance(normalizations, dict) else list(normalizations)
+
+    # call base class constructor
+    Preprocessor.__init__(self, normalizations = "{%s}" % ", ".join(["%s: %s" % (name, preprocessor) for name, preprocessor in normalizations]))
+
+    self.output_names = [name for name, preprocessor in normalizations]
+    if len(set(self.output_names)) != len(self.output_names):
+      raise ValueError("The output names '%s' of the composite preprocessor are not unique" % self.output_names)
+
+    # group the normalizations by their face cropping; the first preprocessor of each group performs the cropping
+    self.m_groups = []
+    crop_parameters = {}
+    for name, preprocessor in normalizations:
+      key = preprocessor.crop_parameters()
+      if key not in crop_parameters:
+        crop_parameters[key] = len(self.m_groups)
+        self.m_groups.append((preprocessor, []))
+      self.m_groups[crop_parameters[key]][1].append((name, preprocessor))
+    utils.debug("The composite preprocessor crops each image %d time(s) for %d normalization(s)" % (len(self.m_groups), len(normalizations)))
+
+
+  def __call__(self, image, annotations = None):
+    """Crops the given image once for each set of face cropping parameters and applies all normalizations.
+    Returns a dictionary from output name to preprocessed image."""
+    preprocessed = {}
+    for cropper, normalizations in self.m_groups:
+      cropped_image = cropper.crop_face(image, annotations)
+      mask = cropper.crop_mask(annotations)
+      for name, preprocessor in normalizations:
+        preprocessed[name] = preprocessor.normalize(cropped_image, mask)
+    return preprocessed
+
+
+  def read_original_data(self, original_file_name):
+    """Reads the original data using the first of the normalizations"""
+    return self.m_groups[0][0].read_original_data(original_file_name)
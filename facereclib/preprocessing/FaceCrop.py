@@ -173,6 +173,30 @@ class FaceCrop (Preprocessor):
     return self.m_cropped_image
 
 
+  def crop_mask(self, annotations):
+    """Returns the mask of the latest cropped image, if the face was cropped according to the given annotations, otherwise None"""
+    return self.m_cropped_mask if self.m_perform_image_cropping and annotations != None else None
+
+
+  def crop_parameters(self):
+    """Returns the parameters of the face cropping; preprocessors with identical parameters produce identical cropped images"""
+    return (
+        tuple(self.m_cropped_image_size) if self.m_cropped_image_size is not None else None,
+        tuple(sorted(self.m_cropped_positions.items())) if self.m_cropped_positions is not None else None,
+        tuple(sorted(self.m_fixed_postions.items())) if self.m_fixed_postions else None,
+        self.m_color_channel,
+        self.m_offset,
+        tuple(self.m_supported_annotations)
+    )
+
+
+  def normalize(self, image, mask = None):
+    """Applies the photometric normalization of this preprocessor to the given cropped image and returns the result.
+    If a mask is given, the pixels that were masked during face cropping are set to 0.
+    In this base class implementation, no normalization is performed."""
+    return image
+
+
   def __call__(self, image, annotations = None):
     """Reads the input image, normalizes it according to the eye positions, and writes the resulting image"""
-    return self.crop_face(image, annotations)
+    return self.normalize(self.crop_face(image, annotations), self.crop_mask(annotations))
@@ -49,19 +49,12 @@ class HistogramEqualization (FaceCrop):
     return self.m_histogram_image
 
 
-  def __call__(self, image, annotations = None):
-    """Reads the input image, normalizes it according to the eye positions, performs histogram equalization, and writes the resulting image"""
-    # crop the face using the base class method
-
-    image = self.crop_face(image, annotations)
-
-    # perform histogram equalization
+  def normalize(self, image, mask = None):
+    """Performs histogram equalization on the given cropped image"""
     histogram_image = self.equalize_histogram(image)
 
-    if self.m_perform_image_cropping and annotations != None:
+    if mask is not None:
       # set the positions that were masked during face cropping to 0
-      histogram_image[self.m_cropped_mask == False] = 0.
+      histogram_image[mask == False] = 0.
 
-    # save the image to file
     return histogram_image
-
@@ -84,19 +84,13 @@ class INormLBP (FaceCrop):
 
     return self.m_i_norm_image
 
-  def __call__(self, image, annotations = None):
-    """Reads the input image, normalizes it according to the eye positions, computes I-Norm-LBP's, and writes the resulting image"""
-    # crop the face using the base class method
-    image = self.crop_face(image, annotations)
-
-    # compute I-Norm-LBP image
+  def normalize(self, image, mask = None):
+    """Computes I-Norm-LBP's of the given cropped image"""
     i_norm_image = self.i_norm(image)
 
-    if self.m_perform_image_cropping and annotations != None:
+    if mask is not None:
       # set the positions that were masked during face cropping to 0; respect the size change of the two images!
       # I am not sure if 0 is the right value here...
-      i_norm_image[self.m_cropped_mask[self.m_radius:-self.m_radius, self.m_radius:-self.m_radius] == False] = 0
+      i_norm_image[mask[self.m_radius:-self.m_radius, self.m_radius:-self.m_radius] == False] = 0
 
-    # save the image to file
     return i_norm_image.astype(numpy.float64)
-
@@ -78,7 +78,7 @@ class Preprocessor:
     utils.ensure_dir(os.path.dirname(data_file))
     if hasattr(data, 'save'):
       # this is some class that supports saving itself
-      image.save(bob.io.HDF5File(data_file, "w"))
+      data.save(bob.io.HDF5File(data_file, "w"))
     else:
       bob.io.save(data, data_file)
 
@@ -51,17 +51,12 @@ class SelfQuotientImage (FaceCrop):
     return self.m_self_quotient_image
 
 
-  def __call__(self, image, annotations = None):
-    """Reads the input image, normalizes it according to the eye positions, computes the self quotient image, and writes the resulting image"""
-    # crop the face using the base class method
-    image = self.crop_face(image, annotations)
-
-    # compute self quotient image
+  def normalize(self, image, mask = None):
+    """Computes the self quotient image of the given cropped image"""
     self_quotient_image = self.self_quotient(image)
 
-    if self.m_perform_image_cropping and annotations != None:
+    if mask is not None:
       # set the positions that were masked during face cropping to 0
-      self_quotient_image[self.m_cropped_mask == False] = 0.
+      self_quotient_image[mask == False] = 0.
 
-    # save the image to file
     return self_quotient_image
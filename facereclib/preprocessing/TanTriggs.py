@@ -19,6 +19,7 @@
 
 import bob
 import numpy
+import multiprocessing.pool
 from .. import utils
 from .Preprocessor import Preprocessor
 from .FaceCrop import FaceCrop
@@ -82,19 +83,14 @@ class TanTriggs (FaceCrop):
     return self.m_tan_triggs_image
 
 
-  def __call__(self, image, annotations = None):
-    """Reads the input image, normalizes it according to the eye positions, performs Tan&Triggs normalization, and writes the resulting image"""
-    # crop the face using the base class method
-    image = self.crop_face(image, annotations)
-
-    # perform Tan&Triggs normalization
+  def normalize(self, image, mask = None):
+    """Performs Tan&Triggs normalization on the given cropped image"""
     tan_triggs_image = self.tan_triggs(image)
 
-    if self.m_perform_image_cropping and annotations != None:
+    if mask is not None:
       # set the positions that were masked during face cropping to 0
-      tan_triggs_image[self.m_cropped_mask == False] = 0.
+      tan_triggs_image[mask == False] = 0.
 
-    # save the image to file
     return tan_triggs_image
 
 
@@ -111,12 +107,30 @@ class TanTriggsVideo (Preprocessor):
      threshold = 10.,
      alpha = 0.1,
      color_channel = 'gray',
+     number_of_threads = 1
   ):
 
-    Preprocessor.__init__(self)
+    Preprocessor.__init__(
+        self,
+        gamma = gamma,
+        sigma0 = sigma0,
+        sigma1 = sigma1,
+        size = size,
+        threshold = threshold,
+        alpha = alpha,
+        color_channel = color_channel,
+        number_of_threads = number_of_threads
+    )
     self.m_color_channel = color_channel
-    # prepare image normalization
-    self.m_tan = bob.ip.TanTriggs(gamma, sigma0, sigma1, size, threshold, alpha)
+    # prepare image normalization; each thread uses its own normalizer
+    # Note: the threads only run concurrently if the bob.ip.TanTriggs binding releases the GIL, which the bindings of bob 1.x do not
+    self.m_tans = [bob.ip.TanTriggs(gamma, sigma0, sigma1, size, threshold, alpha) for thread in range(max(number_of_threads, 1))]
+    # the frames that are preprocessed (None = all frames)
+    self.m_frame_selector = None
+
+  def select_frames(self, frame_selector):
+    """Restricts the preprocessing to the frames that are selected by the given frame selector, see :py:meth:`facereclib.tools.UBMGMMVideo.frame_selector`"""
+    self.m_frame_selector = frame_selector
 
   def read_original_data(self, video_file):
     """Reads the original image (in this case a utils.FrameContainer) from the given file"""
@@ -124,18 +138,40 @@ class TanTriggsVideo (Preprocessor):
 
   def __call__(self, frame_container, annotations = None):
     """For each frame in the VideoFrameContainer (read from input_file) applies the Tan-Triggs algorithm, then writes the resulting VideoFrameContainer to output_file. NOTE: annotations is ignored even if specified."""
-    # Process each frame
-    output_frame_container = utils.video.FrameContainer()
-    for (frame_id, image, quality) in frame_container.frames():
-
-      # Convert to grayscale if it seems necessary
-      image = utils.gray_channel(image, self.m_color_channel)
+    if self.m_frame_selector is not None:
+      frame_container = frame_container.subset(self.m_frame_selector.indices(frame_container))
+    frames = list(frame_container.frames())
+    # Convert to grayscale if it seems necessary
+    images = [utils.gray_channel(image, self.m_color_channel) for (frame_id, image, quality) in frames]
+    tan_images = self.__allocate__(images)
+
+    # in a worker process, the number of threads is limited by the cores that are available for this job
+    threads = utils.work_queue.cores_for_job(len(self.m_tans))
+    def normalize(thread):
+      # each thread performs Tan-Triggs on every n'th frame
+      for index in range(thread, len(images), threads):
+        self.m_tans[thread](images[index], tan_images[index])
+
+    if threads > 1 and len(images) > 1:
+      pool = multiprocessing.pool.ThreadPool(threads)
+      try:
+        pool.map(normalize, range(threads))
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      normalize(0)
 
-      # Perform Tan-Triggs and store result
-      tan_image = numpy.ndarray(image.shape, numpy.float64)
-      self.m_tan(image, self.m_tan_image)
+    output_frame_container = utils.video.FrameContainer()
+    for (frame_id, image, quality), tan_image in zip(frames, tan_images):
       output_frame_container.add_frame(frame_id, tan_image, quality)
 
     return output_frame_container
 
+  def __allocate__(self, images):
+    """Allocates the resulting images; frames of identical size share a single stacked array"""
+    if images and all(image.shape == images[0].shape for image in images):
+      return list(numpy.ndarray((len(images),) + images[0].shape, numpy.float64))
+    return [numpy.ndarray(image.shape, numpy.float64) for image in images]
+
   read_data = read_original_data
@@ -4,13 +4,22 @@
 
 """Image preprocessing tools"""
 
-from Preprocessor import Preprocessor
-from NullPreprocessor import NullPreprocessor
-from FaceCrop import FaceCrop
-from TanTriggs import TanTriggs, TanTriggsVideo
-from HistogramEqualization import HistogramEqualization
-from SelfQuotientImage import SelfQuotientImage
-from INormLBP import INormLBP
-from Keypoints import Keypoints
-
+import sys
+from ..utils.lazy import LazyModule
 
+# the classes are imported from their modules only when they are used, which keeps the start-up of the scripts fast
+sys.modules[__name__] = LazyModule(
+    sys.modules[__name__],
+    {
+        'Preprocessor' : 'Preprocessor',
+        'NullPreprocessor' : 'NullPreprocessor',
+        'FaceCrop' : 'FaceCrop',
+        'TanTriggs' : 'TanTriggs',
+        'TanTriggsVideo' : 'TanTriggs',
+        'HistogramEqualization' : 'HistogramEqualization',
+        'SelfQuotientImage' : 'SelfQuotientImage',
+        'INormLBP' : 'INormLBP',
+        'Keypoints' : 'Keypoints',
+        'CompositePreprocessor' : 'CompositePreprocessor'
+    }
+)
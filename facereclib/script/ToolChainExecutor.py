@@ -2,7 +2,10 @@
 # vim: set fileencoding=utf-8 :
 # Manuel Guenther <Manuel.Guenther@idiap.ch>
 
-import os, sys, math
+import os, sys, math, time
+import subprocess
+import multiprocessing
+import shutil
 import argparse
 
 from .. import toolchain
@@ -42,6 +45,9 @@ class ToolChainExecutor:
   """This class is a helper class to provide functionality to execute tool chains.
   It manages the configuration files and the command line options, as well as the parallel execution of the tasks in the Idiap SGE grid."""
 
+  # whether the script of the executor can run worker processes (i.e., has the --worker option), see execute_worker
+  supports_workers = False
+
   def __init__(self, args):
     """Initializes the Tool chain executor."""
     # remember command line arguments
@@ -57,13 +63,34 @@ class ToolChainExecutor:
     use_local_files = True
     if args.grid:
       self.m_grid = utils.resources.load_resource(' '.join(args.grid), 'grid', imports = args.imports)
+      if self.m_grid.uses_workers() and not self.supports_workers:
+        raise ValueError("The grid type 'workers' is not supported by the %s; please use the 'local' or 'sge' grid instead" % self.__class__.__name__)
       use_local_files = self.m_grid.is_local()
 
     # generate configuration
     self.m_configuration = Configuration(args, self.m_database.name, use_local_files)
+    # the work unit that is currently executed by a worker process
+    self.m_work_unit = None
 
     utils.set_verbosity_level(args.verbose)
 
+  def select_frames(self, tools, consumers):
+    """Restricts the preprocessing and feature extraction of videos (by the given preprocessors and extractors) to the frames that are used by the given tools.
+    The frames are only restricted when all tools select frames of videos with selectors that support the restriction (see :py:func:`facereclib.utils.video.restricts_frames`).
+    Returns the name of the sub-directory for the files of the consumers that restrict their frames, or None if the frames are not restricted.
+    Scripts that call this function need to write the files of these consumers into this sub-directory, so that they are not reused with other frame selectors."""
+    frame_selector = None
+    if tools and all(hasattr(tool, 'frame_selector') for tool in tools):
+      frame_selectors = [tool.frame_selector() for tool in tools]
+      if all(utils.video.restricts_frames(selector) for selector in frame_selectors):
+        frame_selector = utils.video.UnionFrameSelector(frame_selectors)
+      else:
+        utils.info("The frames of the videos are not restricted, since not all frame selectors support it")
+    for consumer in consumers:
+      if hasattr(consumer, 'select_frames'):
+        consumer.select_frames(frame_selector)
+    return "frames-%s" % frame_selector if frame_selector is not None else None
+
   def write_info(self, command_line_parameters):
     # write configuration
     try:
@@ -202,7 +229,19 @@ class ToolChainExecutor:
     self.m_executable = os.path.join(self.m_bin_directory, os.path.basename(calling_file))
     self.m_jman = os.path.join(self.m_bin_directory, 'jman')
     # generate job manager and set the temp dir
-    if self.m_grid.grid_type == 'local':
+    if self.m_grid.uses_workers():
+      # the jobs are added to a new work queue, from which the workers pull them
+      self.m_work_queue = None
+      if not self.m_args.dry_run:
+        if os.path.isdir(self.work_queue_file()):
+          shutil.rmtree(self.work_queue_file())
+        elif os.path.exists(self.work_queue_file()):
+          os.remove(self.work_queue_file())
+        utils.ensure_dir(os.path.dirname(self.work_queue_file()))
+        self.m_work_queue = self.work_queue()
+      # the workers themselves might be submitted to the SGE grid
+      self.m_job_manager = gridtk.sge.JobManagerSGE(database = self.m_args.gridtk_database_file, wrapper_script = self.m_jman) if self.m_grid.worker_grid == 'sge' else None
+    elif self.m_grid.grid_type == 'local':
       self.m_job_manager = gridtk.local.JobManagerLocal(database = self.m_args.gridtk_database_file, wrapper_script = self.m_jman)
     elif self.m_grid.grid_type == 'sge':
       self.m_job_manager = gridtk.sge.JobManagerSGE(database = self.m_args.gridtk_database_file, wrapper_script = self.m_jman)
@@ -211,15 +250,52 @@ class ToolChainExecutor:
     self.m_logs_directory = os.path.join(temp_dir if temp_dir else self.m_configuration.temp_directory, "grid_tk_logs")
 
 
+  def work_queue_file(self):
+    """Returns the name of the file (or directory) of the work queue of this experiment."""
+    if self.m_grid.work_queue == 'filesystem':
+      return os.path.join(self.m_configuration.temp_directory, 'work_queue')
+    return os.path.join(self.m_configuration.temp_directory, 'work_queue.sql3')
+
+
+  def work_queue(self):
+    """Opens the work queue of this experiment."""
+    if self.m_grid.work_queue == 'filesystem':
+      return utils.work_queue.FileSystemWorkQueue(self.work_queue_file(), self.m_grid.lease_time)
+    elif self.m_grid.work_queue == 'sqlite':
+      return utils.work_queue.SQLiteWorkQueue(self.work_queue_file())
+    raise ValueError("The work queue type '%s' is not supported." % self.m_grid.work_queue)
+
+
   def _generate_job_array(self, list_to_split, number_of_files_per_job):
     """Generates an array for the list to be split and the number of files that one job should generate."""
     n_jobs = int(math.ceil(len(list_to_split) / float(number_of_files_per_job)))
     return (1,n_jobs,1)
 
 
+  def _generate_index_ranges(self, list_to_split, number_of_files_per_job, costs = None):
+    """Splits the list into the (first, last) index ranges of the jobs of the array.
+    If the estimated costs of the items are given, the ranges are balanced by their costs, keeping the number of jobs."""
+    n_jobs = self._generate_job_array(list_to_split, number_of_files_per_job)[1]
+    if costs is not None and self.m_grid.balance_jobs:
+      return utils.split_by_costs(costs, n_jobs)
+    return [(first, min(first + number_of_files_per_job, len(list_to_split))) for first in range(0, len(list_to_split), number_of_files_per_job)]
+
+
+  def file_size_costs(self, files):
+    """Returns the sizes of the given files as estimates of their processing costs.
+    Files that do not exist are assumed to have the average size of the existing files."""
+    sizes = [os.path.getsize(f) if os.path.exists(f) else None for f in files]
+    existing = [size for size in sizes if size is not None]
+    average = sum(existing) / float(len(existing)) if existing else 1.
+    return [size if size is not None else average for size in sizes]
+
+
   def indices(self, list_to_split, number_of_files_per_job):
     """This function returns the first and last index for the files for the current job ID.
        If no job id is set (e.g., because a sub-job is executed locally), it simply returns all indices."""
+    # a worker process executes the index range of its current work unit
+    if self.m_work_unit is not None:
+      return self.m_work_unit.indices if self.m_work_unit.indices is not None else (0, len(list_to_split))
     # test if the 'SEG_TASK_ID' environment is set
     sge_task_id = os.getenv('SGE_TASK_ID')
     if sge_task_id is None:
@@ -228,14 +304,19 @@ class ToolChainExecutor:
       return (0,len(list_to_split))
     else:
       job_id = int(sge_task_id) - 1
+      if getattr(self.m_args, 'job_ranges', None):
+        # the index ranges of the jobs were balanced during submission
+        with open(self.m_args.job_ranges) as f:
+          return tuple(int(index) for index in f.readlines()[job_id].split())
       # compute number of files to be executed
       start = job_id * number_of_files_per_job
       end = min((job_id + 1) * number_of_files_per_job, len(list_to_split))
       return (start, end)
 
 
-  def submit_grid_job(self, command, list_to_split = None, number_of_files_per_job = 1, dependencies=[], name = None, **kwargs):
-    """Submits a job to the grid."""
+  def submit_grid_job(self, command, list_to_split = None, number_of_files_per_job = 1, dependencies=[], name = None, costs = None, **kwargs):
+    """Submits a job to the grid.
+    When the estimated costs of the items of the list_to_split are given, the jobs of the array are balanced by these costs."""
 
     # create the command to be executed
     cmd = [
@@ -254,9 +335,21 @@ class ToolChainExecutor:
     # generate log directory
     logdir = os.path.join(self.m_logs_directory, log_sub_dir)
 
+    if self.m_grid.uses_workers():
+      # the job is added to the work queue, using the name of its log directory as unique stage name
+      return self.__add_to_work_queue__(log_sub_dir, command, list_to_split, number_of_files_per_job, dependencies, costs, kwargs.get('memfree'))
+
     # generate job array
     if list_to_split is not None:
       array = self._generate_job_array(list_to_split, number_of_files_per_job)
+      if costs is not None and self.m_grid.balance_jobs:
+        # the jobs read their balanced index ranges from file
+        job_ranges = os.path.join(self.m_configuration.temp_directory, 'job_ranges', log_sub_dir + '.txt')
+        if not self.m_args.dry_run:
+          utils.ensure_dir(os.path.dirname(job_ranges))
+          with open(job_ranges, 'w') as f:
+            f.writelines("%d %d\n" % index_range for index_range in self._generate_index_ranges(list_to_split, number_of_files_per_job, costs))
+        cmd += ['--job-ranges', job_ranges]
     else:
       array = None
 
@@ -282,13 +375,104 @@ class ToolChainExecutor:
       return self.m_fake_job_id
 
 
+  def __add_to_work_queue__(self, stage, command, list_to_split, number_of_files_per_job, dependencies, costs, memory):
+    """Adds the given job as a stage of work units to the work queue, and returns the name of the stage.
+    The work units of the stage require the given memory (the 'memfree' of the queue of the job)."""
+    index_ranges = None
+    if list_to_split is not None:
+      index_ranges = self._generate_index_ranges(list_to_split, number_of_files_per_job, costs)
+    if not self.m_args.dry_run:
+      self.m_work_queue.add_stage(stage, command, index_ranges, dependencies, utils.memory_in_bytes(memory))
+      utils.info("added: stage '%s' with %d work units and dependencies '%s'" % (stage, len(index_ranges) if index_ranges is not None else 1, dependencies))
+    else:
+      print 'would have added stage', stage, 'with', len(index_ranges) if index_ranges is not None else 1, 'work units as:', command, '\nwith dependencies', dependencies
+    return stage
+
+
   def grid_job_id(self):
     id = os.getenv('JOB_ID')
     if id is not None:
       return int(id)
     return id
 
+  def __worker_command__(self):
+    return [self.m_executable, '--worker'] + self.m_common_parameters
+
+
+  def submit_workers(self):
+    """Submits the worker processes as an array job to the SGE grid."""
+    if not self.m_args.dry_run:
+      job_id = self.m_job_manager.submit(
+          command_line = self.__worker_command__(),
+          name = 'worker',
+          array = (1, self.m_grid.number_of_parallel_processes, 1),
+          log_dir = os.path.join(self.m_logs_directory, 'worker'),
+          **self.m_grid.worker_queue
+      )
+      utils.info("submitted: %d workers with id '%d'" % (self.m_grid.number_of_parallel_processes, job_id))
+    else:
+      print 'would have submitted', self.m_grid.number_of_parallel_processes, 'workers as:', ' '.join(self.__worker_command__())
+
+
+  def __set_sub_task__(self, command):
+    """Sets the command line options of the given job command, e.g., 'enroll --group dev --model-type N'.
+    The options of the previously executed job command are reset."""
+    for option in ('group', 'model_type', 'score_type'):
+      setattr(self.m_args, option, None)
+    options = command.split()
+    self.m_args.sub_task = options[0]
+    for option, value in zip(options[1::2], options[2::2]):
+      setattr(self.m_args, option.lstrip('-').replace('-', '_'), value)
+
+
+  def execute_worker(self):
+    """Executes the work units of the work queue until all of them are done.
+    The resources and the tool chain are kept between the work units, so that, e.g., the projector and the enroller are loaded only once per worker."""
+    queue = self.work_queue()
+    worker = utils.work_queue.worker_name()
+    if self.m_grid.worker_grid == 'local':
+      # the local workers share the cores of this machine, which limits the processes and threads of each job
+      utils.work_queue.job_cores = max(1, multiprocessing.cpu_count() // self.m_grid.number_of_parallel_processes)
+    # the workers on this machine claim work units only while their memory requirements fit into the memory of the machine
+    memory_limit = self.m_grid.memory_limit or utils.work_queue.total_memory()
+    utils.info("Worker '%s' starts executing the work units of '%s'" % (worker, self.work_queue_file()))
+    while not queue.finished():
+      unit = queue.claim(worker, memory_limit)
+      if unit is None:
+        # the remaining work units are waiting for other stages to finish, or for memory
+        time.sleep(self.m_grid.scheduler_sleep_time)
+        continue
+      utils.info("Worker '%s' executes %s" % (worker, unit))
+      self.__set_sub_task__(unit.command)
+      self.m_work_unit = unit
+      try:
+        # keep the lease of the work unit while it is executed
+        with utils.work_queue.Heartbeat(queue, unit):
+          self.execute_grid_job()
+      except:
+        queue.fail(unit)
+        raise
+      finally:
+        self.m_work_unit = None
+      queue.complete(unit)
+    utils.info("Worker '%s' finished; the status of the work units is: %s" % (worker, queue.status()))
+
+
   def execute_local_deamon(self):
     """Starts the local deamon and waits until it has finished."""
+    if self.m_grid.uses_workers():
+      # start the local workers and wait for them
+      utils.info("Starting %d workers to finally run the jobs on the local machine." % self.m_grid.number_of_parallel_processes)
+      if self.m_grid.work_queue == 'filesystem':
+        utils.info("Workers on other machines that mount '%s' can join the experiment using: %s" % (self.work_queue_file(), ' '.join(self.__worker_command__())))
+      utils.ensure_dir(self.m_logs_directory)
+      workers = []
+      for i in range(self.m_grid.number_of_parallel_processes):
+        with open(os.path.join(self.m_logs_directory, 'worker-%d.log' % (i+1)), 'w') as log:
+          workers.append(subprocess.Popen([sys.executable] + self.__worker_command__(), stdout = log, stderr = subprocess.STDOUT))
+      failed = [i+1 for i, worker in enumerate(workers) if worker.wait()]
+      if failed:
+        utils.error("The workers %s failed; please check their logs in '%s'" % (failed, self.m_logs_directory))
+      return
     utils.info("Starting jman deamon to finally run the jobs on the local machine.")
     self.m_job_manager.run_scheduler(parallel_jobs=self.m_grid.number_of_parallel_processes, sleep_time=self.m_grid.scheduler_sleep_time, die_when_finished=True)
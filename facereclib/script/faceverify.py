@@ -12,6 +12,9 @@ from .. import toolchain, utils
 class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
   """Class that executes the ZT tool chain (locally or in the grid)."""
 
+  # faceverify.py provides the --worker option
+  supports_workers = True
+
   def __init__(self, args):
     # call base class constructor
     ToolChainExecutor.ToolChainExecutor.__init__(self, args)
@@ -59,10 +62,71 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
         zt_score_directories = zt_score_directories
     )
 
+    # additional extractors and tools, which are executed in the same pass over the data as the main extractor and tool;
+    # their files are written to the according directories of the main extractor and tool, suffixed with the name of the resource
+    self.m_additional_extractors = [
+        (extractor, self.m_file_selector.copy(
+            extractor_file = self.__suffixed__(self.m_configuration.extractor_file, name),
+            features_directory = self.__suffixed__(self.m_configuration.features_directory, name)))
+        for name, extractor in self.__load_resources__(args.additional_features, 'feature_extractor')
+    ]
+    additional_tools = self.__load_resources__(args.additional_tools, 'tool')
+    for name, tool in additional_tools:
+      # only the projection is run for the additional tools, so tools without projection would not compute anything
+      if not tool.performs_projection:
+        raise ValueError("The additional tool '%s' does not perform a projection; only tools with a projection step can be used as --additional-tools" % name)
+    self.m_additional_tools = [
+        (tool, self.m_file_selector.copy(
+            projector_file = self.__suffixed__(self.m_configuration.projector_file, name),
+            projected_directory = self.__suffixed__(self.m_configuration.projected_directory, name)))
+        for name, tool in additional_tools
+    ]
+
+    # the videos are preprocessed and extracted only for the frames that are used by any of the tools
+    frames_sub_dir = self.select_frames(
+        [self.m_tool] + [tool for tool, _ in self.m_additional_tools],
+        [self.m_preprocessor, self.m_extractor] + [extractor for extractor, _ in self.m_additional_extractors])
+    if frames_sub_dir is not None:
+      # the files that contain only the selected frames are written to sub-directories, so that they are not reused with other frame selectors
+      file_selectors = [self.m_file_selector] + [file_selector for _, file_selector in self.m_additional_extractors + self.m_additional_tools]
+      if hasattr(self.m_preprocessor, 'select_frames'):
+        for file_selector in file_selectors:
+          file_selector.preprocessed_directory = os.path.join(file_selector.preprocessed_directory, frames_sub_dir)
+      # the additional tools read the features of the main extractor
+      extractors = [(self.m_extractor, [self.m_file_selector] + [file_selector for _, file_selector in self.m_additional_tools])]
+      extractors += [(extractor, [file_selector]) for extractor, file_selector in self.m_additional_extractors]
+      for extractor, extractor_file_selectors in extractors:
+        if hasattr(extractor, 'select_frames'):
+          for file_selector in extractor_file_selectors:
+            file_selector.features_directory = os.path.join(file_selector.features_directory, frames_sub_dir)
+
     # create the tool chain to be used to actually perform the parts of the experiments
     self.m_tool_chain = toolchain.ToolChain(self.m_file_selector)
 
 
+  def __load_resources__(self, resources, keyword):
+    """Loads the given additional resources and returns a list of (name, resource) pairs"""
+    return [(os.path.splitext(os.path.basename(resource))[0], utils.resources.load_resource(resource, keyword, imports = self.m_args.imports)) for resource in resources]
+
+
+  def __suffixed__(self, path, name):
+    """Appends the given name to the given file or directory name, keeping the file extension"""
+    base, extension = os.path.splitext(path.rstrip(os.sep))
+    return base + '_' + name + extension
+
+
+  def __requires_extractor_training__(self):
+    return any(extractor.requires_training for extractor, _ in [(self.m_extractor, None)] + self.m_additional_extractors)
+
+
+  def __requires_projector_training__(self):
+    return any(tool.requires_projector_training for tool, _ in [(self.m_tool, None)] + self.m_additional_tools)
+
+
+  def __performs_projection__(self):
+    return any(tool.performs_projection for tool, _ in [(self.m_tool, None)] + self.m_additional_tools)
+
+
   def execute_tool_chain(self):
     """Executes the ZT tool chain on the local machine."""
     # preprocessing
@@ -72,17 +136,19 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
       else:
         self.m_tool_chain.preprocess_data(
               self.m_preprocessor,
-              force = self.m_args.force)
+              force = self.m_args.force,
+              decoding_threads = self.m_args.preprocessing_threads)
 
     # feature extraction
-    if not self.m_args.skip_extractor_training and self.m_extractor.requires_training:
+    if not self.m_args.skip_extractor_training and self.__requires_extractor_training__():
       if self.m_args.dry_run:
         print "Would have trained the extractor ..."
       else:
         self.m_tool_chain.train_extractor(
               self.m_extractor,
               self.m_preprocessor,
-              force = self.m_args.force)
+              force = self.m_args.force,
+              additional_extractors = self.m_additional_extractors)
 
     if not self.m_args.skip_extraction:
       if self.m_args.dry_run:
@@ -91,26 +157,29 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
         self.m_tool_chain.extract_features(
               self.m_extractor,
               self.m_preprocessor,
-              force = self.m_args.force)
+              force = self.m_args.force,
+              additional_extractors = self.m_additional_extractors)
 
     # feature projection
-    if not self.m_args.skip_projector_training and self.m_tool.requires_projector_training:
+    if not self.m_args.skip_projector_training and self.__requires_projector_training__():
       if self.m_args.dry_run:
         print "Would have trained the projector ..."
       else:
         self.m_tool_chain.train_projector(
               self.m_tool,
               self.m_extractor,
-              force = self.m_args.force)
+              force = self.m_args.force,
+              additional_tools = self.m_additional_tools)
 
-    if not self.m_args.skip_projection and self.m_tool.performs_projection:
+    if not self.m_args.skip_projection and self.__performs_projection__():
       if self.m_args.dry_run:
         print "Would have projected the features ..."
       else:
         self.m_tool_chain.project_features(
               self.m_tool,
               self.m_extractor,
-              force = self.m_args.force)
+              force = self.m_args.force,
+              additional_tools = self.m_additional_tools)
 
     # model enrollment
     if not self.m_args.skip_enroller_training and self.m_tool.requires_enroller_training:
@@ -179,18 +248,25 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
     # if there are any external dependencies, we need to respect them
     deps = external_dependencies[:]
 
+    # the sizes of the original files are used to balance the jobs that process all files
+    # (the preprocessed and extracted files do not exist yet)
+    file_costs = None
+    if self.m_grid.balance_jobs and not (self.m_args.skip_preprocessing and self.m_args.skip_extraction and self.m_args.skip_projection):
+      file_costs = self.file_size_costs(self.m_file_selector.original_data_list())
+
     # preprocessing; never has any dependencies.
     if not self.m_args.skip_preprocessing:
       job_ids['preprocessing'] = self.submit_grid_job(
               'preprocess',
               list_to_split = self.m_file_selector.original_data_list(),
               number_of_files_per_job = self.m_grid.number_of_preprocessings_per_job,
+              costs = file_costs,
               dependencies = [],
               **self.m_grid.preprocessing_queue)
       deps.append(job_ids['preprocessing'])
 
     # feature extraction training
-    if not self.m_args.skip_extractor_training and self.m_extractor.requires_training:
+    if not self.m_args.skip_extractor_training and self.__requires_extractor_training__():
       job_ids['extractor-training'] = self.submit_grid_job(
               'train-extractor',
               name = 'train-f',
@@ -204,12 +280,13 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
               'extract',
               list_to_split = self.m_file_selector.preprocessed_data_list(),
               number_of_files_per_job = self.m_grid.number_of_extracted_features_per_job,
+              costs = file_costs,
               dependencies = deps,
               **self.m_grid.extraction_queue)
       deps.append(job_ids['extraction'])
 
     # feature projection training
-    if not self.m_args.skip_projector_training and self.m_tool.requires_projector_training:
+    if not self.m_args.skip_projector_training and self.__requires_projector_training__():
       job_ids['projector_training'] = self.submit_grid_job(
               'train-projector',
               name="train-p",
@@ -218,11 +295,12 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
       deps.append(job_ids['projector_training'])
 
     # feature projection
-    if not self.m_args.skip_projection and self.m_tool.performs_projection:
+    if not self.m_args.skip_projection and self.__performs_projection__():
       job_ids['projection'] = self.submit_grid_job(
               'project',
               list_to_split = self.m_file_selector.feature_list(),
               number_of_files_per_job = self.m_grid.number_of_projected_features_per_job,
+              costs = file_costs,
               dependencies = deps,
               **self.m_grid.projection_queue)
       deps.append(job_ids['projection'])
@@ -250,6 +328,7 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
                 name = "enr-N-%s"%group,
                 list_to_split = self.m_file_selector.model_ids(group),
                 number_of_files_per_job = self.m_grid.number_of_enrolled_models_per_job,
+                costs = [len(self.m_file_selector.enroll_files(model_id, group, 'features')) for model_id in self.m_file_selector.model_ids(group)] if self.m_grid.balance_jobs else None,
                 dependencies = deps,
                 **self.m_grid.enrollment_queue)
         enroll_deps_n[group].append(job_ids['enroll_%s_N'%group])
@@ -260,6 +339,7 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
                   name = "enr-T-%s"%group,
                   list_to_split = self.m_file_selector.t_model_ids(group),
                   number_of_files_per_job = self.m_grid.number_of_enrolled_models_per_job,
+                  costs = [len(self.m_file_selector.t_enroll_files(model_id, group, 'features')) for model_id in self.m_file_selector.t_model_ids(group)] if self.m_grid.balance_jobs else None,
                   dependencies = deps,
                   **self.m_grid.enrollment_queue)
           enroll_deps_t[group].append(job_ids['enroll_%s_T'%group])
@@ -271,6 +351,7 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
                 name = "score-A-%s"%group,
                 list_to_split = self.m_file_selector.model_ids(group),
                 number_of_files_per_job = self.m_grid.number_of_models_per_scoring_job,
+                costs = [len(self.m_file_selector.probe_objects_for_model(model_id, group)) for model_id in self.m_file_selector.model_ids(group)] if self.m_grid.balance_jobs else None,
                 dependencies = enroll_deps_n[group],
                 **self.m_grid.scoring_queue)
         concat_deps[group] = [job_ids['score_%s_A'%group]]
@@ -336,14 +417,16 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
       self.m_tool_chain.preprocess_data(
           self.m_preprocessor,
           indices = self.indices(self.m_file_selector.original_data_list(), self.m_grid.number_of_preprocessings_per_job),
-          force = self.m_args.force)
+          force = self.m_args.force,
+          decoding_threads = self.m_args.preprocessing_threads)
 
     # train the feature extractor
     elif self.m_args.sub_task == 'train-extractor':
       self.m_tool_chain.train_extractor(
           self.m_extractor,
           self.m_preprocessor,
-          force = self.m_args.force)
+          force = self.m_args.force,
+          additional_extractors = self.m_additional_extractors)
 
     # extract the features
     elif self.m_args.sub_task == 'extract':
@@ -351,14 +434,16 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
           self.m_extractor,
           self.m_preprocessor,
           indices = self.indices(self.m_file_selector.preprocessed_data_list(), self.m_grid.number_of_extracted_features_per_job),
-          force = self.m_args.force)
+          force = self.m_args.force,
+          additional_extractors = self.m_additional_extractors)
 
     # train the feature projector
     elif self.m_args.sub_task == 'train-projector':
       self.m_tool_chain.train_projector(
           self.m_tool,
           self.m_extractor,
-          force = self.m_args.force)
+          force = self.m_args.force,
+          additional_tools = self.m_additional_tools)
 
     # project the features
     elif self.m_args.sub_task == 'project':
@@ -366,7 +451,8 @@ class ToolChainExecutorZT (ToolChainExecutor.ToolChainExecutor):
           self.m_tool,
           self.m_extractor,
           indices = self.indices(self.m_file_selector.preprocessed_data_list(), self.m_grid.number_of_projected_features_per_job),
-          force = self.m_args.force)
+          force = self.m_args.force,
+          additional_tools = self.m_additional_tools)
 
     # train the model enroller
     elif self.m_args.sub_task == 'train-enroller':
@@ -450,6 +536,10 @@ def parse_args(command_line_parameters):
 
   config_group.add_argument('-P', '--protocol', metavar='PROTOCOL',
       help = 'Overwrite the protocol that is stored in the database by the given one (might not by applicable for all databases).')
+  config_group.add_argument('--additional-features', metavar = 'x', nargs = '+', default = [],
+      help = 'Additional feature extractors (registered resources or configuration files), which are trained and extracted in the same pass over the preprocessed data as the --features; their features are written to the --features-directory suffixed with the resource name.')
+  config_group.add_argument('--additional-tools', metavar = 'x', nargs = '+', default = [],
+      help = 'Additional tools (registered resources or configuration files), whose projectors are trained and applied in the same pass over the extracted features as the --tool; only tools that perform a projection are accepted. Their projected features are written to the --projected-features-directory suffixed with the resource name.')
 
   sub_dir_group.add_argument('--models-directories', metavar = 'DIR', nargs = 2,
       default = ['models', 'tmodels'],
@@ -469,6 +559,8 @@ def parse_args(command_line_parameters):
       help = 'Performs score calibration after the scores are computed.')
   other_group.add_argument('-F', '--force', action='store_true',
       help = 'Force to erase former data if already exist')
+  other_group.add_argument('--preprocessing-threads', metavar = 'N', type = int, default = 1,
+      help = 'The number of threads that decode the original images in parallel during preprocessing')
   other_group.add_argument('-w', '--preload-probes', action='store_true',
       help = 'Preload probe files during score computation (needs more memory, but is faster and requires fewer file accesses). WARNING! Use this flag with care!')
   other_group.add_argument('--groups', metavar = 'GROUP', nargs = '+', default = ['dev'],
@@ -479,12 +571,16 @@ def parse_args(command_line_parameters):
   parser.add_argument('--sub-task',
       choices = ('preprocess', 'train-extractor', 'extract', 'train-projector', 'project', 'train-enroller', 'enroll', 'compute-scores', 'concatenate', 'calibrate'),
       help = argparse.SUPPRESS) #'Executes a subtask (FOR INTERNAL USE ONLY!!!)'
+  parser.add_argument('--worker', action='store_true',
+      help = argparse.SUPPRESS) #'Executes the work units of the work queue (FOR INTERNAL USE ONLY!!!)'
   parser.add_argument('--model-type', choices = ['N', 'T'],
       help = argparse.SUPPRESS) #'Which type of models to generate (Normal or TModels)'
   parser.add_argument('--score-type', choices = ['A', 'B', 'C', 'D', 'Z'],
       help = argparse.SUPPRESS) #'The type of scores that should be computed'
   parser.add_argument('--group',
       help = argparse.SUPPRESS) #'The group for which the current action should be performed'
+  parser.add_argument('--job-ranges',
+      help = argparse.SUPPRESS) #'The file containing the balanced index ranges of the jobs of the array'
 
   return parser.parse_args(command_line_parameters)
 
@@ -527,6 +623,10 @@ def face_verify(args, command_line_parameters, external_dependencies = [], exter
 
     return {}
 
+  elif args.worker:
+    # execute the jobs of the work queue
+    executor.execute_worker()
+    return {}
   elif args.sub_task:
     # execute the desired sub-task
     executor.execute_grid_job()
@@ -547,8 +647,12 @@ def face_verify(args, command_line_parameters, external_dependencies = [], exter
     # add the jobs
     job_ids = executor.add_jobs_to_grid(external_dependencies)
 
+    if executor.m_grid.uses_workers() and not executor.m_grid.is_local():
+      # submit the workers that execute the jobs of the work queue
+      executor.submit_workers()
+
     if executor.m_grid.is_local():
-      # start the jman local deamon
+      # start the jman local deamon (or the local workers)
       executor.execute_local_deamon()
       return {}
 
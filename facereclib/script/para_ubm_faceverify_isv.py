@@ -115,9 +115,14 @@ class ToolChainExecutorISV (ToolChainExecutor.ToolChainExecutor, tools.ParallelU
       training_list = self.m_file_selector.training_list('projected', 'train_projector', arrange_by_client = True)
       train_features = self.m_tool_chain.__read_features_by_client__(training_list, self.m_tool)
 
-      # perform ISV training
+      # perform ISV training; an interrupted training is resumed from the checkpoint
       utils.info("ISV training: training ISV with %d clients" % len(train_features))
+      checkpoint_file = self.m_tool_chain.__checkpoint_file__(self.m_tool.m_isv_filename, force)
+      self.m_tool.set_checkpoint(checkpoint_file)
       self.m_tool._train_isv(train_features)
+      self.m_tool.set_checkpoint(None)
+      if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
       utils.ensure_dir(os.path.dirname(self.m_tool.m_isv_filename))
       self.m_tool._save_projector_isv_resolved(self.m_tool.m_isv_filename)
       utils.info("ISV training: saved ISV matrix to '%s'" % self.m_tool.m_isv_filename)
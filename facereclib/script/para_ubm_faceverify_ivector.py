@@ -113,11 +113,8 @@ class ToolChainExecutorIVector (ToolChainExecutor.ToolChainExecutor, tools.Paral
     else:
       utils.info("IVector training: E-Step from range(%d, %d)" % indices)
 
-      # Temporary machine used for initialization
-      ubm = bob.machine.GMMMachine(bob.io.HDF5File(self.m_tool.m_gmm_filename))
-      m = bob.machine.IVectorMachine(ubm, self.m_tool.m_subspace_dimension_of_t)
-      m.variance_threshold = self.m_tool.m_variance_threshold
       # Load machine
+      ubm = bob.machine.GMMMachine(bob.io.HDF5File(self.m_tool.m_gmm_filename))
       machine_file = self.m_configuration.ivector_intermediate_file % self.m_args.iteration
       ivector_machine = bob.machine.IVectorMachine(bob.io.HDF5File(machine_file))
       ivector_machine.ubm = ubm
@@ -126,22 +123,17 @@ class ToolChainExecutorIVector (ToolChainExecutor.ToolChainExecutor, tools.Paral
       training_list = self.m_file_selector.training_list('projected', 'train_projector')
       data = [self.m_tool.read_feature(str(training_list[index])) for index in range(indices[0], indices[1])]
 
-      # Creates the IVectorTrainer and call the initialization procedure
-      ivector_trainer = bob.trainer.IVectorTrainer(update_sigma=self.m_tool.m_update_sigma, max_iterations=self.m_tool.m_tv_training_iterations)
-      ivector_trainer.initialize(m, data)
-
-      # Performs the E-step
-      ivector_trainer.e_step(ivector_machine, data)
+      # Performs the E-step, using several local processes if the tool requests it
+      update_sigma, variance_threshold = self.m_tool.m_update_sigma, self.m_tool.m_variance_threshold
+      e_step = lambda subspaces, data, latent: tools.ParallelEM.ivector_e_step(ubm, subspaces, data, update_sigma, variance_threshold, latent)
+      accumulators, _ = tools.ParallelEM.single_e_step(e_step, (ivector_machine.t, ivector_machine.sigma), data, self.m_tool.m_number_of_training_processes)
 
       # write results to file
       nsamples = numpy.array([indices[1] - indices[0]], dtype=numpy.float64)
 
       utils.ensure_dir(os.path.dirname(stats_file))
       f = bob.io.HDF5File(stats_file, 'w')
-      f.set('acc_nij_wij2', ivector_trainer.acc_nij_wij2)
-      f.set('acc_fnormij_wij', ivector_trainer.acc_fnormij_wij)
-      f.set('acc_nij', ivector_trainer.acc_nij)
-      f.set('acc_snormij', ivector_trainer.acc_snormij)
+      tools.ParallelEM.save_accumulators(accumulators, f)
       f.set('nsamples', nsamples)
       utils.info("IVector training: Wrote Stats file '%s'" % stats_file)
 
@@ -149,12 +141,7 @@ class ToolChainExecutorIVector (ToolChainExecutor.ToolChainExecutor, tools.Paral
   def _read_stats(self, filename):
     """Reads accumulated IVector statistics from file"""
     utils.debug("IVector training: Reading stats file '%s'" % filename)
-    f = bob.io.HDF5File(filename)
-    acc_nij_wij2    = f.read('acc_nij_wij2')
-    acc_fnormij_wij = f.read('acc_fnormij_wij')
-    acc_nij         = f.read('acc_nij')
-    acc_snormij     = f.read('acc_snormij')
-    return (acc_nij_wij2, acc_fnormij_wij, acc_nij, acc_snormij)
+    return tools.ParallelEM.read_accumulators(bob.io.HDF5File(filename), tools.ParallelEM.IVECTOR_ACCUMULATORS)
 
   def ivector_mstep(self, counts, force=False):
     """Performs a single M-step of the IVector algorithm (non-parallel)"""
@@ -171,7 +158,7 @@ class ToolChainExecutorIVector (ToolChainExecutor.ToolChainExecutor, tools.Paral
       if os.path.exists(self.m_configuration.ivector_stats_file % (self.m_args.iteration, 0, len(training_list))):
         stats_file = self.m_configuration.ivector_stats_file % (self.m_args.iteration, 0, len(training_list))
         # load stats file
-        acc_nij_wij2, acc_fnormij_wij, acc_nij, acc_snormij = self._read_stats(stats_file)
+        accumulators = self._read_stats(stats_file)
       else:
         # load several files
         job_ids = range(self.__generate_job_array__(training_list, counts)[1])
@@ -179,13 +166,9 @@ class ToolChainExecutorIVector (ToolChainExecutor.ToolChainExecutor, tools.Paral
         stats_files = [self.m_configuration.ivector_stats_file % (self.m_args.iteration, indices[0], indices[1]) for indices in job_indices]
 
         # read all stats files
-        acc_nij_wij2, acc_fnormij_wij, acc_nij, acc_snormij = self._read_stats(stats_files[0])
+        accumulators = self._read_stats(stats_files[0])
         for stats_file in stats_files[1:]:
-          acc_nij_wij2_, acc_fnormij_wij_, acc_nij_, acc_snormij_ = self._read_stats(stats_file)
-          acc_nij_wij2    += acc_nij_wij2_
-          acc_fnormij_wij += acc_fnormij_wij_
-          acc_nij         += acc_nij_
-          acc_snormij     += acc_snormij_
+          tools.ParallelEM.add_accumulators(accumulators, self._read_stats(stats_file))
 
       # TODO read some features (needed for computation, but not really required)
       data = []
@@ -203,10 +186,7 @@ class ToolChainExecutorIVector (ToolChainExecutor.ToolChainExecutor, tools.Paral
       ivector_trainer.initialize(m, data)
 
       # Performs the M-step
-      ivector_trainer.acc_nij_wij2 = acc_nij_wij2
-      ivector_trainer.acc_fnormij_wij = acc_fnormij_wij
-      ivector_trainer.acc_nij = acc_nij
-      ivector_trainer.acc_snormij = acc_snormij
+      tools.ParallelEM.set_accumulators(ivector_trainer, accumulators)
       ivector_trainer.m_step(ivector_machine, data) # data is not used in M-step
       utils.info("IVector training: Performed M step %d" % (self.m_args.iteration,))
 
@@ -238,20 +218,20 @@ class ToolChainExecutorIVector (ToolChainExecutor.ToolChainExecutor, tools.Paral
       index_range = range(len(projected_files))
 
     utils.info("- Projection: projecting %d gmm stats from directory '%s' to directory '%s'" % (len(index_range), self.m_tool._resolve_projected_gmm(self.m_file_selector.projected_directory), self.m_tool._resolve_projected_ivector(self.m_file_selector.projected_directory)))
-    # extract the features
-    for i in index_range:
-      projected_file = projected_files[i]
-      projected_file_gmm_resolved = self.m_tool._resolve_projected_gmm(projected_file)
-      projected_file_ivec_resolved = self.m_tool._resolve_projected_ivector(projected_file)
-
-      if not self.m_tool_chain.__check_file__(projected_file_ivec_resolved, force):
-        # load feature
-        feature = self.m_tool.read_feature(str(projected_file))
-        # project feature
-        projected = self.m_tool._project_ivector(feature)
-        # write it
-        utils.ensure_dir(os.path.dirname(projected_file_ivec_resolved))
-        self.m_tool._save_feature_ivector(projected, str(projected_file))
+    # collect the files that still need to be projected
+    todo_files = [projected_files[i] for i in index_range if not self.m_tool_chain.__check_file__(self.m_tool._resolve_projected_ivector(projected_files[i]), force)]
+    # extract the i-vectors of several files at once
+    block_size = 100
+    for first in range(0, len(todo_files), block_size):
+      block_files = todo_files[first:first+block_size]
+      # load features
+      features = [self.m_tool.read_feature(str(projected_file)) for projected_file in block_files]
+      # project features
+      projected = self.m_tool._project_ivectors(features)
+      # write them
+      for i, projected_file in enumerate(block_files):
+        utils.ensure_dir(os.path.dirname(self.m_tool._resolve_projected_ivector(projected_file)))
+        self.m_tool._save_feature_ivector(projected[i], str(projected_file))
 
 #######################################################################################
 ##############  Functions dealing with submission and execution of jobs  ##############
@@ -20,6 +20,8 @@
 
 import unittest
 import os
+import shutil
+import tempfile
 import facereclib
 from nose.plugins.skip import SkipTest
 
@@ -166,3 +168,79 @@ class DatabaseTest(unittest.TestCase):
     m2 = sorted([str(id) for id in db2.model_ids()])[0]
     self.assertEqual(str(db1.client_id_from_model_id(m1)), db2.client_id_from_model_id(m2))
 
+
+  def test21_annotation_index(self):
+    # a database with only the annotations of the test image
+    class AnnotatedDatabase (facereclib.databases.Database):
+      def all_files(self):
+        return [facereclib.databases.File(1, 1, 'testimage')]
+
+    cache = os.path.join(tempfile.mkdtemp(prefix='frltest_'), 'annotations')
+    database = AnnotatedDatabase(
+        name = 'annotated',
+        original_directory = None,
+        original_extension = '.jpg',
+        annotation_directory = pkg_resources.resource_filename('facereclib', 'tests'),
+        annotation_type = 'named',
+        annotation_cache = cache
+    )
+    file = database.all_files()[0]
+    reference = facereclib.utils.read_annotations(pkg_resources.resource_filename('facereclib.tests', 'testimage.pos'), 'named')
+
+    # the first request creates the index; the annotations are identical to the ones read from file
+    self.assertEqual(database.annotations(file), reference)
+    self.assertTrue(os.path.isdir(cache))
+    # a second database reads the index from the cache directory
+    database.m_annotation_index = None
+    self.assertEqual(database.annotations(file), reference)
+    self.assertEqual(len(database.annotation_index()), 1)
+
+    # annotation types that are not (only) positions cannot be indexed
+    self.assertRaises(ValueError, facereclib.utils.annotations.AnnotationIndex.create, os.path.join(os.path.dirname(cache), 'enumerated'), {}, 'enumerated')
+    database = AnnotatedDatabase(
+        name = 'annotated',
+        original_directory = None,
+        original_extension = '.jpg',
+        annotation_directory = pkg_resources.resource_filename('facereclib', 'tests'),
+        annotation_type = 'enumerated',
+        annotation_cache = os.path.join(os.path.dirname(cache), 'enumerated')
+    )
+    self.assertTrue(database.annotation_index() is None)
+    self.assertTrue(database.annotation_cache is None)
+    self.assertFalse(os.path.exists(os.path.join(os.path.dirname(cache), 'enumerated')))
+
+    shutil.rmtree(os.path.dirname(cache))
+
+
+  def test22_database_snapshot(self):
+    database = self.config('atnt')
+    snapshot_file = os.path.join(tempfile.mkdtemp(prefix='frltest_'), 'atnt.snapshot')
+    snapshot = facereclib.databases.DatabaseSnapshot(snapshot_file, database)
+    self.assertTrue(os.path.exists(snapshot_file))
+    self.check_database(snapshot)
+
+    # the snapshot provides the same file lists as the database
+    def check_files(f1, f2):
+      self.assertEqual([file.path for file in f1], [file.path for file in f2])
+
+    check_files(snapshot.all_files(), database.all_files())
+    check_files(snapshot.training_files('train_projector'), database.training_files('train_projector'))
+    self.assertEqual(snapshot.model_ids(), database.model_ids())
+    model_id = database.model_ids()[0]
+    check_files(snapshot.enroll_files(model_id), database.enroll_files(model_id))
+    check_files(snapshot.probe_files(model_id), database.probe_files(model_id))
+    check_files(snapshot.probe_files(), database.probe_files())
+
+    # the snapshot can be read without the database
+    snapshot = facereclib.databases.DatabaseSnapshot(snapshot_file)
+    check_files(snapshot.all_files(), database.all_files())
+    self.assertEqual(snapshot.original_directory, database.original_directory)
+    self.assertEqual(snapshot.source, facereclib.databases.DatabaseSnapshot.source(database))
+
+    # snapshots of other groups are rejected without a database, and recreated with it
+    self.assertRaises(ValueError, facereclib.databases.DatabaseSnapshot, snapshot_file, groups = ())
+    snapshot = facereclib.databases.DatabaseSnapshot(snapshot_file, database, groups = ())
+    self.assertEqual(snapshot.source, facereclib.databases.DatabaseSnapshot.source(database, groups = ()))
+    self.assertEqual(facereclib.databases.DatabaseSnapshot(snapshot_file).source[2], ())
+
+    shutil.rmtree(os.path.dirname(snapshot_file))
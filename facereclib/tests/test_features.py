@@ -81,6 +81,13 @@ class FeatureExtractionTest(unittest.TestCase):
     feature = self.execute(extractor, data, 'dct_blocks.hdf5')
     self.assertEqual(len(feature.shape), 2)
 
+    # the batched extraction computes the reference features (of bob.ip.DCTFeatures) for each image of the stack
+    reference = bob.io.load(self.reference_dir('dct_blocks.hdf5'))
+    features = extractor.extract_batch(numpy.array([data, data]))
+    self.assertEqual(features.shape, (2,) + reference.shape)
+    self.assertTrue((numpy.abs(features[0] - reference) < 1e-5).all())
+    self.assertTrue((numpy.abs(features[1] - reference) < 1e-5).all())
+
 
   def notest02a_dct_video(self):
     # test that at least the config file can be read
@@ -99,6 +106,45 @@ class FeatureExtractionTest(unittest.TestCase):
     self.assertEqual(feature, reference)
 
 
+  def test02b_frame_container(self):
+    # write a frame container in the stacked layout and read it back
+    frame_container = facereclib.utils.video.FrameContainer()
+    for frame_id in (3, 1, 2):
+      frame_container.add_frame(frame_id, numpy.random.rand(10, 5), numpy.array([frame_id, 1.]))
+    temp_file = tempfile.mkstemp(prefix='frecl_', suffix='.hdf5')[1]
+    frame_container.save(bob.io.HDF5File(temp_file, 'w'))
+    read_container = facereclib.utils.video.FrameContainer(temp_file)
+    self.assertEqual(read_container, frame_container)
+
+    # the selectors return the frames in the expected order
+    frames = dict((frame_id, data) for (frame_id, data, quality) in frame_container.frames())
+    first = list(facereclib.utils.video.FirstNFrameSelector(2)(read_container))
+    self.assertEqual(len(first), 2)
+    self.assertTrue((first[0] == frames[1]).all())
+    self.assertTrue((first[1] == frames[2]).all())
+    best = list(facereclib.utils.video.QualityNFrameSelector(1, 0)(read_container))
+    self.assertEqual(len(best), 1)
+    self.assertTrue((best[0] == frames[3]).all())
+
+    # restricting the container to the union of the selected frames does not change the selection
+    selector = facereclib.utils.video.UnionFrameSelector([facereclib.utils.video.FirstNFrameSelector(1), facereclib.utils.video.QualityNFrameSelector(1, 0)])
+    subset = read_container.subset(selector.indices(read_container))
+    # the name of the union selector defines the sub-directory of the files with the selected frames
+    self.assertEqual(str(selector), 'first1+quality1-0')
+    self.assertEqual(sorted(subset.frame_ids()), [1, 3])
+    self.assertTrue((list(facereclib.utils.video.QualityNFrameSelector(1, 0)(subset))[0] == frames[3]).all())
+
+    # custom selectors without indices or string representation cannot restrict the frames
+    class CustomSelector (object):
+      def __call__(self, frame_container):
+        for frame in frame_container.frames():
+          yield frame[1]
+    self.assertFalse(facereclib.utils.video.restricts_frames(CustomSelector()))
+    self.assertTrue(facereclib.utils.video.restricts_frames(facereclib.utils.video.FirstNFrameSelector(1)))
+    self.assertRaises(ValueError, facereclib.utils.video.UnionFrameSelector, [CustomSelector()])
+    os.remove(temp_file)
+
+
   def test03_graphs(self):
     data = bob.io.load(self.input_dir('cropped.hdf5'))
     extractor = self.config('grid-graph')
@@ -117,6 +163,13 @@ class FeatureExtractionTest(unittest.TestCase):
     feature = self.execute(extractor, data, 'graph_no_phase.hdf5')
     self.assertEqual(len(feature.shape), 2)
 
+    # the batched extraction returns independent graphs identical to the single image extraction
+    graphs = extractor.extract_batch([data, data])
+    self.assertEqual(graphs.shape, (2,) + feature.shape)
+    self.assertTrue(numpy.allclose(graphs[0], feature))
+    self.assertTrue(numpy.allclose(graphs[1], feature))
+    self.assertFalse(extractor(data) is extractor(data))
+
     # generate aligned graph extractor
     extractor = self.config('grid_graph_aligned')
     feature = self.execute(extractor, data, 'graph_aligned.hdf5')
@@ -176,6 +229,19 @@ class FeatureExtractionTest(unittest.TestCase):
     self.assertTrue(len(with_phase.shape) == 1)
     self.assertEqual(no_phase.shape[0]*2, with_phase.shape[0])
 
+    # the Gabor wavelet transform is shared with a graph extractor of the same Gabor parameters
+    graph_extractor = facereclib.features.GridGraph(
+        gabor_directions = 4,
+        gabor_scales = 2,
+        gabor_sigma = math.sqrt(2.) * math.pi,
+        node_distance = (10, 10),
+        image_resolution = data.shape
+    )
+    self.assertTrue(graph_extractor.m_gabor is extractor.m_gabor)
+    trafo_image = extractor.m_gabor.trafo_image(data)
+    graph_extractor(data)
+    self.assertTrue(extractor.m_gabor.trafo_image(data) is trafo_image)
+
 
   def test05_sift_key_points(self):
     # we need the preprocessor tool to actually read the data
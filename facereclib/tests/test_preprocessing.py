@@ -167,3 +167,22 @@ class PreprocessingTest(unittest.TestCase):
     data2, annot2 = reference
     self.assertTrue((numpy.abs(data - data2) < 1e-5).all())
     self.assertTrue((annots == annot2).all())
+
+
+  def test07_composite(self):
+    # read input
+    data, annotation = self.input()
+    preprocessor = facereclib.preprocessing.CompositePreprocessor({
+        'tan-triggs' : self.config('tan-triggs'),
+        'self-quotient' : self.config('self-quotient'),
+        'histogram' : self.config('histogram-equalize'),
+        'inorm-lbp' : self.config('inorm-lbp')
+    })
+    # the I-Norm LBP uses a different face cropping
+    self.assertEqual(len(preprocessor.m_groups), 2)
+    self.assertEqual(preprocessor.output_names, ['histogram', 'inorm-lbp', 'self-quotient', 'tan-triggs'])
+
+    # all normalizations must be identical to the ones of the single preprocessors
+    preprocessed = preprocessor(data, annotation)
+    for name, reference in (('tan-triggs', 'tan_triggs_cropped.hdf5'), ('self-quotient', 'self_quotient_cropped.hdf5'), ('histogram', 'histogram_cropped.hdf5'), ('inorm-lbp', 'inorm_cropped.hdf5')):
+      self.assertTrue((numpy.abs(bob.io.load(self.reference_dir(reference)) - preprocessed[name]) < 1e-5).all())
@@ -126,6 +126,35 @@ class ScriptTest (unittest.TestCase):
     self.__face_verify__(parameters, test_dir, 'test_b')
 
 
+  def test01d_faceverify_additional(self):
+    test_dir = tempfile.mkdtemp(prefix='frltest_')
+    # define dummy parameters, including additional extractors and tools that run in the same pass
+    parameters = [
+        '-d', os.path.join(base_dir, 'scripts', 'atnt_Test.py'),
+        '-p', 'face-crop',
+        '-f', 'eigenfaces',
+        '-t', os.path.join(config_dir, 'tools', 'dummy.py'),
+        '--additional-features', 'linearize',
+        '--additional-tools', 'pca',
+        '--zt-norm',
+        '-b', 'test_d',
+        '--temp-directory', test_dir,
+        '--user-directory', test_dir
+    ]
+
+    print ' '.join(parameters)
+
+    facereclib.script.faceverify.main([sys.argv[0]] + parameters)
+    # the additional features and projected features are written to their own directories
+    self.assertTrue(os.path.isdir(os.path.join(test_dir, 'test_d', 'features_linearize')))
+    self.assertEqual(len(os.listdir(os.path.join(test_dir, 'test_d', 'features_linearize'))), len(os.listdir(os.path.join(test_dir, 'test_d', 'features'))))
+    self.assertTrue(os.path.exists(os.path.join(test_dir, 'test_d', 'Projector_pca.hdf5')))
+    self.assertTrue(os.path.isdir(os.path.join(test_dir, 'test_d', 'projected_pca')))
+
+    # the scores of the main tool chain are not affected
+    self.__face_verify__(parameters, test_dir, 'test_d')
+
+
   def test01c_faceverify_parallel(self):
     test_dir = tempfile.mkdtemp(prefix='frltest_')
     test_database = os.path.join(test_dir, "database.sql3")
@@ -148,6 +177,48 @@ class ScriptTest (unittest.TestCase):
     self.__face_verify__(parameters, test_dir, 'test_c')
 
 
+  def test01e_faceverify_workers(self):
+    test_dir = tempfile.mkdtemp(prefix='frltest_')
+
+    # define dummy parameters
+    parameters = [
+        '-d', os.path.join(base_dir, 'scripts', 'atnt_Test.py'),
+        '-p', 'face-crop',
+        '-f', 'facereclib.features.Eigenface(subspace_dimension', '=', '100)',
+        '-t', 'facereclib.tools.Dummy()',
+        '--zt-norm',
+        '-b', 'test_e',
+        '--temp-directory', test_dir,
+        '--user-directory', test_dir,
+        '-g', 'local-workers'
+    ]
+
+    print ' '.join(parameters)
+
+    self.__face_verify__(parameters, test_dir, 'test_e')
+
+
+  def test01f_faceverify_filesystem_workers(self):
+    test_dir = tempfile.mkdtemp(prefix='frltest_')
+
+    # define dummy parameters
+    parameters = [
+        '-d', os.path.join(base_dir, 'scripts', 'atnt_Test.py'),
+        '-p', 'face-crop',
+        '-f', 'facereclib.features.Eigenface(subspace_dimension', '=', '100)',
+        '-t', 'facereclib.tools.Dummy()',
+        '--zt-norm',
+        '-b', 'test_f',
+        '--temp-directory', test_dir,
+        '--user-directory', test_dir,
+        '-g', 'filesystem-workers'
+    ]
+
+    print ' '.join(parameters)
+
+    self.__face_verify__(parameters, test_dir, 'test_f')
+
+
   def test01m_faceverify_calibrate(self):
     test_dir = tempfile.mkdtemp(prefix='frltest_')
     # define dummy parameters
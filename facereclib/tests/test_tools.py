@@ -85,6 +85,19 @@ class ToolTest(unittest.TestCase):
     sim = tool.score(model, feature)
     self.assertAlmostEqual(sim, 1.)
     self.assertAlmostEqual(tool.score_for_multiple_probes(model, [feature, feature]), 1.)
+    self.assertTrue(numpy.allclose(tool.score_matrix([model, model], [feature, feature, feature]), 1.))
+
+    # the vectorized similarity functions compute the same similarities as bob for the nodes of the reference graphs
+    for similarity_type, graph in (
+        (bob.machine.gabor_jet_similarity_type.SCALAR_PRODUCT, feature),
+        (bob.machine.gabor_jet_similarity_type.CANBERRA, feature),
+        (bob.machine.gabor_jet_similarity_type.CANBERRA, bob.io.load(self.input_dir('graph_no_phase.hdf5')))
+    ):
+      tool = facereclib.tools.GaborJets(similarity_type)
+      self.assertTrue(tool.m_similarity_kernel is not None)
+      shifted = numpy.roll(graph, 1, axis=0)
+      similarities = tool.__similarities__(graph[numpy.newaxis], [shifted])[0,0]
+      self.assertTrue(numpy.allclose(similarities, [tool.m_similarity_function(graph[n], shifted[n]) for n in range(graph.shape[0])]))
 
 
   def test02_lgbphs(self):
@@ -103,6 +116,7 @@ class ToolTest(unittest.TestCase):
     sim = tool.score(model, feature2)
     self.assertAlmostEqual(sim, 33600.0)
     self.assertAlmostEqual(tool.score_for_multiple_probes(model, [feature2, feature2]), sim)
+    self.assertTrue(numpy.allclose(tool.score_matrix([model, model], [feature2, feature1]), [sim, tool.score(model, feature1)]))
 
 
   def test03_pca(self):
@@ -457,6 +471,8 @@ class ToolTest(unittest.TestCase):
     # score with projected feature and compare to the weird reference score ...
     sim = tool.score(model, probe)
     self.assertAlmostEqual(sim, 0.002739150199911455)
+    # score all models and probes at once
+    self.assertTrue(numpy.allclose(tool.score_matrix([model, reference_model], [probe, probe, probe]), sim))
 
     # score with a concatenation of the probe
     self.assertAlmostEqual(tool.score_for_multiple_probes(model, [probe, probe]), sim, places=5)
@@ -542,6 +558,8 @@ class ToolTest(unittest.TestCase):
     # score with projected feature and compare to the weird reference score ...
     sim = tool.score(model, probe)
     self.assertAlmostEqual(sim, 0.25456327196005185)
+    # score all models and probes at once
+    self.assertTrue(numpy.allclose(tool.score_matrix([model, reference_model], [probe, probe, probe]), sim))
     # score with a concatenation of the probe
     # self.assertAlmostEqual(tool.score_for_multiple_probes(model, [probe, probe]), sim)
 
@@ -588,7 +606,7 @@ class ToolTest(unittest.TestCase):
     # enroll model
     model = tool.enroll([feature])
     if regenerate_refs:
-      model.save(bob.io.HDF5File(self.reference_dir('pca+plda_model.hdf5'), 'w'))
+      tool.save_model(model, self.reference_dir('pca+plda_model.hdf5'))
     # TODO: compare the models with the reference
     #reference_model = tool.read_model(self.reference_dir('pca+plda_model.hdf5'))
     #self.assertEqual(model, reference_model)
@@ -598,6 +616,8 @@ class ToolTest(unittest.TestCase):
     self.assertAlmostEqual(sim, 0.)
     # score with a concatenation of the probe
     self.assertAlmostEqual(tool.score_for_multiple_probes(model, [feature, feature]), 0.)
+    # score all models and probes at once
+    self.assertTrue(numpy.allclose(tool.score_matrix([model, model], [feature, feature, feature]), sim))
 
 
   def test10_ivector(self):
@@ -656,25 +676,80 @@ class ToolTest(unittest.TestCase):
     projected_reference = tool.read_feature(self.reference_dir('ivector_feature.hdf5'))
     self.assertTrue(projected[0].is_similar_to(projected_reference))
 
+    # the batched i-vector extraction must give the same result as the IVectorMachine
+    self.assertTrue(numpy.allclose(tool._project_ivectors([projected[0], projected[0]]), projected[1]))
+
     # enroll model with the projected feature
-    # This is not yet supported
-    # model = tool.enroll([projected[0]])
-    # if regenerate_refs:
-    #  model.save(bob.io.HDF5File(self.reference_dir('ivector_model.hdf5'), 'w'))
-    #reference_model = tool.read_model(self.reference_dir('ivector_model.hdf5'))
-    # compare the IVector model with the reference
-    #self.assertTrue(model.is_similar_to(reference_model))
+    model = tool.enroll([projected[0]])
+    self.assertAlmostEqual(numpy.linalg.norm(model), 1.)
 
     # check that the read_probe function reads the correct values
     probe = tool.read_probe(self.reference_dir('ivector_feature.hdf5'))
     self.assertTrue(probe[0].is_similar_to(projected[0]))
     self.assertEqual(probe[1].any(), projected[1].any())
 
-    # score with projected feature and compare to the weird reference score ...
-    # This in not implemented yet
+    # score with the projected feature; the cosine similarity of identical i-vectors is 1
+    sim = tool.score(model, projected)
+    self.assertAlmostEqual(sim, 1.)
 
     # score with a concatenation of the probe
-    # This is not implemented yet
+    self.assertAlmostEqual(tool.score_for_multiple_probes(model, [projected, projected]), sim)
+    # score all models and probes at once
+    self.assertTrue(numpy.allclose(tool.score_matrix([model, model], [projected, projected, projected]), sim))
+
+
+
 
 
+  def test11_parallel_em(self):
+    # the partitioning must cover all clients exactly once
+    self.assertEqual(facereclib.tools.ParallelEM.partition(range(10), 3), [(0, 3), (3, 7), (7, 10)])
+    self.assertEqual(facereclib.tools.ParallelEM.partition(range(2), 4), [(0, 1), (1, 2)])
 
+    # train ISV with the serial and the parallel E-steps, which need to give the same result
+    ubm = bob.machine.GMMMachine(bob.io.HDF5File(self.reference_dir('jfa_projector.hdf5')))
+    train_set = self.train_gmm_stats(self.reference_dir('jfa_feature.hdf5'), count=5, minimum=-5., maximum=5.)
+
+    serial = bob.machine.ISVBase(ubm, 2)
+    t = bob.trainer.ISVTrainer(2, 4.)
+    t.rng = bob.core.random.mt19937(seed_value)
+    t.train(serial, train_set)
+
+    parallel = bob.machine.ISVBase(ubm, 2)
+    t = bob.trainer.ISVTrainer(2, 4.)
+    t.rng = bob.core.random.mt19937(seed_value)
+    facereclib.tools.ParallelEM.train_isv(t, parallel, train_set, 4., 2, 3)
+    self.assertTrue(parallel.is_similar_to(serial))
+
+
+  def test12_checkpoint(self):
+    # train a small UBM without checkpoint
+    tool = facereclib.tools.UBMGMM(
+        number_of_gaussians = 2,
+        gmm_training_iterations = 3,
+        training_threshold = 0.,
+        INIT_SEED = seed_value,
+    )
+    train_set = facereclib.utils.tests.random_training_set((20,45), count=5, minimum=-5., maximum=5.)
+    tool._train_projector_using_array(numpy.vstack(train_set))
+    reference = tool.m_ubm
+
+    # train the same UBM with checkpoint
+    c = tempfile.mkstemp('checkpoint.hdf5', prefix='frltest_')[1]
+    os.remove(c)
+    tool.set_checkpoint(c)
+    tool._train_projector_using_array(numpy.vstack(train_set))
+    self.assertTrue(tool.m_ubm.is_similar_to(reference))
+    self.assertTrue(os.path.exists(c))
+    checkpoint = facereclib.tools.Checkpoint(c, seed_value)
+    self.assertTrue(checkpoint.resumes('gmm'))
+    self.assertTrue(checkpoint.passed('k-means'))
+    self.assertEqual(checkpoint.m_iteration, 3)
+
+    # resuming from the (final) checkpoint must give the same UBM
+    tool._train_projector_using_array(numpy.vstack(train_set))
+    self.assertTrue(tool.m_ubm.is_similar_to(reference))
+
+    # a checkpoint with a different seed is ignored
+    self.assertFalse(facereclib.tools.Checkpoint(c, seed_value + 1).resumes('gmm'))
+    os.remove(c)
@@ -3,6 +3,7 @@
 # Manuel Guenther <Manuel.Guenther@idiap.ch>
 
 import os
+import copy
 from .. import utils
 import bob
 
@@ -38,6 +39,16 @@ class FileSelector:
     self.default_extension = default_extension
 
 
+  def copy(self, **kwargs):
+    """Returns a copy of this file selector, in which the given directories and files (e.g., features_directory = ...) are replaced."""
+    file_selector = copy.copy(self)
+    for key, value in kwargs.iteritems():
+      if not hasattr(self, key):
+        raise ValueError("The file selector has no directory or file '%s'" % key)
+      setattr(file_selector, key, value)
+    return file_selector
+
+
   def uses_probe_file_sets(self):
     """Returns true if the given protocol enables several probe files for scoring."""
     return self.m_database.uses_probe_file_sets()
@@ -81,9 +92,12 @@ class FileSelector:
     """Reads the annotation of the given file."""
     return self.m_database.annotations(annotation_file)
 
-  def preprocessed_data_list(self):
-    """Returns the list of preprocessed data files."""
+  def preprocessed_data_list(self, sub_directory = None):
+    """Returns the list of preprocessed data files.
+    If given, the files are located in the given sub-directory of the preprocessed directory (used for preprocessors with several outputs)."""
     files = self.m_database.all_files()
+    if sub_directory is not None:
+      return self.get_paths(files, directory = os.path.join(self.preprocessed_directory, sub_directory))
     return self.get_paths(files, "preprocessed")
 
   def feature_list(self):
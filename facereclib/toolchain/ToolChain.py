@@ -3,6 +3,7 @@
 # Manuel Guenther <Manuel.Guenther@idiap.ch>
 
 import os
+import multiprocessing.pool
 import numpy
 import bob
 from .. import utils
@@ -10,12 +11,28 @@ from .. import utils
 class ToolChain:
   """This class includes functionalities for a default tool chain to produce verification scores"""
 
-  def __init__(self, file_selector):
-    """Initializes the tool chain object with the current file selector."""
+  def __init__(self, file_selector, model_block_size = 100, probe_block_size = 1000):
+    """Initializes the tool chain object with the current file selector.
+    During scoring, blocks of up to model_block_size models and probe_block_size probes are kept in memory and scored at once."""
     self.m_file_selector = file_selector
+    self.m_model_block_size = model_block_size
+    self.m_probe_block_size = probe_block_size
+    # the files that are currently loaded into the tools, see __load__
+    self.m_loaded = {}
 
 
 
+  def __load__(self, load_function, filename):
+    """Calls the given load function (e.g. tool.load_projector) for the given file, unless the same file was already loaded with it.
+    This keeps the loaded projectors and enrollers when the same tool chain executes several jobs, e.g., in a worker process."""
+    filename = str(filename)
+    stamp = (filename, os.path.getmtime(filename), os.path.getsize(filename)) if os.path.exists(filename) else (filename,)
+    key = (id(load_function.__self__), load_function.__name__)
+    if self.m_loaded.get(key) != stamp:
+      load_function(filename)
+      self.m_loaded[key] = stamp
+
+
   def __check_file__(self, filename, force, expected_file_size = 1):
     """Checks if the file exists and has size greater or equal to expected_file_size.
     If the file is to small, or if the force option is set to true, the file is removed.
@@ -30,12 +47,42 @@ class ToolChain:
     return False
 
 
+  def __checkpoint_file__(self, filename, force):
+    """Returns the name of the checkpoint file for the training of the given file.
+    If the force option is set, an old checkpoint is removed, so that the training starts from scratch."""
+    checkpoint_file = os.path.splitext(filename)[0] + '_checkpoint.hdf5'
+    if force and os.path.exists(checkpoint_file):
+      utils.debug("  .. Removing old checkpoint '%s'." % checkpoint_file)
+      os.remove(checkpoint_file)
+    return checkpoint_file
+
+
+  def __train_with_checkpoint__(self, train_function, tool, train_features, filename, force):
+    """Calls the given training function of the tool with checkpoints enabled; an interrupted training is automatically resumed.
+    After the training finished successfully, the checkpoint is removed."""
+    checkpoint_file = self.__checkpoint_file__(filename, force)
+    tool.set_checkpoint(checkpoint_file)
+    try:
+      train_function(train_features, str(filename))
+    finally:
+      tool.set_checkpoint(None)
+    if os.path.exists(checkpoint_file):
+      os.remove(checkpoint_file)
+
 
-  def preprocess_data(self, preprocessor, indices=None, force=False):
-    """Preprocesses the original data with the given preprocessor."""
+
+  def preprocess_data(self, preprocessor, indices=None, force=False, decoding_threads = 1, batch_size = 100):
+    """Preprocesses the original data with the given preprocessor.
+    Preprocessors with several outputs (see facereclib.preprocessing.CompositePreprocessor) return a dictionary of preprocessed data,
+    which are written into one sub-directory of the preprocessed directory per output name.
+    The original data is read in batches of the given size; with several decoding threads, the next batch is decoded in parallel while the current batch is preprocessed."""
     # get the file lists
     data_files = self.m_file_selector.original_data_list()
-    preprocessed_data_files = self.m_file_selector.preprocessed_data_list()
+    output_names = preprocessor.output_names if hasattr(preprocessor, 'output_names') else None
+    if output_names is None:
+      preprocessed_data_files = [(f,) for f in self.m_file_selector.preprocessed_data_list()]
+    else:
+      preprocessed_data_files = zip(*[self.m_file_selector.preprocessed_data_list(name) for name in output_names])
 
     # select a subset of keys to iterate
     if indices != None:
@@ -50,20 +97,55 @@ class ToolChain:
     # read annotation files
     annotation_list = self.m_file_selector.annotation_list()
 
-    for i in index_range:
-      preprocessed_data_file = preprocessed_data_files[i]
-
-      if not self.__check_file__(preprocessed_data_file, force):
-        data = preprocessor.read_original_data(str(data_files[i]))
-
-        # get the annotations; might be None
-        annotations = self.m_file_selector.get_annotations(annotation_list[i])
-
-        # call the preprocessor
-        preprocessed_data = preprocessor(data, annotations)
+    # check all outputs, so that incomplete outputs are removed when the force option is set
+    index_range = [i for i in index_range if not all([self.__check_file__(f, force) for f in preprocessed_data_files[i]])]
+    batches = [index_range[first : first + batch_size] for first in range(0, len(index_range), batch_size)]
+
+    def read_original_data(i):
+      return preprocessor.read_original_data(str(data_files[i]))
+
+    # decoding the original data releases the GIL, so that it can be performed in several threads;
+    # the HDF5 library is not thread-safe, though
+    if decoding_threads > 1 and self.m_file_selector.m_database.original_extension == '.hdf5':
+      utils.warn("The original data is stored in HDF5 files, which cannot be read in parallel; using a single thread")
+      decoding_threads = 1
+    decoding_threads = utils.work_queue.cores_for_job(decoding_threads)
+    pool = multiprocessing.pool.ThreadPool(decoding_threads) if decoding_threads > 1 and len(index_range) > 1 else None
+    created_directories = set()
+    try:
+      next_batch = pool.map_async(read_original_data, batches[0]) if pool and batches else None
+      for b, batch in enumerate(batches):
+        if pool:
+          batch_data = next_batch.get()
+          if b + 1 < len(batches):
+            next_batch = pool.map_async(read_original_data, batches[b+1])
+        else:
+          batch_data = [read_original_data(i) for i in batch]
+
+        # preprocess the images sorted by their resolution, so that the buffers of the preprocessor are reused
+        for k in sorted(range(len(batch)), key = lambda k: getattr(batch_data[k], 'shape', None)):
+          i = batch[k]
+          # get the annotations; might be None
+          annotations = self.m_file_selector.get_annotations(annotation_list[i])
+
+          # call the preprocessor
+          preprocessed_data = preprocessor(batch_data[k], annotations)
+          batch_data[k] = None
+          if output_names is not None:
+            preprocessed_data = [preprocessed_data[name] for name in output_names]
+          else:
+            preprocessed_data = [preprocessed_data]
 
-        utils.ensure_dir(os.path.dirname(preprocessed_data_file))
-        preprocessor.save_data(preprocessed_data, str(preprocessed_data_file))
+          for output, preprocessed_data_file in zip(preprocessed_data, preprocessed_data_files[i]):
+            directory = os.path.dirname(preprocessed_data_file)
+            if directory not in created_directories:
+              utils.ensure_dir(directory)
+              created_directories.add(directory)
+            preprocessor.save_data(output, str(preprocessed_data_file))
+    finally:
+      if pool:
+        pool.close()
+        pool.join()
 
 
 
@@ -80,33 +162,50 @@ class ToolChain:
       retval.append([preprocessor.read_data(str(f)) for f in client_files])
     return retval
 
-  def train_extractor(self, extractor, preprocessor, force = False):
-    """Trains the feature extractor using preprocessed data of the 'world' set, if the feature extractor requires training."""
-    if extractor.requires_training:
-      extractor_file = self.m_file_selector.extractor_file
+  def __consumers__(self, consumer, additional):
+    """Returns the list of (consumer, file selector) pairs, starting with the given consumer and the file selector of this tool chain."""
+    return [(consumer, self.m_file_selector)] + list(additional or [])
+
+
+  def train_extractor(self, extractor, preprocessor, force = False, additional_extractors = None):
+    """Trains the feature extractor using preprocessed data of the 'world' set, if the feature extractor requires training.
+    Additional extractors can be given as a list of (extractor, file_selector) pairs; they are trained with the same training data, which is read only once."""
+    train_data = {}
+    for extractor, file_selector in self.__consumers__(extractor, additional_extractors):
+      if not extractor.requires_training:
+        continue
+      extractor_file = file_selector.extractor_file
       if self.__check_file__(extractor_file, force, 1000):
         utils.info("- Extraction: extractor '%s' already exists." % extractor_file)
       else:
         utils.ensure_dir(os.path.dirname(extractor_file))
-        # read training files
-        if extractor.split_training_data_by_client:
-          train_files = self.m_file_selector.training_list('preprocessed', 'train_extractor', arrange_by_client = True)
-          train_data = self.__read_data_by_client__(train_files, preprocessor)
-          utils.info("- Extraction: training extractor '%s' using %d identities: " %(extractor_file, len(train_files)))
+        # read training files, if they have not been read for a previous extractor
+        by_client = extractor.split_training_data_by_client
+        if by_client not in train_data:
+          if by_client:
+            train_files = self.m_file_selector.training_list('preprocessed', 'train_extractor', arrange_by_client = True)
+            train_data[by_client] = self.__read_data_by_client__(train_files, preprocessor)
+          else:
+            train_files = self.m_file_selector.training_list('preprocessed', 'train_extractor')
+            train_data[by_client] = self.__read_data__(train_files, preprocessor)
+        if by_client:
+          utils.info("- Extraction: training extractor '%s' using %d identities: " %(extractor_file, len(train_data[by_client])))
         else:
-          train_files = self.m_file_selector.training_list('preprocessed', 'train_extractor')
-          train_data = self.__read_data__(train_files, preprocessor)
-          utils.info("- Extraction: training extractor '%s' using %d training files: " %(extractor_file, len(train_files)))
+          utils.info("- Extraction: training extractor '%s' using %d training files: " %(extractor_file, len(train_data[by_client])))
         # train model
-        extractor.train(train_data, extractor_file)
+        extractor.train(train_data[by_client], extractor_file)
 
 
 
-  def extract_features(self, extractor, preprocessor, indices = None, force=False):
-    """Extracts the features from the preprocessed data using the given extractor."""
-    extractor.load(str(self.m_file_selector.extractor_file))
+  def extract_features(self, extractor, preprocessor, indices = None, force=False, additional_extractors = None):
+    """Extracts the features from the preprocessed data using the given extractor.
+    Additional extractors can be given as a list of (extractor, file_selector) pairs.
+    Each preprocessed file is read only once, and the features of each extractor are written to the features directory of its file selector."""
+    extractors = self.__consumers__(extractor, additional_extractors)
+    for extractor, file_selector in extractors:
+      self.__load__(extractor.load, file_selector.extractor_file)
     data_files = self.m_file_selector.preprocessed_data_list()
-    feature_files = self.m_file_selector.feature_list()
+    feature_files = [file_selector.feature_list() for extractor, file_selector in extractors]
 
     # select a subset of indices to iterate
     if indices != None:
@@ -115,20 +214,24 @@ class ToolChain:
     else:
       index_range = range(len(data_files))
 
-    utils.ensure_dir(self.m_file_selector.features_directory)
-    utils.info("- Extraction: extracting %d features from directory '%s' to directory '%s'" % (len(index_range), self.m_file_selector.preprocessed_directory, self.m_file_selector.features_directory))
+    for extractor, file_selector in extractors:
+      utils.ensure_dir(file_selector.features_directory)
+      utils.info("- Extraction: extracting %d features from directory '%s' to directory '%s'" % (len(index_range), self.m_file_selector.preprocessed_directory, file_selector.features_directory))
     for i in index_range:
       data_file = data_files[i]
-      feature_file = feature_files[i]
+      # the extractors that still need to extract the feature of this file
+      missing = [e for e in range(len(extractors)) if not self.__check_file__(feature_files[e][i], force)]
 
-      if not self.__check_file__(feature_file, force):
+      if missing:
         # load data
         data = preprocessor.read_data(str(data_file))
-        # extract feature
-        feature = extractor(data)
-        # Save feature
-        utils.ensure_dir(os.path.dirname(feature_file))
-        extractor.save_feature(feature, str(feature_file))
+        for e in missing:
+          extractor, feature_file = extractors[e][0], feature_files[e][i]
+          # extract feature
+          feature = extractor(data)
+          # Save feature
+          utils.ensure_dir(os.path.dirname(feature_file))
+          extractor.save_feature(feature, str(feature_file))
 
 
 
@@ -145,38 +248,50 @@ class ToolChain:
       retval.append([reader.read_feature(str(feature)) for feature in client_files])
     return retval
 
-  def train_projector(self, tool, extractor, force=False):
-    """Train the feature projector with the extracted features of the world group."""
-    if tool.requires_projector_training:
-      projector_file = self.m_file_selector.projector_file
+  def train_projector(self, tool, extractor, force=False, additional_tools = None):
+    """Train the feature projector with the extracted features of the world group.
+    Additional tools can be given as a list of (tool, file_selector) pairs; they are trained with the same training features, which are read only once."""
+    train_features = {}
+    for tool, file_selector in self.__consumers__(tool, additional_tools):
+      if not tool.requires_projector_training:
+        continue
+      projector_file = file_selector.projector_file
 
       if self.__check_file__(projector_file, force, 1000):
         utils.info("- Projection: projector '%s' already exists." % projector_file)
       else:
         utils.ensure_dir(os.path.dirname(projector_file))
-        # train projector
-        if tool.split_training_features_by_client:
-          train_files = self.m_file_selector.training_list('features', 'train_projector', arrange_by_client = True)
-          train_features = self.__read_features_by_client__(train_files, extractor)
-          utils.info("- Projection: training projector '%s' using %d identities: " %(projector_file, len(train_files)))
+        # read the training features, if they have not been read for a previous tool
+        by_client = tool.split_training_features_by_client
+        if by_client not in train_features:
+          if by_client:
+            train_files = self.m_file_selector.training_list('features', 'train_projector', arrange_by_client = True)
+            train_features[by_client] = self.__read_features_by_client__(train_files, extractor)
+          else:
+            train_files = self.m_file_selector.training_list('features', 'train_projector')
+            train_features[by_client] = self.__read_features__(train_files, extractor)
+        if by_client:
+          utils.info("- Projection: training projector '%s' using %d identities: " %(projector_file, len(train_features[by_client])))
         else:
-          train_files = self.m_file_selector.training_list('features', 'train_projector')
-          train_features = self.__read_features__(train_files, extractor)
-          utils.info("- Projection: training projector '%s' using %d training files: " %(projector_file, len(train_files)))
+          utils.info("- Projection: training projector '%s' using %d training files: " %(projector_file, len(train_features[by_client])))
 
         # perform training
-        tool.train_projector(train_features, str(projector_file))
+        self.__train_with_checkpoint__(tool.train_projector, tool, train_features[by_client], projector_file, force)
 
 
 
-  def project_features(self, tool, extractor, indices = None, force=False):
-    """Projects the features for all files of the database."""
-    # load the projector file
-    if tool.performs_projection:
-      tool.load_projector(str(self.m_file_selector.projector_file))
+  def project_features(self, tool, extractor, indices = None, force=False, additional_tools = None):
+    """Projects the features for all files of the database.
+    Additional tools can be given as a list of (tool, file_selector) pairs.
+    Each feature file is read only once, and the projected features of each tool are written to the projected directory of its file selector."""
+    tools = [(tool, file_selector) for tool, file_selector in self.__consumers__(tool, additional_tools) if tool.performs_projection]
+    if tools:
+      # load the projector files
+      for tool, file_selector in tools:
+        self.__load__(tool.load_projector, file_selector.projector_file)
 
       feature_files = self.m_file_selector.feature_list()
-      projected_files = self.m_file_selector.projected_list()
+      projected_files = [file_selector.projected_list() for tool, file_selector in tools]
 
       # select a subset of indices to iterate
       if indices != None:
@@ -185,21 +300,25 @@ class ToolChain:
       else:
         index_range = range(len(feature_files))
 
-      utils.ensure_dir(self.m_file_selector.projected_directory)
-      utils.info("- Projection: projecting %d features from directory '%s' to directory '%s'" % (len(index_range), self.m_file_selector.features_directory, self.m_file_selector.projected_directory))
+      for tool, file_selector in tools:
+        utils.ensure_dir(file_selector.projected_directory)
+        utils.info("- Projection: projecting %d features from directory '%s' to directory '%s'" % (len(index_range), self.m_file_selector.features_directory, file_selector.projected_directory))
       # extract the features
       for i in index_range:
         feature_file = feature_files[i]
-        projected_file = projected_files[i]
+        # the tools that still need to project this feature
+        missing = [t for t in range(len(tools)) if not self.__check_file__(projected_files[t][i], force)]
 
-        if not self.__check_file__(projected_file, force):
+        if missing:
           # load feature
           feature = extractor.read_feature(str(feature_file))
-          # project feature
-          projected = tool.project(feature)
-          # write it
-          utils.ensure_dir(os.path.dirname(projected_file))
-          tool.save_feature(projected, str(projected_file))
+          for t in missing:
+            tool, projected_file = tools[t][0], projected_files[t][i]
+            # project feature
+            projected = tool.project(feature)
+            # write it
+            utils.ensure_dir(os.path.dirname(projected_file))
+            tool.save_feature(projected, str(projected_file))
 
 
 
@@ -214,14 +333,14 @@ class ToolChain:
       else:
         utils.ensure_dir(os.path.dirname(enroller_file))
         # first, load the projector
-        tool.load_projector(str(self.m_file_selector.projector_file))
+        self.__load__(tool.load_projector, self.m_file_selector.projector_file)
         # training models
         train_files = self.m_file_selector.training_list('projected' if tool.use_projected_features_for_enrollment else 'features', 'train_enroller', arrange_by_client = True)
         train_features = self.__read_features_by_client__(train_files, reader)
 
         # perform training
         utils.info("- Enrollment: training enroller '%s' using %d identities: " %(enroller_file, len(train_features)))
-        tool.train_enroller(train_features, str(enroller_file))
+        self.__train_with_checkpoint__(tool.train_enroller, tool, train_features, enroller_file, force)
 
 
 
@@ -231,9 +350,9 @@ class ToolChain:
        depending on your setup of the base class Tool."""
 
     # read the projector file, if needed
-    tool.load_projector(self.m_file_selector.projector_file)
+    self.__load__(tool.load_projector, self.m_file_selector.projector_file)
     # read the model enrollment file
-    tool.load_enroller(self.m_file_selector.enroller_file)
+    self.__load__(tool.load_enroller, self.m_file_selector.enroller_file)
 
     # which tool to use to read the features...
     reader = tool if tool.use_projected_features_for_enrollment else extractor
@@ -292,40 +411,35 @@ class ToolChain:
 
 
 
-  def __scores__(self, model, probe_files):
-    """Compute simple scores for the given model."""
-    scores = numpy.ndarray((1,len(probe_files)), 'float64')
+  def __read_probes__(self, probe_files):
+    """Reads the given probe files (or probe file sets) into memory."""
     if self.m_file_selector.uses_probe_file_sets():
-      assert isinstance(probe_files[0], list)
-      # Loops over the probe sets
-      for i in range(len(probe_files)):
-        # read probes from probe sets
-        probes = [self.m_tool.read_probe(str(probe_file)) for probe_file in probe_files[i]]
-        # compute score
-        scores[0,i] = self.m_tool.score_for_multiple_probes(model, probes)
+      return [[self.m_tool.read_probe(str(probe_file)) for probe_file in file_set] for file_set in probe_files]
     else:
-      # Loops over the probes
-      for i in range(len(probe_files)):
-        # read probe
-        probe = self.m_tool.read_probe(str(probe_files[i]))
-        # compute score
-        scores[0,i] = self.m_tool.score(model, probe)
-    # Returns the scores
+      return [self.m_tool.read_probe(str(probe_file)) for probe_file in probe_files]
+
+  def __scores__(self, models, probe_files = None, preloaded_probes = None):
+    """Computes the score matrix between the given models and probes.
+    The probes are read (or taken from the preloaded probes) in blocks, and each block is scored against all models at once."""
+    number_of_probes = len(preloaded_probes) if preloaded_probes is not None else len(probe_files)
+    scores = numpy.ndarray((len(models), number_of_probes), 'float64')
+    for first in range(0, number_of_probes, self.m_probe_block_size):
+      last = min(first + self.m_probe_block_size, number_of_probes)
+      probes = preloaded_probes[first:last] if preloaded_probes is not None else self.__read_probes__(probe_files[first:last])
+      scores[:,first:last] = self.m_tool.score_matrix(models, probes, self.m_file_selector.uses_probe_file_sets())
     return scores
 
-  def __scores_preloaded__(self, model, preloaded_probes):
-    """Compute simple scores for the given model."""
-    scores = numpy.ndarray((1,len(preloaded_probes)), 'float64')
-
-    # Loops over the probes
-    for i in range(len(preloaded_probes)):
-      # take pre-loaded probe
-      probe = preloaded_probes[i]
-      # compute score
-      scores[0,i] = self.m_tool.score(model, probe)
+  def __model_blocks__(self, model_ids, score_file_function, force):
+    """Returns the model ids, for which the score file does not exist yet, in blocks of at most m_model_block_size ids."""
+    model_ids = [model_id for model_id in model_ids if not self.__score_file_exists__(score_file_function(model_id), force)]
+    return [model_ids[i:i+self.m_model_block_size] for i in range(0, len(model_ids), self.m_model_block_size)]
 
-    # Returns the scores
-    return scores
+  def __score_file_exists__(self, score_file, force):
+    """Checks if the given score file is already there."""
+    if self.__check_file__(score_file, force):
+      utils.warn("score file '%s' already exists." % (score_file))
+      return True
+    return False
 
 
   def __probe_split__(self, selected_probe_objects, all_probe_objects, all_preloaded_probes):
@@ -356,43 +470,45 @@ class ToolChain:
     if preload_probes:
       utils.info("- Scoring: preloading probe files of group '%s'" % group)
       all_probe_objects = self.m_file_selector.probe_objects(group)
-      all_probe_files = self.m_file_selector.get_paths(self.m_file_selector.probe_objects(group), 'projected' if self.m_use_projected_dir else 'features')
+      all_probe_files = self.m_file_selector.get_paths(all_probe_objects, 'projected' if self.m_use_projected_dir else 'features')
       # read all probe files into memory
-      if self.m_file_selector.uses_probe_file_sets():
-        all_preloaded_probes = [[self.m_tool.read_probe(str(probe_file)) for probe_file in file_set] for file_set in all_probe_files]
-      else:
-        all_preloaded_probes = [self.m_tool.read_probe(str(probe_file)) for probe_file in all_probe_files]
+      all_preloaded_probes = self.__read_probes__(all_probe_files)
 
     if compute_zt_norm:
       utils.info("- Scoring: computing score matrix A for group '%s'" % group)
     else:
       utils.info("- Scoring: computing scores for group '%s'" % group)
 
-    # Computes the raw scores for each model
-    for model_id in model_ids:
-      # test if the file is already there
-      score_file = self.m_file_selector.a_file(model_id, group) if compute_zt_norm else self.m_file_selector.no_norm_file(model_id, group)
-      if self.__check_file__(score_file, force):
-        utils.warn("score file '%s' already exists." % (score_file))
-      else:
-        # get the probe split
+    score_file_function = lambda model_id: self.m_file_selector.a_file(model_id, group) if compute_zt_norm else self.m_file_selector.no_norm_file(model_id, group)
+    # Computes the raw scores for blocks of models
+    for model_block in self.__model_blocks__(model_ids, score_file_function, force):
+      # models that are compared to the same probes are scored together
+      model_groups = {}
+      for model_id in model_block:
         current_probe_objects = self.m_file_selector.probe_objects_for_model(model_id, group)
-        model = self.m_tool.read_model(self.m_file_selector.model_file(model_id, group))
+        key = tuple(probe_object.id for probe_object in current_probe_objects)
+        if key not in model_groups:
+          model_groups[key] = (current_probe_objects, [])
+        model_groups[key][1].append(model_id)
+
+      for current_probe_objects, current_model_ids in model_groups.itervalues():
+        models = [self.m_tool.read_model(self.m_file_selector.model_file(model_id, group)) for model_id in current_model_ids]
         if preload_probes:
-          # select the probe files for this model from all probes
+          # select the probe files for these models from all probes
           current_preloaded_probes = self.__probe_split__(current_probe_objects, all_probe_objects, all_preloaded_probes)
           # compute A matrix
-          a = self.__scores_preloaded__(model, current_preloaded_probes)
+          a = self.__scores__(models, preloaded_probes = current_preloaded_probes)
         else:
           current_probe_files = self.m_file_selector.get_paths(current_probe_objects, 'projected' if self.m_use_projected_dir else 'features')
-          a = self.__scores__(model, current_probe_files)
+          a = self.__scores__(models, current_probe_files)
 
-        if compute_zt_norm:
-          # write A matrix only when you want to compute zt norm afterwards
-          bob.io.save(a, self.m_file_selector.a_file(model_id, group))
+        for i, model_id in enumerate(current_model_ids):
+          if compute_zt_norm:
+            # write A matrix only when you want to compute zt norm afterwards
+            bob.io.save(a[i:i+1,:], self.m_file_selector.a_file(model_id, group))
 
-        # Save scores to text file
-        self.__save_scores__(self.m_file_selector.no_norm_file(model_id, group), a, current_probe_objects, self.m_file_selector.client_id(model_id))
+          # Save scores to text file
+          self.__save_scores__(self.m_file_selector.no_norm_file(model_id, group), a[i:i+1,:], current_probe_objects, self.m_file_selector.client_id(model_id))
 
   def __scores_b__(self, model_ids, group, force, preload_probes):
     """Computes B scores."""
@@ -400,29 +516,20 @@ class ToolChain:
     z_probe_objects = self.m_file_selector.z_probe_objects(group)
     z_probe_files = self.m_file_selector.get_paths(z_probe_objects, 'projected' if self.m_use_projected_dir else 'features')
     # preload the probe files for a faster access (and fewer network load)
+    preloaded_z_probes = None
     if preload_probes:
       utils.info("- Scoring: preloading Z-probe files of group '%s'" % group)
       # read all probe files into memory
-      if self.m_file_selector.uses_probe_file_sets():
-        preloaded_z_probes = [[self.m_tool.read_probe(str(z_probe_file)) for z_probe_file in file_set] for file_set in z_probe_files]
-      else:
-        preloaded_z_probes = [self.m_tool.read_probe(str(z_probe_file)) for z_probe_file in z_probe_files]
+      preloaded_z_probes = self.__read_probes__(z_probe_files)
 
     utils.info("- Scoring: computing score matrix B for group '%s'" % group)
 
     # Loads the models
-    for model_id in model_ids:
-      # test if the file is already there
-      score_file = self.m_file_selector.b_file(model_id, group)
-      if self.__check_file__(score_file, force):
-        utils.warn("score file '%s' already exists." % (score_file))
-      else:
-        model = self.m_tool.read_model(self.m_file_selector.model_file(model_id, group))
-        if preload_probes:
-          b = self.__scores_preloaded__(model, preloaded_z_probes)
-        else:
-          b = self.__scores__(model, z_probe_files)
-        bob.io.save(b, score_file)
+    for model_block in self.__model_blocks__(model_ids, lambda model_id: self.m_file_selector.b_file(model_id, group), force):
+      models = [self.m_tool.read_model(self.m_file_selector.model_file(model_id, group)) for model_id in model_block]
+      b = self.__scores__(models, z_probe_files, preloaded_z_probes)
+      for i, model_id in enumerate(model_block):
+        bob.io.save(b[i:i+1,:], self.m_file_selector.b_file(model_id, group))
 
   def __scores_c__(self, t_model_ids, group, force, preload_probes):
     """Computes C scores."""
@@ -431,29 +538,20 @@ class ToolChain:
     probe_files = self.m_file_selector.get_paths(probe_objects, 'projected' if self.m_use_projected_dir else 'features')
 
     # preload the probe files for a faster access (and fewer network load)
+    preloaded_probes = None
     if preload_probes:
       utils.info("- Scoring: preloading probe files of group '%s'" % group)
       # read all probe files into memory
-      if self.m_file_selector.uses_probe_file_sets():
-        preloaded_probes = [[self.m_tool.read_probe(str(probe_file)) for probe_file in file_set] for file_set in all_probe_files]
-      else:
-        preloaded_probes = [self.m_tool.read_probe(str(probe_file)) for probe_file in probe_files]
+      preloaded_probes = self.__read_probes__(probe_files)
 
     utils.info("- Scoring: computing score matrix C for group '%s'" % group)
 
     # Computes the raw scores for the T-Norm model
-    for t_model_id in t_model_ids:
-      # test if the file is already there
-      score_file = self.m_file_selector.c_file(t_model_id, group)
-      if self.__check_file__(score_file, force):
-        utils.warn("score file '%s' already exists." % (score_file))
-      else:
-        t_model = self.m_tool.read_model(self.m_file_selector.t_model_file(t_model_id, group))
-        if preload_probes:
-          c = self.__scores_preloaded__(t_model, preloaded_probes)
-        else:
-          c = self.__scores__(t_model, probe_files)
-        bob.io.save(c, score_file)
+    for t_model_block in self.__model_blocks__(t_model_ids, lambda t_model_id: self.m_file_selector.c_file(t_model_id, group), force):
+      t_models = [self.m_tool.read_model(self.m_file_selector.t_model_file(t_model_id, group)) for t_model_id in t_model_block]
+      c = self.__scores__(t_models, probe_files, preloaded_probes)
+      for i, t_model_id in enumerate(t_model_block):
+        bob.io.save(c[i:i+1,:], self.m_file_selector.c_file(t_model_id, group))
 
   def __scores_d__(self, t_model_ids, group, force, preload_probes):
     """Computes D scores."""
@@ -462,13 +560,11 @@ class ToolChain:
     z_probe_files = self.m_file_selector.get_paths(z_probe_objects, 'projected' if self.m_use_projected_dir else 'features')
 
     # preload the probe files for a faster access (and fewer network load)
+    preloaded_z_probes = None
     if preload_probes:
       utils.info("- Scoring: preloading Z-probe files of group '%s'" % group)
       # read all probe files into memory
-      if self.m_file_selector.uses_probe_file_sets():
-        preloaded_z_probes = [[self.m_tool.read_probe(str(z_probe_file)) for z_probe_file in file_set] for file_set in z_probe_files]
-      else:
-        preloaded_z_probes = [self.m_tool.read_probe(str(z_probe_file)) for z_probe_file in z_probe_files]
+      preloaded_z_probes = self.__read_probes__(z_probe_files)
 
     utils.info("- Scoring: computing score matrix D for group '%s'" % group)
 
@@ -478,22 +574,15 @@ class ToolChain:
       z_probe_ids.append(z_probe_object.client_id)
 
     # Loads the T-Norm models
-    for t_model_id in t_model_ids:
-      # test if the file is already there
-      score_file = self.m_file_selector.d_same_value_file(t_model_id, group)
-      if self.__check_file__(score_file, force):
-        utils.warn("score file '%s' already exists." % (score_file))
-      else:
-        t_model = self.m_tool.read_model(self.m_file_selector.t_model_file(t_model_id, group))
-        if preload_probes:
-          d = self.__scores_preloaded__(t_model, preloaded_z_probes)
-        else:
-          d = self.__scores__(t_model, z_probe_files)
-        bob.io.save(d, self.m_file_selector.d_file(t_model_id, group))
+    for t_model_block in self.__model_blocks__(t_model_ids, lambda t_model_id: self.m_file_selector.d_same_value_file(t_model_id, group), force):
+      t_models = [self.m_tool.read_model(self.m_file_selector.t_model_file(t_model_id, group)) for t_model_id in t_model_block]
+      d = self.__scores__(t_models, z_probe_files, preloaded_z_probes)
+      for i, t_model_id in enumerate(t_model_block):
+        bob.io.save(d[i:i+1,:], self.m_file_selector.d_file(t_model_id, group))
 
         t_client_id = [self.m_file_selector.client_id(t_model_id)]
         d_same_value_tm = bob.machine.ztnorm_same_value(t_client_id, z_probe_ids)
-        bob.io.save(d_same_value_tm, score_file)
+        bob.io.save(d_same_value_tm, self.m_file_selector.d_same_value_file(t_model_id, group))
 
 
   def compute_scores(self, tool, compute_zt_norm, force = False, indices = None, groups = ['dev', 'eval'], types = ['A', 'B', 'C', 'D'], preload_probes = False):
@@ -503,8 +592,8 @@ class ToolChain:
     self.m_use_projected_dir = hasattr(tool, 'project')
 
     # load the projector and the enroller, if needed
-    tool.load_projector(self.m_file_selector.projector_file)
-    tool.load_enroller(self.m_file_selector.enroller_file)
+    self.__load__(tool.load_projector, self.m_file_selector.projector_file)
+    self.__load__(tool.load_enroller, self.m_file_selector.enroller_file)
 
     for group in groups:
       # get model ids
@@ -54,56 +54,73 @@ class BIC (Tool):
   def __compare__(self, feature_1, feature_2):
     """Computes a vector of similarities"""
     assert feature_1.shape == feature_2.shape
+    if isinstance(self.m_distance_function, numpy.ufunc):
+      # element-wise functions (like numpy.subtract) are applied to the whole feature at once
+      return self.m_distance_function(feature_1, feature_2).astype(numpy.float64)
     sim = numpy.ndarray((feature_1.shape[0],), dtype = numpy.float64)
     for i in range(feature_1.shape[0]):
       sim[i] = self.m_distance_function(feature_1[i], feature_2[i])
     return sim
 
   def __intra_extra_pairs__(self, train_features):
-    """Computes intrapersonal and extrapersonal pairs of features from given training files"""
+    """Computes the indices of intrapersonal and extrapersonal pairs of the training features, when all features are stacked client by client.
+    The pairs (and their order) are the same as when enumerating all pairs of all clients;
+    but when the number of pairs is limited, only the selected pair indices are decoded, so that the O(N^2) extrapersonal pairs are never generated."""
+    counts = numpy.array([len(client) for client in train_features], numpy.int64)
+    starts = numpy.hstack(([0], numpy.cumsum(counts)))
+    feature_count = starts[-1]
+
     # generate intrapersonal pairs
-    intra_pairs = []
-    for client in range(len(train_features)):
-      for c in range(len(train_features[client])-1):
-        for c2 in range (c+1, len(train_features[client])):
-          intra_pairs.append((train_features[client][c], train_features[client][c2]))
-
-    # generate extrapersonal pairs
-    extra_pairs = []
-    for client in range(len(train_features)):
-      for c in range(len(train_features[client])):
-        for impostor in range(len(train_features)):
-          if client != impostor:
-            for i in range(len(train_features[impostor])):
-              extra_pairs.append((train_features[client][c], train_features[impostor][i]))
+    intra_pairs = numpy.vstack([numpy.zeros((0,2), numpy.int64)] + [numpy.transpose(numpy.triu_indices(counts[client], 1)) + starts[client] for client in range(len(counts))])
+
+    # each feature builds extrapersonal pairs with all features of the other clients
+    client_of_feature = numpy.repeat(numpy.arange(len(counts)), counts)
+    offsets = numpy.hstack(([0], numpy.cumsum(feature_count - counts[client_of_feature])))
+    extra_pair_count = offsets[-1]
 
     # limit the number of pairs by random selection
+    extra_indices = None
     if self.m_maximum_pair_count != None:
       if len(intra_pairs) > self.m_maximum_pair_count:
         utils.info("  -> Limiting intrapersonal pairs from %d to %d" %(len(intra_pairs),self.m_maximum_pair_count))
-        intra_pairs = [intra_pairs[i] for i in utils.quasi_random_indices(len(intra_pairs), self.m_maximum_pair_count)]
-      if len(extra_pairs) > self.m_maximum_pair_count:
-        utils.info("  -> Limiting extrapersonal pairs from %d to %d" %(len(extra_pairs), self.m_maximum_pair_count))
-        extra_pairs = [extra_pairs[i] for i in utils.quasi_random_indices(len(extra_pairs), self.m_maximum_pair_count)]
+        intra_pairs = intra_pairs[utils.quasi_random_indices(len(intra_pairs), self.m_maximum_pair_count)]
+      if extra_pair_count > self.m_maximum_pair_count:
+        utils.info("  -> Limiting extrapersonal pairs from %d to %d" %(extra_pair_count, self.m_maximum_pair_count))
+        extra_indices = numpy.array(utils.quasi_random_indices(extra_pair_count, self.m_maximum_pair_count), numpy.int64)
+    if extra_indices is None:
+      extra_indices = numpy.arange(extra_pair_count)
+
+    # decode the extrapersonal pair indices: the first feature, and the index of the second feature when skipping the features of the same client
+    first = numpy.searchsorted(offsets, extra_indices, 'right') - 1
+    second = extra_indices - offsets[first]
+    client = client_of_feature[first]
+    second += (second >= starts[client]) * counts[client]
+    extra_pairs = numpy.transpose((first, second))
 
     return (intra_pairs, extra_pairs)
 
-  def __trainset_for__(self, pairs):
-    """Computes the array containing the comparison results for the given set of image pairs."""
-    comparison_results = numpy.vstack([self.__compare__(f1, f2) for (f1, f2) in pairs])
-    return comparison_results
+  def __trainset_for__(self, features, pairs, batch_size = 10000):
+    """Computes the array containing the comparison results for the given pairs of feature indices, processing the pairs in batches."""
+    if isinstance(self.m_distance_function, numpy.ufunc):
+      comparison_results = numpy.ndarray((len(pairs),) + features.shape[1:], numpy.float64)
+      for first in range(0, len(pairs), batch_size):
+        batch = pairs[first:first+batch_size]
+        comparison_results[first:first+len(batch)] = self.m_distance_function(features[batch[:,0]], features[batch[:,1]])
+      return comparison_results
+    return numpy.vstack([self.__compare__(features[i], features[j]) for (i, j) in pairs])
 
   def train_enroller(self, train_features, enroller_file):
     """Trains the IEC Tool, i.e., computes intrapersonal and extrapersonal subspaces"""
 
     # compute intrapersonal and extrapersonal pairs
     intra_pairs, extra_pairs = self.__intra_extra_pairs__(train_features)
+    features = numpy.array([feature for client in train_features for feature in client])
 
     # train the BIC Machine with these pairs
     utils.info("  -> Computing %d intrapersonal results" % len(intra_pairs))
-    intra_vectors = self.__trainset_for__(intra_pairs)
+    intra_vectors = self.__trainset_for__(features, intra_pairs)
     utils.info("  -> Computing %d extrapersonal results" % len(extra_pairs))
-    extra_vectors = self.__trainset_for__(extra_pairs)
+    extra_vectors = self.__trainset_for__(features, extra_pairs)
 
     utils.info("  -> Training BIC machine")
     trainer = bob.trainer.BICTrainer(self.m_M_I, self.m_M_E) if self.m_M_I != None else bob.trainer.BICTrainer()
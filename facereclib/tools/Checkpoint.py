@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Manuel Guenther <Manuel.Guenther@idiap.ch>
+
+import bob
+import os
+
+from .. import utils
+
+
+class Checkpoint:
+  """Stores the state of an iterative (EM) training in an HDF5 file, so that an interrupted training can be resumed.
+
+  The state consists of the training stage, the number of finished iterations, the current machine parameters and the latent variables of the trainer.
+  The random number generators of the bob trainers are only used during their initialization.
+  Hence, only the seed is stored, and the (deterministic) initialization is repeated before the state is restored.
+  If no file name is given, the checkpoint is inactive and nothing is written.
+  """
+
+  # The order of the training stages; a checkpoint of a later stage contains everything that is required from the earlier stages
+  STAGES = ('k-means', 'gmm', 'isv', 'ivector', 'jfa-v', 'jfa-u', 'jfa-d', 'plda')
+
+  def __init__(self, filename, seed, interval = 1):
+    self.m_filename = filename
+    self.m_seed = seed
+    self.m_interval = interval
+    self.m_stage = None
+    self.m_iteration = 0
+    self.m_average = None
+
+    if filename is not None and os.path.exists(filename):
+      hdf5file = bob.io.HDF5File(filename)
+      if hdf5file.read('seed') != seed:
+        utils.warn("Ignoring checkpoint '%s' since it was written with a different seed" % filename)
+      else:
+        self.m_stage = hdf5file.read('stage')
+        self.m_iteration = int(hdf5file.read('iteration'))
+        if hdf5file.has_key('average'):
+          self.m_average = hdf5file.read('average')
+        utils.info("  -> Resuming training from checkpoint '%s' in stage '%s' after %d iterations" % (filename, self.m_stage, self.m_iteration))
+
+  def active(self):
+    """Returns True if this checkpoint writes its state to file."""
+    return self.m_filename is not None
+
+  def resumes(self, stage):
+    """Returns True if the checkpoint was written during the given stage."""
+    return self.m_stage == stage
+
+  def passed(self, stage):
+    """Returns True if the checkpoint was written during a stage that comes after the given one."""
+    return self.m_stage is not None and self.STAGES.index(self.m_stage) > self.STAGES.index(stage)
+
+  def machine_file(self, name):
+    """Returns the checkpoint file opened in the group of the additional machine with the given name."""
+    hdf5file = bob.io.HDF5File(self.m_filename)
+    hdf5file.cd('/machines/' + name)
+    return hdf5file
+
+
+  def restore(self, machine, parameters, trainer = None, latent = ()):
+    """Sets the stored parameters to the machine and the stored latent variables to the trainer."""
+    hdf5file = bob.io.HDF5File(self.m_filename)
+    for name in parameters:
+      setattr(machine, name, hdf5file.read('/state/' + name))
+    for name in latent:
+      hdf5file.cd('/latent/' + name)
+      setattr(trainer, name, [hdf5file.read(str(i)) for i in range(hdf5file.read('count'))])
+
+
+  def save(self, stage, iteration, machine, parameters, trainer = None, latent = (), average = None, machines = {}, force = False):
+    """Writes the state of the given stage after the given number of iterations, if required by the checkpoint interval.
+    The file is written to a temporary location first, so that a killed job cannot leave a corrupted checkpoint behind."""
+    if not self.active() or (iteration % self.m_interval and not force):
+      return
+    temp_file = self.m_filename + '.tmp'
+    hdf5file = bob.io.HDF5File(temp_file, 'w')
+    hdf5file.set('seed', self.m_seed)
+    hdf5file.set('stage', stage)
+    hdf5file.set('iteration', iteration)
+    if average is not None:
+      hdf5file.set('average', average)
+
+    hdf5file.create_group('/state')
+    for name in parameters:
+      hdf5file.set('/state/' + name, getattr(machine, name))
+
+    hdf5file.create_group('/latent')
+    for name in latent:
+      values = getattr(trainer, name)
+      hdf5file.create_group('/latent/' + name)
+      hdf5file.cd('/latent/' + name)
+      hdf5file.set('count', len(values))
+      for i, value in enumerate(values):
+        hdf5file.set(str(i), value)
+
+    hdf5file.create_group('/machines')
+    for name, additional in machines.iteritems():
+      hdf5file.create_group('/machines/' + name)
+      hdf5file.cd('/machines/' + name)
+      additional.save(hdf5file)
+    del hdf5file
+
+    os.rename(temp_file, self.m_filename)
+    utils.debug(" .... Wrote checkpoint '%s' in stage '%s' after %d iterations" % (self.m_filename, stage, iteration))
+
+
+
+def _converged(previous, average, convergence_threshold):
+  """The convergence criterion of the bob.trainer.EMTrainer"""
+  return abs((previous - average) / previous) <= convergence_threshold
+
+
+def train_em(trainer, machine, data, max_iterations, checkpoint, stage, parameters, latent = (), convergence_threshold = None, e_step = None, step = '', initialize = True, machines = {}):
+  """Runs the EM loop of the given bob trainer in the same way as trainer.train(machine, data) does, and stores the state in the given checkpoint after each M-step.
+
+  If the checkpoint was written in the given stage, the training continues from there; if it was written in a later stage, nothing is done.
+  The ``parameters`` are the names of the machine attributes that are updated by the M-step, ``latent`` are the names of the trainer attributes that are kept between E-steps.
+  An ``e_step`` function can be given to replace the E-step of the trainer (e.g., to compute it in parallel); the ``step`` is the suffix of the JFA sub-step functions.
+  The ``machines`` are additional machines (e.g., the UBM) that are stored with the checkpoint.
+  """
+  if checkpoint.passed(stage):
+    return
+  if not checkpoint.active() and e_step is None and initialize and not step:
+    # nothing to store, so let bob do the work
+    trainer.train(machine, data)
+    return
+
+  if initialize:
+    trainer.initialize(machine, data)
+
+  first_iteration, previous = 0, None
+  if checkpoint.resumes(stage):
+    # overwrite the random initialization with the stored state
+    checkpoint.restore(machine, parameters, trainer, latent)
+    first_iteration, previous = checkpoint.m_iteration, checkpoint.m_average
+
+  if e_step is None:
+    e_step = lambda: getattr(trainer, 'e_step' + step)(machine, data)
+  e_step()
+  average = trainer.compute_likelihood(machine) if convergence_threshold is not None else None
+
+  for iteration in range(first_iteration, max_iterations):
+    if previous is not None and _converged(previous, average, convergence_threshold):
+      break
+    getattr(trainer, 'm_step' + step)(machine, data)
+    # the state before the next E-step is stored, so that resuming does not change the result
+    checkpoint.save(stage, iteration + 1, machine, parameters, trainer, latent, average, machines, force = iteration + 1 == max_iterations)
+    e_step()
+    if convergence_threshold is not None:
+      previous, average = average, trainer.compute_likelihood(machine)
+
+  getattr(trainer, 'finalize' + step)(machine, data)
@@ -7,10 +7,21 @@ import numpy
 import math
 
 from .Tool import Tool
+from .. import utils
+
+def _absolute_values(jets, with_phases):
+  """Returns the absolute values of the given array of jets"""
+  return jets[...,0,:] if with_phases else jets
 
 class GaborJets (Tool):
   """Tool chain for computing Gabor jets, Gabor graphs, and Gabor graph comparisons"""
 
+  # numpy implementations of the Gabor jet similarity functions, which compare arrays of jets (in the last dimensions) at once
+  SIMILARITY_KERNELS = {
+      'SCALAR_PRODUCT' : lambda jets1, jets2, with_phases: numpy.sum(_absolute_values(jets1, with_phases) * _absolute_values(jets2, with_phases), axis=-1),
+      'CANBERRA' : lambda jets1, jets2, with_phases: numpy.mean(1. - numpy.abs(_absolute_values(jets1, with_phases) - _absolute_values(jets2, with_phases)) / (_absolute_values(jets1, with_phases) + _absolute_values(jets2, with_phases)), axis=-1),
+  }
+
   def __init__(
       self,
       # parameters for the tool
@@ -48,18 +59,20 @@ class GaborJets (Tool):
     self.m_graph_machine = bob.machine.GaborGraphMachine()
 
     # the Gabor wavelet transform; used by (some of) the Gabor jet similarities
-    gwt = bob.ip.GaborWaveletTransform(
-        number_of_scales = gabor_scales,
-        number_of_angles = gabor_directions,
-        sigma = gabor_sigma,
-        k_max = gabor_maximum_frequency,
-        k_fac = gabor_frequency_step,
-        pow_of_k = gabor_power_of_k,
-        dc_free = gabor_dc_free
-    )
+    gwt = utils.gabor.gabor_transform(
+        gabor_directions = gabor_directions,
+        gabor_scales = gabor_scales,
+        gabor_sigma = gabor_sigma,
+        gabor_maximum_frequency = gabor_maximum_frequency,
+        gabor_frequency_step = gabor_frequency_step,
+        gabor_power_of_k = gabor_power_of_k,
+        gabor_dc_free = gabor_dc_free
+    ).gwt()
 
     # jet comparison function
     self.m_similarity_function = bob.machine.GaborJetSimilarity(gabor_jet_similarity_type, gwt)
+    # vectorized implementation of the jet comparison function, if available
+    self.m_similarity_kernel = self.SIMILARITY_KERNELS.get(str(gabor_jet_similarity_type).split('.')[-1])
 
     # how to proceed with multiple features per model
     self.m_jet_scoring = {
@@ -110,28 +123,44 @@ class GaborJets (Tool):
       return model
 
 
-  def score(self, model, probe):
-    """Computes the score of the probe and the model"""
-    if self.m_jet_scoring is None:
-      # compute sum of Gabor jet similarities between averaged model graph and probe graph
-      return numpy.average([self.m_similarity_function(model[n], probe[n]) for n in range(model.shape[0])])
-    else:
-      # compute all Gabor jet similarities
-      scores = [[self.m_similarity_function(model[c,n], probe[n]) for n in range(model.shape[1])] for c in range(model.shape[0])]
-      # for each jet location, compute the desired score averaging
-      return self.m_graph_scoring(self.m_jet_scoring(scores, axis=0))
+  def __similarities__(self, graphs, probes):
+    """Computes the similarities between all nodes of the given model graphs and of the given probe graphs.
+    Returns an array of shape (len(probes), len(graphs), number of nodes)."""
+    if self.m_similarity_kernel is not None:
+      # compare all nodes of all graphs in one broadcast operation
+      return self.m_similarity_kernel(graphs[numpy.newaxis], numpy.array(probes)[:,numpy.newaxis], graphs.ndim == 4)
+    return numpy.array([[[self.m_similarity_function(graph[n], probe[n]) for n in range(graph.shape[0])] for graph in graphs] for probe in probes])
 
+  def __graphs__(self, model):
+    """Returns the model graphs as a stack of graphs"""
+    return model[numpy.newaxis] if self.m_jet_scoring is None else model
 
-  def score_for_multiple_probes(self, model, probes):
-    """This function computes the score between the given model graph(s) and several given probe graphs."""
+  def __fuse__(self, similarities):
+    """Fuses the similarities of shape (probes, graphs, nodes) into one score per probe"""
     if self.m_jet_scoring is None:
-      # compute sum of Gabor jet similarities between averaged model graph and probe graphs
-      return numpy.average([self.m_similarity_function(model[n], probes[p][n]) for n in range(model.shape[0]) for p in len(probes)])
-    else:
-      # compute all Gabor jet similarities
-      scores = [[self.m_similarity_function(model[c,n], probes[p][n]) for n in range(model.shape[1])] for p in range(len(probes)) for c in range(model.shape[0])]
-      # for each jet location, compute the desired score averaging
-      return self.m_graph_scoring(self.m_jet_scoring(scores, axis=0))
+      # compute the average Gabor jet similarity between the averaged model graph and the probe graph
+      return numpy.average(similarities.reshape(similarities.shape[0], -1), axis=1)
+    # for each jet location, compute the desired score averaging
+    return self.m_graph_scoring(self.m_jet_scoring(similarities, axis=1), axis=1)
 
+  def score(self, model, probe):
+    """Computes the score of the probe and the model"""
+    return self.__fuse__(self.__similarities__(self.__graphs__(model), [probe]))[0]
 
 
+  def score_for_multiple_probes(self, model, probes):
+    """This function computes the score between the given model graph(s) and several given probe graphs."""
+    similarities = self.__similarities__(self.__graphs__(model), probes)
+    # handle all comparisons of all probe graphs as if they stem from the same probe
+    return self.__fuse__(similarities.reshape((1, -1, similarities.shape[2])))[0]
+
+
+  def score_matrix(self, models, probes, multiple_probes = False, block_size = 100):
+    """Computes the scores between all given models and probes, comparing each model with blocks of probes at once"""
+    if multiple_probes:
+      return Tool.score_matrix(self, models, probes, multiple_probes)
+    scores = numpy.ndarray((len(models), len(probes)), numpy.float64)
+    for i, model in enumerate(models):
+      for first in range(0, len(probes), block_size):
+        scores[i, first:first+block_size] = self.__fuse__(self.__similarities__(self.__graphs__(model), probes[first:first+block_size]))
+    return scores
@@ -8,6 +8,7 @@ import types
 
 from .Tool import Tool
 from .UBMGMM import UBMGMM, UBMGMMVideo
+from . import ParallelEM
 from .. import utils
 
 
@@ -20,6 +21,7 @@ class ISV (UBMGMM):
       # ISV training
       subspace_dimension_of_u,       # U subspace dimension
       isv_training_iterations = 10,  # Number of EM iterations for the ISV training
+      number_of_training_processes = 1, # Number of local processes that compute the E-steps of the ISV training
       # ISV enrollment
       isv_enroll_iterations = 1,     # Number of iterations for the enrollment phase
       # Parameters when splitting GMM and ISV files
@@ -47,6 +49,7 @@ class ISV (UBMGMM):
 
         subspace_dimension_of_u = subspace_dimension_of_u,
         isv_training_iterations = isv_training_iterations,
+        number_of_training_processes = number_of_training_processes,
         isv_enroll_iterations = isv_enroll_iterations,
         gmm_isv_split = gmm_isv_split,
         projected_toreplace = projected_toreplace,
@@ -63,6 +66,7 @@ class ISV (UBMGMM):
 
     self.m_subspace_dimension_of_u = subspace_dimension_of_u
     self.m_isv_training_iterations = isv_training_iterations
+    self.m_number_of_training_processes = number_of_training_processes
     self.m_isv_enroll_iterations = isv_enroll_iterations
 
     self.m_gmm_isv_split = gmm_isv_split
@@ -80,7 +84,8 @@ class ISV (UBMGMM):
     # train ISV model
     t = bob.trainer.ISVTrainer(self.m_isv_training_iterations, self.m_relevance_factor)
     t.rng = bob.core.random.mt19937(self.m_init_seed)
-    t.train(self.m_isvbase, data)
+    # the UBM is stored with the checkpoint, so that resuming does not need to train it again
+    ParallelEM.train_isv(t, self.m_isvbase, data, self.m_relevance_factor, self.m_isv_training_iterations, self.m_number_of_training_processes, self._checkpoint(self.m_init_seed), machines = {'ubm' : self.m_ubm})
 
 
   def _load_train_isv(self, train_features):
@@ -99,11 +104,16 @@ class ISV (UBMGMM):
   def train_projector(self, train_features, projector_file):
     """Train Projector and Enroller at the same time"""
 
-    data1 = numpy.vstack([feature for client in train_features for feature in client])
+    checkpoint = self._checkpoint(self.m_init_seed)
+    if checkpoint.passed('gmm'):
+      # the ISV training was interrupted; the UBM is stored in the checkpoint
+      self.m_ubm = bob.machine.GMMMachine(checkpoint.machine_file('ubm'))
+    else:
+      data1 = numpy.vstack([feature for client in train_features for feature in client])
 
-    UBMGMM._train_projector_using_array(self, data1)
-    # to save some memory, we might want to delete these data
-    del data1
+      UBMGMM._train_projector_using_array(self, data1)
+      # to save some memory, we might want to delete these data
+      del data1
 
     # train ISV
     self._load_train_isv(train_features)
@@ -308,16 +318,23 @@ class ISV (UBMGMM):
 
   def score_for_multiple_probes(self, model, probes):
     """This function computes the score between the given model and several given probe files."""
-    # create GMM statistics from first probe statistics
-    gmmstats_acc = bob.machine.GMMStats(probes[0][0])
-    # add all other probe statistics
-    for i in range(1,len(probes)):
-      gmmstats_acc += probes[i][0]
+    # accumulate the statistics of all probes
+    gmmstats_acc = self._accumulate_statistics([probe[0] for probe in probes])
     # compute ISV score with the accumulated statistics
     projected_isv_acc = numpy.ndarray(shape=(self.m_ubm.dim_c*self.m_ubm.dim_d,), dtype=numpy.float64)
     model.estimate_ux(gmmstats_acc, projected_isv_acc)
     return model.forward_ux(gmmstats_acc, projected_isv_acc)
 
+  def score_matrix(self, models, probes, multiple_probes = False):
+    """Computes the scores between all given models and probes with one matrix product.
+    The speaker offsets D*z of the models and the (model-independent) Ux offsets of the probes are stacked into matrices."""
+    if multiple_probes:
+      # the Ux offset of accumulated probes is estimated using the model
+      return Tool.score_matrix(self, models, probes, multiple_probes)
+    model_offsets = numpy.vstack([model.z for model in models]) * self.m_isvbase.d
+    channel_offsets = numpy.vstack([probe[1] for probe in probes])
+    return self._linear_scoring_matrix(model_offsets, [probe[0] for probe in probes], channel_offsets)
+
 
 
 
@@ -346,6 +363,7 @@ class ISVVideo (ISV, UBMGMMVideo):
       frame_selector_for_projector_training,
       frame_selector_for_projection,
       frame_selector_for_enroll,
+      frame_selector_for_enroller_training = None,
        **kwargs
   ):
 
@@ -363,6 +381,8 @@ class ISVVideo (ISV, UBMGMMVideo):
     self.m_frame_selector_for_projector_training = frame_selector_for_projector_training
     self.m_frame_selector_for_projection = frame_selector_for_projection
     self.m_frame_selector_for_enroll = frame_selector_for_enroll
+    # by default, the ISV subspace is trained with the frames that are used for projection
+    self.m_frame_selector_for_enroller_training = frame_selector_for_enroller_training if frame_selector_for_enroller_training is not None else frame_selector_for_projection
 
     utils.warn("In its current version, this class has not been tested. Use it with care!")
 
@@ -370,10 +390,6 @@ class ISVVideo (ISV, UBMGMMVideo):
   # Overrides ISV.train_enroller
   def train_enroller(self, train_features, enroller_file):
     utils.debug(" .... ISVVideo.train_enroller")
-    ########## (same as ISV.train_enroller)
-    # create a ISVBase with the UBM from the base class
-    self.m_isvbase = bob.machine.ISVBase(self.m_ubm, self.m_subspace_dimension_of_u)
-
     ########## calculate GMM stats from video.FrameContainers, using frame_selector_for_train_enroller
     gmm_stats = []
     for client_features in train_features: # loop over clients
@@ -386,9 +402,7 @@ class ISVVideo (ISV, UBMGMMVideo):
     utils.debug(" .... got gmm_stats for " + str(len(gmm_stats)) + " clients")
 
     ########## (same as ISV.train_enroller)
-    t = bob.trainer.ISVTrainer(self.m_isv_training_iterations, self.m_relevance_factor)
-    t.rng = bob.core.random.mt19937(self.m_init_seed)
-    t.train(self.m_isvbase, gmm_stats)
+    self._train_isv(gmm_stats)
 
     # Save the ISV base AND the UBM into the same file
     self.m_isvbase.save(bob.io.HDF5File(enroller_file, "w"))
@@ -416,3 +430,7 @@ class ISVVideo (ISV, UBMGMMVideo):
     """Computes the Universal Background Model from the training ("world") data"""
     return UBMGMMVideo.train_projector(self,train_files, projector_file)
 
+  def frame_selector(self):
+    """Returns a frame selector that selects all frames of a video that are used by this tool, including the ISV training"""
+    return utils.video.UnionFrameSelector([UBMGMMVideo.frame_selector(self), self.m_frame_selector_for_enroller_training])
+
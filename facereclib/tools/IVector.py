@@ -8,6 +8,7 @@ import types
 
 from .Tool import Tool
 from .UBMGMM import UBMGMM
+from . import ParallelEM
 from .. import utils
 
 
@@ -20,7 +21,10 @@ class IVector (UBMGMM):
       subspace_dimension_of_t,       # T subspace dimension
       update_sigma = True,
       tv_training_iterations = 25,  # Number of EM iterations for the JFA training
+      number_of_training_processes = 1, # Number of local processes that compute the E-steps of the TV training
       variance_threshold = 1e-5,
+      # IVector scoring
+      use_whitening = False, # Whiten the i-vectors (using the training i-vectors) before length normalization
       # Parameters when splitting GMM and IVector files
       gmm_ivec_split = False,
       projected_toreplace = 'projected', # 'Magic' string in path that will be replaced by the GMM or IVector one
@@ -47,7 +51,9 @@ class IVector (UBMGMM):
         subspace_dimension_of_t = subspace_dimension_of_t,
         update_sigma = update_sigma,
         tv_training_iterations = tv_training_iterations,
+        number_of_training_processes = number_of_training_processes,
         variance_threshold = variance_threshold,
+        use_whitening = use_whitening,
         gmm_ivec_split = gmm_ivec_split,
         projected_toreplace = projected_toreplace,
         projected_gmm = projected_gmm,
@@ -64,7 +70,10 @@ class IVector (UBMGMM):
     self.m_update_sigma = update_sigma
     self.m_subspace_dimension_of_t = subspace_dimension_of_t
     self.m_tv_training_iterations = tv_training_iterations
+    self.m_number_of_training_processes = number_of_training_processes
     self.m_variance_threshold = variance_threshold
+    self.m_use_whitening = use_whitening
+    self.m_whitening = None
 
     self.m_gmm_ivec_split = gmm_ivec_split
     self.m_projected_toreplace = projected_toreplace
@@ -83,7 +92,19 @@ class IVector (UBMGMM):
     # train IVector model
     t = bob.trainer.IVectorTrainer(update_sigma=self.m_update_sigma, max_iterations=self.m_tv_training_iterations)
     t.rng = bob.core.random.mt19937(self.m_init_seed)
-    t.train(self.m_tv, data)
+    # the UBM is stored with the checkpoint, so that resuming does not need to train it again
+    ParallelEM.train_ivector(t, self.m_tv, data, self.m_update_sigma, self.m_tv_training_iterations, self.m_number_of_training_processes, self._checkpoint(self.m_init_seed), machines = {'ubm' : self.m_ubm})
+    self._precompute_projection()
+
+  def _train_whitening(self, data):
+    """Computes the mean and the whitening matrix of the i-vectors of the given training GMMStats"""
+    utils.info("  -> Training i-vector whitening")
+    ivectors = self._project_ivectors(data)
+    mean = numpy.mean(ivectors, axis=0)
+    eigenvalues, eigenvectors = numpy.linalg.eigh(numpy.cov(ivectors - mean, rowvar=0))
+    # avoid divisions by zero for singular covariance matrices
+    eigenvalues = numpy.maximum(eigenvalues, numpy.finfo(numpy.float64).eps)
+    self.m_whitening = (mean, eigenvectors / numpy.sqrt(eigenvalues))
 
   def _load_train_ivector(self, train_features):
     utils.info("  -> Projecting training data")
@@ -94,15 +115,22 @@ class IVector (UBMGMM):
       data.append(UBMGMM.project(self, feature))
 
     self._train_ivector(data)
+    if self.m_use_whitening:
+      self._train_whitening(data)
 
   def train_projector(self, train_features, projector_file):
     """Train Projector and Enroller at the same time"""
 
-    data = numpy.vstack(train_features)
+    checkpoint = self._checkpoint(self.m_init_seed)
+    if checkpoint.passed('gmm'):
+      # the TV training was interrupted; the UBM is stored in the checkpoint
+      self.m_ubm = bob.machine.GMMMachine(checkpoint.machine_file('ubm'))
+    else:
+      data = numpy.vstack(train_features)
 
-    UBMGMM._train_projector_using_array(self, data)
-    # to save some memory, we might want to delete these data
-    del data
+      UBMGMM._train_projector_using_array(self, data)
+      # to save some memory, we might want to delete these data
+      del data
 
     # train IVector
     self._load_train_ivector(train_features)
@@ -122,6 +150,22 @@ class IVector (UBMGMM):
     hdf5file.create_group('Enroller')
     hdf5file.cd('Enroller')
     self.m_tv.save(hdf5file)
+    self._save_whitening(hdf5file)
+
+  def _save_whitening(self, hdf5file):
+    """Writes the whitening (if any) into the Whitening group of the given HDF5 file"""
+    if self.m_whitening is not None:
+      hdf5file.create_group('/Whitening')
+      hdf5file.set('/Whitening/mean', self.m_whitening[0])
+      hdf5file.set('/Whitening/matrix', self.m_whitening[1])
+
+  def _load_whitening(self, hdf5file):
+    """Reads the whitening from the given HDF5 file, if it was stored"""
+    self.m_whitening = None
+    if hdf5file.has_group('/Whitening'):
+      self.m_whitening = (hdf5file.read('/Whitening/mean'), hdf5file.read('/Whitening/matrix'))
+    elif self.m_use_whitening:
+      utils.warn("The i-vector whitening was not trained; i-vectors are only length-normalized")
 
 
   def _resolve_gmm_filename(self, projector_file):
@@ -145,7 +189,9 @@ class IVector (UBMGMM):
     self._save_projector_gmm_resolved(gmm_filename)
 
   def _save_projector_ivector_resolved(self, ivec_filename):
-    self.m_tv.save(bob.io.HDF5File(ivec_filename, "w"))
+    hdf5file = bob.io.HDF5File(ivec_filename, "w")
+    self.m_tv.save(hdf5file)
+    self._save_whitening(hdf5file)
 
   def _save_projector_ivector(self, projector_file):
     ivec_filename = self._resolve_ivector_filename(projector_file)
@@ -172,9 +218,12 @@ class IVector (UBMGMM):
     self._load_projector_gmm_resolved(gmm_filename)
 
   def _load_projector_ivector_resolved(self, ivec_filename):
-    self.m_tv = bob.machine.IVectorMachine(bob.io.HDF5File(ivec_filename))
+    hdf5file = bob.io.HDF5File(ivec_filename)
+    self.m_tv = bob.machine.IVectorMachine(hdf5file)
     # add UBM model from base class
     self.m_tv.ubm = self.m_ubm
+    self._load_whitening(hdf5file)
+    self._precompute_projection()
 
   def _load_projector_ivector(self, projector_file):
     ivec_filename = self._resolve_ivector_filename(projector_file)
@@ -197,6 +246,8 @@ class IVector (UBMGMM):
     self.m_tv = bob.machine.IVectorMachine(hdf5file)
     # add UBM model from base class
     self.m_tv.ubm = self.m_ubm
+    self._load_whitening(hdf5file)
+    self._precompute_projection()
 
   def load_projector(self, projector_file):
     """Reads the UBM model from file"""
@@ -216,6 +267,37 @@ class IVector (UBMGMM):
   def _project_ivector(self, projected_ubm):
     return self.m_tv.forward(projected_ubm)
 
+  def _precompute_projection(self):
+    """Precomputes the terms of the T-matrix that are required to extract i-vectors from GMMStats"""
+    dim_c, dim_d = self.m_ubm.dim_c, self.m_ubm.dim_d
+    t = self.m_tv.t
+    # T^T Sigma^-1 and the per-Gaussian blocks T_c^T Sigma_c^-1 T_c
+    self.m_tt_sigma = (t / self.m_tv.sigma[:,numpy.newaxis]).T
+    self.m_tt_sigma_t = numpy.array([numpy.dot(self.m_tt_sigma[:,c*dim_d:(c+1)*dim_d], t[c*dim_d:(c+1)*dim_d]) for c in range(dim_c)])
+
+  def _project_ivectors(self, statistics, block_size = 100):
+    """Extracts the i-vectors of all given GMMStats (in blocks of the given size) and returns them as the rows of a 2D array.
+    For each GMMStats, the i-vector w = (I + sum_c N_c T_c^T Sigma_c^-1 T_c)^-1 T^T Sigma^-1 (F - N m) is the same as computed by IVectorMachine.forward."""
+    dim_d = self.m_ubm.dim_d
+    identity = numpy.eye(self.m_tt_sigma.shape[0])
+    ivectors = numpy.ndarray((len(statistics), self.m_tt_sigma.shape[0]), numpy.float64)
+    for first in range(0, len(statistics), block_size):
+      block = statistics[first:first+block_size]
+      n = numpy.vstack([stats.n for stats in block])
+      f = numpy.vstack([stats.sum_px.flatten() for stats in block])
+      # the right hand sides for all GMMStats with one matrix product
+      rhs = numpy.dot(f - numpy.repeat(n, dim_d, axis=1) * self.m_ubm.mean_supervector, self.m_tt_sigma.T)
+      precisions = identity + numpy.tensordot(n, self.m_tt_sigma_t, axes=1)
+      ivectors[first:first+len(block)] = [numpy.linalg.solve(precisions[i], rhs[i]) for i in range(len(block))]
+    return ivectors
+
+  def _normalize_ivectors(self, ivectors):
+    """Whitens (if enabled) and length-normalizes the given i-vectors (one per row)"""
+    ivectors = numpy.atleast_2d(ivectors)
+    if self.m_whitening is not None:
+      ivectors = numpy.dot(ivectors - self.m_whitening[0], self.m_whitening[1])
+    return ivectors / numpy.sqrt(numpy.sum(ivectors ** 2, axis=1))[:,numpy.newaxis]
+
   def project(self, feature_array):
     """Computes GMM statistics against a UBM, then corresponding Ux vector"""
     projected_ubm = self._project_gmm(feature_array)
@@ -263,22 +345,23 @@ class IVector (UBMGMM):
 
 
   def enroll(self, enroll_features):
-    """Performs IVector enrollment"""
-    raise NotImplementedError('Enrollment is not yet supported')
+    """Enrolls a model as the average of the normalized i-vectors of the given GMMStats"""
+    ivectors = self._normalize_ivectors(self._project_ivectors(enroll_features))
+    return self._normalize_ivectors(numpy.mean(ivectors, axis=0))[0]
 
 
   ######################################################
   ################ Feature comparison ##################
   def read_model(self, model_file):
-    """Reads the IVector Machine that holds the model"""
-    raise NotImplementedError('Enrollment model is not yet supported')
+    """Reads the normalized i-vector of the model"""
+    return bob.io.load(model_file)
 
   def read_probe(self, probe_file):
     """Read the type of features that we require, namely GMMStats"""
     if self.m_gmm_ivec_split:
       probe_file_gmm = self._resolve_projected_gmm(probe_file)
       gmmstats = bob.machine.GMMStats(bob.io.HDF5File(str(probe_file_gmm)))
-      probe_file_ivec = self._resolve_projected_ivec(probe_file)
+      probe_file_ivec = self._resolve_projected_ivector(probe_file)
       ivector = bob.io.load(str(probe_file_ivec))
     else:
       hdf5file = bob.io.HDF5File(probe_file)
@@ -289,10 +372,17 @@ class IVector (UBMGMM):
     return [gmmstats, ivector]
 
   def score(self, model, probe):
-    """Computes the score for the given model and the given probe."""
-    raise NotImplementedError('Scoring is not yet supported')
+    """Computes the cosine similarity between the given model and the i-vector of the given probe."""
+    return numpy.dot(model, self._normalize_ivectors(probe[1])[0])
 
   def score_for_multiple_probes(self, model, probes):
-    """This function computes the score between the given model and several given probe files."""
-    raise NotImplementedError('Multiple probes is not yet supported')
+    """This function computes the cosine similarity between the given model and the average normalized i-vector of several given probe files."""
+    ivectors = self._normalize_ivectors(numpy.vstack([probe[1] for probe in probes]))
+    return numpy.dot(model, self._normalize_ivectors(numpy.mean(ivectors, axis=0))[0])
+
+  def score_matrix(self, models, probes, multiple_probes = False):
+    """Computes the cosine similarities between all given models and probes with a single matrix product."""
+    if multiple_probes:
+      return Tool.score_matrix(self, models, probes, multiple_probes)
+    return numpy.dot(numpy.vstack(models), self._normalize_ivectors(numpy.vstack([probe[1] for probe in probes])).T)
 
@@ -7,6 +7,7 @@ import numpy
 
 from .Tool import Tool
 from . import UBMGMM
+from . import ParallelEM
 from .. import utils
 
 
@@ -19,6 +20,7 @@ class JFA (UBMGMM):
       subspace_dimension_of_u,       # U subspace dimension
       subspace_dimension_of_v,       # V subspace dimension
       jfa_training_iterations = 10,  # Number of EM iterations for the JFA training
+      number_of_training_processes = 1, # Number of local processes that compute the E-steps of the JFA training
       # JFA enrollment
       jfa_enroll_iterations = 1,     # Number of iterations for the enrollment phase
       # parameters of the GMM
@@ -38,6 +40,7 @@ class JFA (UBMGMM):
         subspace_dimension_of_u = subspace_dimension_of_u,
         subspace_dimension_of_v = subspace_dimension_of_v,
         jfa_training_iterations = jfa_training_iterations,
+        number_of_training_processes = number_of_training_processes,
         jfa_enroll_iterations = jfa_enroll_iterations,
 
         multiple_model_scoring = None,
@@ -48,6 +51,7 @@ class JFA (UBMGMM):
     self.m_subspace_dimension_of_u = subspace_dimension_of_u
     self.m_subspace_dimension_of_v = subspace_dimension_of_v
     self.m_jfa_training_iterations = jfa_training_iterations
+    self.m_number_of_training_processes = number_of_training_processes
     self.m_jfa_enroll_iterations = jfa_enroll_iterations
 
   # Here, we just need to load the UBM from the projector file.
@@ -70,7 +74,7 @@ class JFA (UBMGMM):
     # train the JFA
     t = bob.trainer.JFATrainer(self.m_jfa_training_iterations)
     t.rng = bob.core.random.mt19937(self.m_init_seed)
-    t.train(self.m_jfabase, train_features)
+    ParallelEM.train_jfa(t, self.m_jfabase, train_features, self.m_jfa_training_iterations, self.m_number_of_training_processes, self._checkpoint(self.m_init_seed))
 
     # Save the JFA base AND the UBM into the same file
     self.m_jfabase.save(bob.io.HDF5File(enroller_file, "w"))
@@ -118,6 +122,30 @@ class JFA (UBMGMM):
     """Computes the score for the given model and the given probe"""
     return model.forward(probe)
 
+  def score_matrix(self, models, probes, multiple_probes = False):
+    """Computes the scores between all given models and probes with one matrix product.
+    As in bob, the channel offset x = (I + U^T Sigma^-1 N U)^-1 U^T Sigma^-1 (F - N m) of each probe is independent of the model,
+    and the speaker offsets V*y + D*z of the models are stacked into a matrix."""
+    if multiple_probes:
+      return Tool.score_matrix(self, models, probes, multiple_probes)
+    dim_c, dim_d = self.m_ubm.dim_c, self.m_ubm.dim_d
+    ubm_mean = self.m_ubm.mean_supervector
+    u = self.m_jfabase.u
+    # Sigma^-1 U and the per-Gaussian blocks of U^T Sigma^-1 U
+    u_sigma = u / self.m_ubm.variance_supervector[:,numpy.newaxis]
+    ut_sigma_u = numpy.array([numpy.dot(u[c*dim_d:(c+1)*dim_d].T, u_sigma[c*dim_d:(c+1)*dim_d]) for c in range(dim_c)])
+    identity = numpy.eye(u.shape[1])
+
+    # the Ux offset of each probe
+    channel_offsets = numpy.ndarray((len(probes), u.shape[0]), numpy.float64)
+    for j, probe in enumerate(probes):
+      fn = probe.sum_px.flatten() - numpy.repeat(probe.n, dim_d) * ubm_mean
+      x = numpy.linalg.solve(identity + numpy.tensordot(probe.n, ut_sigma_u, axes=1), numpy.dot(u_sigma.T, fn))
+      channel_offsets[j] = numpy.dot(u, x)
+
+    model_offsets = numpy.vstack([numpy.dot(self.m_jfabase.v, model.y) + self.m_jfabase.d * model.z for model in models])
+    return self._linear_scoring_matrix(model_offsets, probes, channel_offsets)
+
   def score_for_multiple_probes(self, model, probes):
     """This function computes the score between the given model and several given probe files."""
     # TODO: Check if this is correct
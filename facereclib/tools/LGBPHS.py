@@ -33,50 +33,22 @@ class LGBPHS (Tool):
     # remember distance function
     self.m_distance_function = distance_function
     self.m_factor =  -1. if is_distance_function else 1
+    # vectorized implementation of the distance function, which compares one probe with many models at once
+    self.m_batch_distance_function = {
+        bob.math.chi_square : utils.histogram.chi_square,
+        bob.math.histogram_intersection : utils.histogram.histogram_intersection
+    }.get(distance_function)
 
   def enroll(self, enroll_features):
     """Enrolling model by taking the average of all features"""
-    sparse = len(enroll_features) > 0 and enroll_features[0].shape[0] == 2
-    if sparse:
-      # get all indices for the sparse model
-      values = {}
-      # assert that we got sparse features
-      assert enroll_features[0].shape[0] == 2
-      # iterate through all sparse features
-      for i in range(len(enroll_features)):
-        feature = enroll_features[i]
-        # collect the values by index
-        for j in range(feature.shape[1]):
-          index = int(feature[0,j])
-          value = feature[1,j] / float(len(enroll_features))
-          # add up values
-          if index in values:
-            values[index] += value
-          else:
-            values[index] = value
-
-      # create model containing all the used indices
-      model = numpy.ndarray((2, len(values)), dtype = numpy.float64)
-
-      i = 0
-      for index in sorted(values.keys()):
-        model[0,i] = index
-        model[1,i] = values[index]
-        i += 1
-    else:
-      model = numpy.zeros(enroll_features[0].shape, dtype = numpy.float64)
-      # add up models
-      for i in range(len(enroll_features)):
-        model += enroll_features[i]
-      # normalize by number of models
-      model /= float(len(enroll_features))
-
-    # return averaged model
-    return model
+    # sparse features are merged by their indices
+    return utils.histogram.average(enroll_features)
 
 
   def score(self, model, probe):
     """Computes the score using the specified histogram measure; returns a similarity value (bigger -> better)"""
+    if self.m_batch_distance_function is not None:
+      return self.m_factor * self.m_batch_distance_function([model], probe)[0]
     sparse = model.shape[0] == 2
     if sparse:
       # assure that the probe is sparse as well
@@ -86,3 +58,10 @@ class LGBPHS (Tool):
       return self.m_factor * self.m_distance_function(model.flatten(), probe.flatten())
 
 
+  def score_matrix(self, models, probes, multiple_probes = False):
+    """Computes the scores between all given models and probes, comparing each probe with all models at once"""
+    if multiple_probes or self.m_batch_distance_function is None:
+      return Tool.score_matrix(self, models, probes, multiple_probes)
+    # the models are stacked only once for all probes
+    stacked_models = utils.histogram.StackedHistograms(models)
+    return self.m_factor * numpy.transpose([self.m_batch_distance_function(stacked_models, probe) for probe in probes])
@@ -6,6 +6,7 @@ import bob
 import numpy
 
 from .Tool import Tool
+from .Checkpoint import train_em
 from .. import utils
 
 
@@ -116,7 +117,6 @@ class PLDA (Tool):
     t = bob.trainer.PLDATrainer(self.m_plda_training_iterations)
 
     #t.rng.seed = self.m_init[0]
-    print self.m_init[0]
     t.rng = bob.core.random.mt19937(self.m_init[0])
     t.init_f_method = self.m_init[1]
     t.init_f_ratio = self.m_init[2]
@@ -127,7 +127,7 @@ class PLDA (Tool):
 
     # train machine
     self.m_plda_base = bob.machine.PLDABase(input_dimension, self.m_subspace_dimension_of_f, self.m_subspace_dimension_of_g)
-    t.train(self.m_plda_base, training_features)
+    train_em(t, self.m_plda_base, training_features, self.m_plda_training_iterations, self._checkpoint(self.m_init[0]), 'plda', ('mu', 'f', 'g', 'sigma'))
 
     # write machines to file
     proj_hdf5file = bob.io.HDF5File(str(projector_file), "w")
@@ -149,24 +149,68 @@ class PLDA (Tool):
       self.m_pca_machine = bob.machine.LinearMachine(proj_hdf5file)
     proj_hdf5file.cd('/plda')
     self.m_plda_base = bob.machine.PLDABase(proj_hdf5file)
-    #self.m_plda_base = bob.machine.PLDABase(bob.io.HDF5File(projector_file))
-    self.m_plda_machine = bob.machine.PLDAMachine(self.m_plda_base)
-    self.m_plda_trainer = bob.trainer.PLDATrainer()
+    self.__precompute__()
+
+
+  def __precompute__(self):
+    """Precomputes the matrices of the PLDABase that are shared by all models and probes"""
+    f = self.m_plda_base.f
+    g = self.m_plda_base.g
+    # beta = (Sigma + G G^T)^-1
+    beta = numpy.linalg.inv(numpy.diag(self.m_plda_base.sigma) + numpy.dot(g, g.T))
+    self.m_ft_beta = numpy.dot(f.T, beta)
+    self.m_ft_beta_f = numpy.dot(self.m_ft_beta, f)
+    # gamma_n = (I + n F^T beta F)^-1 and log(det(I + n F^T beta F)) for a given number of samples n
+    self.m_gamma = {}
+
+  def __gamma__(self, count):
+    """Returns gamma_n and its log-determinant for the given number of samples (cached)"""
+    if count not in self.m_gamma:
+      matrix = numpy.eye(self.m_ft_beta_f.shape[0]) + count * self.m_ft_beta_f
+      self.m_gamma[count] = (numpy.linalg.inv(matrix), numpy.linalg.slogdet(matrix)[1])
+    return self.m_gamma[count]
+
+  def __project__(self, features):
+    """Stacks the given features and applies the PCA projection, if required"""
+    features = numpy.vstack(features)
+    if self.m_subspace_dimension_pca is not None:
+      features = numpy.dot((features - self.m_pca_machine.input_subtract) / self.m_pca_machine.input_divide, self.m_pca_machine.weights) + self.m_pca_machine.biases
+    return features
+
+  def __weighted_sums__(self, features):
+    """Computes F^T beta (x - mu) for each of the given features (one per row)"""
+    return numpy.dot(self.__project__(features) - self.m_plda_base.mu, self.m_ft_beta.T)
+
 
   def enroll(self, enroll_features):
-    """Enrolls the model by computing an average of the given input vectors"""
-    if self.m_subspace_dimension_pca is not None:
-      enroll_features_projected = self.__perform_pca_client__(self.m_pca_machine, enroll_features)
-      self.m_plda_trainer.enrol(self.m_plda_machine,enroll_features_projected)
-    else:
-      self.m_plda_trainer.enrol(self.m_plda_machine,enroll_features)
-    return self.m_plda_machine
+    """Enrolls the model by computing the sufficient statistics of the enrollment samples:
+    the number of samples, followed by the sum of F^T beta (x - mu) over all samples"""
+    return numpy.hstack(([len(enroll_features)], numpy.sum(self.__weighted_sums__(enroll_features), axis=0)))
 
   def read_model(self, model_file):
-    """Reads the model, which in this case is a PLDA-Machine"""
-    # read machine and attach base machine
-    plda_machine = bob.machine.PLDAMachine(bob.io.HDF5File(model_file), self.m_plda_base)
-    return plda_machine
+    """Reads the model, which in this case are the sufficient statistics of the enrollment samples"""
+    return bob.io.load(model_file)
+
+
+  def __log_likelihood_ratios__(self, models, probe_counts, probe_sums):
+    """Computes the PLDA log-likelihood ratios between the given models and probe statistics.
+    The likelihoods of the samples themselves cancel out in the ratio, so that only the weighted sums and the number of samples of the models and the probes are required.
+    Models with the same number of enrollment samples are scored with a single matrix product."""
+    models = numpy.vstack(models)
+    scores = numpy.ndarray((models.shape[0], len(probe_counts)), numpy.float64)
+    for model_count in numpy.unique(models[:,0]):
+      indices = numpy.where(models[:,0] == model_count)[0]
+      model_sums = models[indices,1:]
+      for probe_count in numpy.unique(probe_counts):
+        columns = numpy.where(probe_counts == probe_count)[0]
+        gamma_joint, log_det_joint = self.__gamma__(int(model_count + probe_count))
+        gamma_model, log_det_model = self.__gamma__(int(model_count))
+        gamma_probe, log_det_probe = self.__gamma__(int(probe_count))
+        model_terms = numpy.sum(numpy.dot(model_sums, gamma_joint - gamma_model) * model_sums, axis=1)
+        probe_terms = numpy.sum(numpy.dot(probe_sums[columns], gamma_joint - gamma_probe) * probe_sums[columns], axis=1)
+        cross_terms = numpy.dot(numpy.dot(model_sums, gamma_joint), probe_sums[columns].T)
+        scores[numpy.ix_(indices, columns)] = 0.5 * (model_terms[:,numpy.newaxis] + 2. * cross_terms + probe_terms) - 0.5 * (log_det_joint - log_det_model - log_det_probe)
+    return scores
 
   def score(self, model, probe):
     """Computes the PLDA score for the given model and probe"""
@@ -174,30 +218,22 @@ class PLDA (Tool):
 
   def score_for_multiple_probes(self, model, probes):
     """This function computes the score between the given model and several given probe files.
-    In this base class implementation, it computes the scores for each probe file using the 'score' method,
-    and fuses the scores using the fusion method specified in the constructor of this class."""
-    n_probes = len(probes)
-    if self.m_subspace_dimension_pca is not None:
-      # project probe
-      probe_ = numpy.ndarray((n_probes, self.m_pca_machine.shape[1]), numpy.float64)
-      projected_probe = numpy.ndarray(self.m_pca_machine.shape[1], numpy.float64)
-      for i in range(n_probes):
-        self.m_pca_machine(probes[i], projected_probe)
-        probe_[i,:] = projected_probe
-      # forward
-      if self.m_score_set == 'joint_likelihood':
-        return model.forward(probe_)
-      else:
-        scores = [model.forward(probe_[i,:]) for i in range(n_probes)]
-        return self.m_score_set(scores)
+    By default, the joint likelihood of all probes is used; otherwise the scores of the single probes are fused."""
+    weighted_sums = self.__weighted_sums__(probes)
+    if self.m_score_set == 'joint_likelihood':
+      return self.__log_likelihood_ratios__([model], numpy.array([len(probes)]), numpy.sum(weighted_sums, axis=0)[numpy.newaxis,:])[0,0]
+    else:
+      scores = self.__log_likelihood_ratios__([model], numpy.ones(len(probes)), weighted_sums)[0]
+      return self.m_score_set(scores)
+
+  def score_matrix(self, models, probes, multiple_probes = False):
+    """Computes the PLDA scores between all given models and probes at once"""
+    if multiple_probes:
+      if self.m_score_set != 'joint_likelihood':
+        return Tool.score_matrix(self, models, probes, multiple_probes)
+      probe_counts = numpy.array([len(probe_set) for probe_set in probes])
+      probe_sums = numpy.vstack([numpy.sum(self.__weighted_sums__(probe_set), axis=0) for probe_set in probes])
     else:
-      # just forward
-      if self.m_score_set == 'joint_likelihood':
-        probe_ = numpy.ndarray((n_probes, self.m_pca_machine.shape[1]), numpy.float64)
-        for i in range(n_probes):
-          probe_[i,:] = probes[i]
-        return model.forward(probe_)
-      # forward
-      else:
-        scores = [model.forward(probes[i]) for i in range(n_probes)]
-        return self.m_score_set(scores)
+      probe_counts = numpy.ones(len(probes))
+      probe_sums = self.__weighted_sums__(probes)
+    return self.__log_likelihood_ratios__(models, probe_counts, probe_sums)
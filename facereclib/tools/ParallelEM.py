@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Manuel Guenther <Manuel.Guenther@idiap.ch>
+
+"""Multi-process E-steps for the ISV, JFA and total variability (IVector) training.
+
+The training statistics are split into contiguous chunks of clients (or files, for the IVector), which are handed to forked worker processes only once.
+In each EM iteration, only the current subspaces and the latent variables of the clients are sent to the workers, and the E-step accumulators are summed up in memory.
+The ``*_e_step`` functions are also usable for a single chunk of data, e.g., inside a grid job.
+"""
+
+import bob
+import numpy
+import multiprocessing
+
+from .Checkpoint import Checkpoint, train_em
+from .. import utils
+
+
+# The data shared with the forked worker processes; it is set up in ParallelEStep.__init__
+_shared = {}
+
+
+def partition(data, number_of_parts):
+  """Splits the given list into (at most) the given number of contiguous index ranges of similar size."""
+  number_of_parts = max(1, min(number_of_parts, len(data)))
+  bounds = [int(round(float(i) * len(data) / number_of_parts)) for i in range(number_of_parts + 1)]
+  return [(bounds[i], bounds[i+1]) for i in range(number_of_parts)]
+
+
+def add_accumulators(accumulators, other):
+  """Adds the E-step accumulators ``other`` to the given ``accumulators`` (in place)."""
+  for key in accumulators:
+    accumulators[key] += other[key]
+  return accumulators
+
+
+def set_accumulators(trainer, accumulators):
+  """Sets the given E-step accumulators to the trainer, so that its M-step can be called."""
+  for key, value in accumulators.iteritems():
+    setattr(trainer, key, value)
+
+
+def save_accumulators(accumulators, hdf5file):
+  """Writes the given E-step accumulators to the given HDF5 file."""
+  for key in sorted(accumulators.keys()):
+    hdf5file.set(key, accumulators[key])
+
+
+def read_accumulators(hdf5file, keys):
+  """Reads the E-step accumulators with the given names from the given HDF5 file."""
+  return dict((key, hdf5file.read(key)) for key in keys)
+
+
+ISV_ACCUMULATORS = ('acc_u_a1', 'acc_u_a2')
+JFA_ACCUMULATORS = {1 : ('acc_v_a1', 'acc_v_a2'), 2 : ('acc_u_a1', 'acc_u_a2'), 3 : ('acc_d_a1', 'acc_d_a2')}
+IVECTOR_ACCUMULATORS = ('acc_nij_wij2', 'acc_fnormij_wij', 'acc_nij', 'acc_snormij')
+
+
+def isv_e_step(ubm, subspaces, data, relevance_factor, latent = None):
+  """Computes the ISV E-step accumulators for the given list of client-wise GMMStats.
+  The subspaces are given as the tuple (U, D), the latent variables as the list [X, Z].
+  Returns the accumulators and the updated latent variables."""
+  u, d = subspaces
+  isv_base = bob.machine.ISVBase(ubm, u.shape[1])
+  trainer = bob.trainer.ISVTrainer(1, relevance_factor)
+  # the initialization sets up the data-dependent caches, but randomizes the subspaces
+  trainer.initialize(isv_base, data)
+  isv_base.u = u
+  isv_base.d = d
+  if latent is not None:
+    trainer.__X__, trainer.__Z__ = latent
+  trainer.e_step(isv_base, data)
+  return dict((key, getattr(trainer, key)) for key in ISV_ACCUMULATORS), [trainer.__X__, trainer.__Z__]
+
+
+def jfa_e_step(ubm, subspaces, data, step, latent = None):
+  """Computes the JFA E-step accumulators of the given sub-step (1: V, 2: U, 3: D) for the given list of client-wise GMMStats.
+  The subspaces are given as the tuple (U, V, D), the latent variables as the list [X, Y, Z].
+  Returns the accumulators and the updated latent variables."""
+  u, v, d = subspaces
+  jfa_base = bob.machine.JFABase(ubm, u.shape[1], v.shape[1])
+  trainer = bob.trainer.JFATrainer(1)
+  trainer.initialize(jfa_base, data)
+  jfa_base.u = u
+  jfa_base.v = v
+  jfa_base.d = d
+  if latent is not None:
+    trainer.__X__, trainer.__Y__, trainer.__Z__ = latent
+  getattr(trainer, 'e_step%d' % step)(jfa_base, data)
+  return dict((key, getattr(trainer, key)) for key in JFA_ACCUMULATORS[step]), [trainer.__X__, trainer.__Y__, trainer.__Z__]
+
+
+def ivector_e_step(ubm, subspaces, data, update_sigma, variance_threshold, latent = None):
+  """Computes the IVector E-step accumulators for the given list of GMMStats.
+  The subspaces are given as the tuple (T, sigma); there are no latent variables to keep.
+  Returns the accumulators and None."""
+  t, sigma = subspaces
+  ivector_machine = bob.machine.IVectorMachine(ubm, t.shape[1])
+  ivector_machine.variance_threshold = variance_threshold
+  trainer = bob.trainer.IVectorTrainer(update_sigma = update_sigma)
+  trainer.initialize(ivector_machine, data)
+  ivector_machine.t = t
+  ivector_machine.sigma = sigma
+  trainer.e_step(ivector_machine, data)
+  return dict((key, getattr(trainer, key)) for key in IVECTOR_ACCUMULATORS), None
+
+
+def _e_step_worker(task):
+  """Executes the E-step on one chunk of the shared data; this function is run in the worker processes."""
+  index, subspaces, latent = task
+  first, last = _shared['bounds'][index]
+  return _shared['e_step'](subspaces, _shared['data'][first:last], latent = latent)
+
+
+class ParallelEStep:
+  """Computes E-steps on contiguous chunks of the training data in a pool of forked worker processes and sums up the accumulators."""
+
+  def __init__(self, data, e_step, number_of_processes):
+    # the data and the E-step function are inherited by the forked processes, so they never need to be pickled
+    self.m_bounds = partition(data, number_of_processes)
+    _shared['data'] = data
+    _shared['e_step'] = e_step
+    _shared['bounds'] = self.m_bounds
+    utils.info("  -> Computing E-steps in %d parallel processes" % len(self.m_bounds))
+    self.m_pool = multiprocessing.Pool(len(self.m_bounds))
+
+  def __call__(self, subspaces, latent = None):
+    """Runs the E-step for the given subspaces and latent variables; returns the summed accumulators and the merged latent variables."""
+    tasks = [(index, subspaces, None if latent is None else [l[first:last] for l in latent]) for index, (first, last) in enumerate(self.m_bounds)]
+    results = self.m_pool.map(_e_step_worker, tasks)
+
+    accumulators = results[0][0]
+    for result in results[1:]:
+      add_accumulators(accumulators, result[0])
+
+    if results[0][1] is None:
+      return accumulators, None
+    # merge the latent variables of all chunks, keeping the order of the clients
+    merged = [[] for l in results[0][1]]
+    for result in results:
+      for i, l in enumerate(result[1]):
+        merged[i].extend(l)
+    return accumulators, merged
+
+  def close(self):
+    """Terminates the worker processes and releases the shared data."""
+    self.m_pool.close()
+    self.m_pool.join()
+    _shared.clear()
+
+
+def single_e_step(e_step, subspaces, data, number_of_processes, latent = None):
+  """Runs the given E-step function once on the given data, using several processes if requested."""
+  number_of_processes = utils.work_queue.cores_for_job(number_of_processes)
+  if number_of_processes <= 1:
+    return e_step(subspaces, data, latent = latent)
+  parallel_e_step = ParallelEStep(data, e_step, number_of_processes)
+  try:
+    return parallel_e_step(subspaces, latent)
+  finally:
+    parallel_e_step.close()
+
+
+def _no_checkpoint(checkpoint):
+  """Returns the given checkpoint, or an inactive checkpoint if None is given."""
+  return Checkpoint(None, None) if checkpoint is None else checkpoint
+
+
+def _parallel_e_step(e_step, trainer, latent):
+  """Returns a function that computes the E-step in parallel and sets the accumulators and latent variables to the (master) trainer."""
+  def run(subspaces):
+    accumulators, values = e_step(subspaces, [getattr(trainer, name) for name in latent] if latent else None)
+    for name, value in zip(latent, values or []):
+      setattr(trainer, name, value)
+    set_accumulators(trainer, accumulators)
+  return run
+
+
+def train_isv(trainer, isv_base, data, relevance_factor, iterations, number_of_processes, checkpoint = None, machines = {}):
+  """Trains the given ISVBase with the given (already seeded) trainer, computing the E-steps in the given number of processes.
+  Without a checkpoint, the training state is not stored."""
+  checkpoint = _no_checkpoint(checkpoint)
+  number_of_processes = utils.work_queue.cores_for_job(number_of_processes)
+  latent = ('__X__', '__Z__')
+  if number_of_processes <= 1:
+    train_em(trainer, isv_base, data, iterations, checkpoint, 'isv', ('u', 'd'), latent, machines = machines)
+    return
+  e_step = ParallelEStep(data, lambda subspaces, data, latent: isv_e_step(isv_base.ubm, subspaces, data, relevance_factor, latent), number_of_processes)
+  try:
+    run = _parallel_e_step(e_step, trainer, latent)
+    train_em(trainer, isv_base, data, iterations, checkpoint, 'isv', ('u', 'd'), latent, e_step = lambda: run((isv_base.u, isv_base.d)), machines = machines)
+  finally:
+    e_step.close()
+
+
+def train_jfa(trainer, jfa_base, data, iterations, number_of_processes, checkpoint = None):
+  """Trains the given JFABase with the given (already seeded) trainer, computing the E-steps in the given number of processes.
+  As in JFATrainer.train, the V, U and D subspaces are trained one after the other.
+  Without a checkpoint, the training state is not stored."""
+  checkpoint = _no_checkpoint(checkpoint)
+  number_of_processes = utils.work_queue.cores_for_job(number_of_processes)
+  if number_of_processes <= 1 and not checkpoint.active():
+    trainer.train(jfa_base, data)
+    return
+  parameters, latent = ('u', 'v', 'd'), ('__X__', '__Y__', '__Z__')
+  trainer.initialize(jfa_base, data)
+  e_step = None
+  if number_of_processes > 1:
+    # the sub-step is sent to the workers together with the subspaces
+    e_step = ParallelEStep(data, lambda (step, subspaces), data, latent: jfa_e_step(jfa_base.ubm, subspaces, data, step, latent), number_of_processes)
+  try:
+    for step, stage in ((1, 'jfa-v'), (2, 'jfa-u'), (3, 'jfa-d')):
+      step_function = None
+      if e_step is not None:
+        run = _parallel_e_step(e_step, trainer, latent)
+        step_function = lambda: run((step, (jfa_base.u, jfa_base.v, jfa_base.d)))
+      train_em(trainer, jfa_base, data, iterations, checkpoint, stage, parameters, latent, e_step = step_function, step = str(step), initialize = False)
+  finally:
+    if e_step is not None:
+      e_step.close()
+
+
+def train_ivector(trainer, ivector_machine, data, update_sigma, iterations, number_of_processes, checkpoint = None, machines = {}):
+  """Trains the given IVectorMachine with the given (already seeded) trainer, computing the E-steps in the given number of processes.
+  Without a checkpoint, the training state is not stored."""
+  checkpoint = _no_checkpoint(checkpoint)
+  number_of_processes = utils.work_queue.cores_for_job(number_of_processes)
+  parameters = ('t', 'sigma')
+  if number_of_processes <= 1:
+    train_em(trainer, ivector_machine, data, iterations, checkpoint, 'ivector', parameters, machines = machines)
+    return
+  variance_threshold = ivector_machine.variance_threshold
+  e_step = ParallelEStep(data, lambda subspaces, data, latent: ivector_e_step(ivector_machine.ubm, subspaces, data, update_sigma, variance_threshold, latent), number_of_processes)
+  try:
+    run = _parallel_e_step(e_step, trainer, ())
+    train_em(trainer, ivector_machine, data, iterations, checkpoint, 'ivector', parameters, e_step = lambda: run((ivector_machine.t, ivector_machine.sigma)), machines = machines)
+  finally:
+    e_step.close()
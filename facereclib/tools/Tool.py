@@ -20,6 +20,7 @@
 import bob
 import numpy
 import os
+from .Checkpoint import Checkpoint
 from .. import utils
 
 class Tool:
@@ -54,6 +55,8 @@ class Tool:
     self.m_probe_fusion_function = utils.score_fusion_strategy(multiple_probe_scoring)
     self._kwargs = kwargs
     self._kwargs.update({'multiple_model_scoring':multiple_model_scoring, 'multiple_probe_scoring':multiple_probe_scoring})
+    self.m_checkpoint_file = None
+    self.m_checkpoint_interval = 1
 
 
   def __str__(self):
@@ -98,6 +101,17 @@ class Tool:
       # only one probe feature -> use the default scoring function
       return self.score(model, probes)
 
+  def score_matrix(self, models, probes, multiple_probes = False):
+    """This function computes the scores between all given models and all given probes and returns them as a 2D numpy.ndarray of shape (len(models), len(probes)).
+    If multiple_probes is enabled, each probe is a list of probe features (of a probe file set), which are scored using the 'score_for_multiple_probes' method.
+    In this base class implementation, the scores are computed pair by pair; tools that can compute a whole block of scores at once should overwrite this function."""
+    score_function = self.score_for_multiple_probes if multiple_probes else self.score
+    scores = numpy.ndarray((len(models), len(probes)), numpy.float64)
+    for i, model in enumerate(models):
+      for j, probe in enumerate(probes):
+        scores[i,j] = score_function(model, probe)
+    return scores
+
 
   ############################################################
   ### Special functions that might be overwritten on need
@@ -204,6 +218,19 @@ class Tool:
     """
 
 
+  def set_checkpoint(self, checkpoint_file, interval = 1):
+    """Sets the file, in which iterative trainings store their state every ``interval`` iterations.
+    If the file exists, the training is resumed from the stored state.
+    This function is called by the ToolChain before training the projector or the enroller; use None to disable checkpoints."""
+    self.m_checkpoint_file = checkpoint_file
+    self.m_checkpoint_interval = interval
+
+
+  def _checkpoint(self, seed):
+    """Returns the Checkpoint object for the current training, which is inactive when no checkpoint file is set."""
+    return Checkpoint(self.m_checkpoint_file, seed, self.m_checkpoint_interval)
+
+
   def load_enroller(self, enroller_file):
     """Loads the parameters required for model enrollment from file.
     This function usually is only useful in combination with the 'train_enroller' function (see above).
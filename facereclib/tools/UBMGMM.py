@@ -6,6 +6,7 @@ import bob
 import numpy
 
 from .Tool import Tool
+from .Checkpoint import train_em
 from .. import utils
 
 class UBMGMM (Tool):
@@ -140,29 +141,33 @@ class UBMGMM (Tool):
     kmeans = bob.machine.KMeansMachine(self.m_gaussians, input_size)
     self.m_ubm = bob.machine.GMMMachine(self.m_gaussians, input_size)
 
-    # Creates the KMeansTrainer
-    kmeans_trainer = bob.trainer.KMeansTrainer()
-    kmeans_trainer.rng = bob.core.random.mt19937(self.m_init_seed)
-    kmeans_trainer.convergence_threshold = self.m_training_threshold
-    kmeans_trainer.max_iterations = self.m_gmm_training_iterations
-
-    # Trains using the KMeansTrainer
-    utils.info("  -> Training K-Means")
-    kmeans_trainer.train(kmeans, normalized_array)
-
-    [variances, weights] = kmeans.get_variances_and_weights_for_each_cluster(normalized_array)
-    means = kmeans.means
-
-    # Undoes the normalization
-    utils.debug(" .... Undoing normalization")
-    if self.m_normalize_before_k_means:
-      self.__multiply_vectors_by_factors__(means, std_array)
-      self.__multiply_vectors_by_factors__(variances, std_array ** 2)
-
-    # Initializes the GMM
-    self.m_ubm.means = means
-    self.m_ubm.variances = variances
-    self.m_ubm.weights = weights
+    # an interrupted training is continued from the checkpoint, if any
+    checkpoint = self._checkpoint(self.m_init_seed)
+
+    if not checkpoint.passed('k-means'):
+      # Creates the KMeansTrainer
+      kmeans_trainer = bob.trainer.KMeansTrainer()
+      kmeans_trainer.rng = bob.core.random.mt19937(self.m_init_seed)
+      kmeans_trainer.convergence_threshold = self.m_training_threshold
+      kmeans_trainer.max_iterations = self.m_gmm_training_iterations
+
+      # Trains using the KMeansTrainer
+      utils.info("  -> Training K-Means")
+      train_em(kmeans_trainer, kmeans, normalized_array, self.m_gmm_training_iterations, checkpoint, 'k-means', ('means',), convergence_threshold = self.m_training_threshold)
+
+      [variances, weights] = kmeans.get_variances_and_weights_for_each_cluster(normalized_array)
+      means = kmeans.means
+
+      # Undoes the normalization
+      utils.debug(" .... Undoing normalization")
+      if self.m_normalize_before_k_means:
+        self.__multiply_vectors_by_factors__(means, std_array)
+        self.__multiply_vectors_by_factors__(variances, std_array ** 2)
+
+      # Initializes the GMM
+      self.m_ubm.means = means
+      self.m_ubm.variances = variances
+      self.m_ubm.weights = weights
     self.m_ubm.set_variance_thresholds(self.m_variance_threshold)
 
     # Trains the GMM
@@ -171,7 +176,7 @@ class UBMGMM (Tool):
     trainer.rng = bob.core.random.mt19937(self.m_init_seed)
     trainer.convergence_threshold = self.m_training_threshold
     trainer.max_iterations = self.m_gmm_training_iterations
-    trainer.train(self.m_ubm, array)
+    train_em(trainer, self.m_ubm, array, self.m_gmm_training_iterations, checkpoint, 'gmm', ('means', 'variances', 'weights'), convergence_threshold = self.m_training_threshold)
 
 
   def _save_projector(self, projector_file):
@@ -265,6 +270,42 @@ class UBMGMM (Tool):
     utils.warn("Please verify that this function is correct")
     return self.m_probe_fusion_function(self.m_scoring_function([model], self.m_ubm, probes, [], frame_length_normalisation = True))
 
+  def score_matrix(self, models, probes, multiple_probes = False):
+    """Computes the scores between all given models and probes with a single call of the scoring function"""
+    if multiple_probes:
+      return Tool.score_matrix(self, models, probes, multiple_probes)
+    return numpy.array(self.m_scoring_function(models, self.m_ubm, probes, [], frame_length_normalisation = True), numpy.float64)
+
+
+  def _accumulate_statistics(self, statistics):
+    """Returns the sum of the given list of GMMStats as a new GMMStats object"""
+    accumulated = bob.machine.GMMStats(self.m_ubm.dim_c, self.m_ubm.dim_d)
+    accumulated.t = sum(stats.t for stats in statistics)
+    accumulated.log_likelihood = sum(stats.log_likelihood for stats in statistics)
+    accumulated.n = numpy.sum([stats.n for stats in statistics], axis=0)
+    accumulated.sum_px = numpy.sum([stats.sum_px for stats in statistics], axis=0)
+    accumulated.sum_pxx = numpy.sum([stats.sum_pxx for stats in statistics], axis=0)
+    return accumulated
+
+  def _linear_scoring_matrix(self, model_offsets, probes, channel_offsets = None):
+    """Computes the same scores as bob.machine.linear_scoring (with frame length normalization) for all models and probes with one matrix product.
+    The model_offsets are the mean supervectors of the models minus the mean supervector of the UBM (one row per model),
+    the probes are GMMStats and the channel_offsets are the Ux supervectors of the probes (one row per probe)."""
+    dim_d = self.m_ubm.dim_d
+    ubm_mean = self.m_ubm.mean_supervector
+    # B = F - N * (m + Ux) for each probe
+    n = numpy.repeat(numpy.vstack([probe.n for probe in probes]), dim_d, axis=1)
+    f = numpy.vstack([probe.sum_px.flatten() for probe in probes])
+    b = f - n * (ubm_mean if channel_offsets is None else ubm_mean + channel_offsets)
+    # A = (M - m) / Sigma for each model
+    scores = numpy.dot(model_offsets / self.m_ubm.variance_supervector, b.T)
+    # frame length normalization; probes without frames get a score of 0
+    frames = numpy.array([probe.t for probe in probes], numpy.float64)
+    valid = numpy.abs(frames) > numpy.finfo(numpy.float64).eps
+    scores[:,valid] /= frames[valid]
+    scores[:,~valid] = 0.
+    return scores
+
 
 
 
@@ -315,6 +356,10 @@ class UBMGMMRegular (UBMGMM):
       score += model.forward(probe[i,:]) - self.m_ubm.forward(probe[i,:])
     return score/probe.shape[0]
 
+  def score_matrix(self, models, probes, multiple_probes = False):
+    """The log-likelihood ratio scores are not linear, so they are computed pair by pair"""
+    return Tool.score_matrix(self, models, probes, multiple_probes)
+
 
 
 
@@ -342,7 +387,7 @@ class UBMGMMVideo(UBMGMM):
 
     utils.warn("In its current version, this class has not been tested. Use it with care!")
 
-  def train_projector(self, train_features, projector_file):
+  def train_projector(self, train_files, projector_file):
     """Computes the Universal Background Model from the training ("world") data"""
     utils.info("  -> Training UBM model with %d training files" % len(train_files))
     # Loads the data into an array
@@ -355,6 +400,16 @@ class UBMGMMVideo(UBMGMM):
     self._train_projector_using_array(array, projector_file)
 
 
+  def frame_selector(self):
+    """Returns a frame selector that selects all frames of a video that are used by this tool.
+    It can be used to restrict the preprocessing and feature extraction of the videos to these frames."""
+    return utils.video.UnionFrameSelector([
+        self.m_frame_selector_for_projector_training,
+        self.m_frame_selector_for_projection,
+        self.m_frame_selector_for_enroll
+    ])
+
+
   def read_feature(self, feature_file):
     return utils.video.FrameContainer(str(feature_file))
 
@@ -365,9 +420,13 @@ class UBMGMMVideo(UBMGMM):
     if frame_selector is None:
       frame_selector = self.m_frame_selector_for_projection
 
-    # Collect all feature vectors across all frames in a single array set
-    array = numpy.vstack([data for data in frame_selector(frame_container)])
-    return self._project_using_array(array)
+    # Accumulate the statistics frame by frame, without collecting the feature vectors of all frames;
+    # a new GMMStats object is returned, so that the statistics of several videos can be kept
+    gmm_stats = bob.machine.GMMStats(self.m_ubm.dim_c, self.m_ubm.dim_d)
+    for data in frame_selector(frame_container):
+      self.m_ubm.acc_statistics(data, gmm_stats)
+    utils.debug(" .... Projected %d feature vectors" % gmm_stats.t)
+    return gmm_stats
 
 
   def enroll(self, frame_containers):
@@ -4,17 +4,30 @@
 
 """Tool chain for computing verification scores"""
 
-from Tool import Tool
-from Dummy import Dummy
-from GaborJets import GaborJets
-from LGBPHS import LGBPHS
-from UBMGMM import UBMGMM, UBMGMMRegular, UBMGMMVideo
-from JFA import JFA
-from ISV import ISV, ISVVideo
-from IVector import IVector
-from PCA import PCA
-from LDA import LDA
-from PLDA import PLDA
-from BIC import BIC
-from ParallelUBMGMM import ParallelUBMGMM
+import sys
+from ..utils.lazy import LazyModule
 
+# the classes are imported from their modules only when they are used, which keeps the start-up of the scripts fast
+sys.modules[__name__] = LazyModule(
+    sys.modules[__name__],
+    {
+        'Tool' : 'Tool',
+        'Checkpoint' : 'Checkpoint',
+        'Dummy' : 'Dummy',
+        'GaborJets' : 'GaborJets',
+        'LGBPHS' : 'LGBPHS',
+        'UBMGMM' : 'UBMGMM',
+        'UBMGMMRegular' : 'UBMGMM',
+        'UBMGMMVideo' : 'UBMGMM',
+        'JFA' : 'JFA',
+        'ISV' : 'ISV',
+        'ISVVideo' : 'ISV',
+        'IVector' : 'IVector',
+        'PCA' : 'PCA',
+        'LDA' : 'LDA',
+        'PLDA' : 'PLDA',
+        'BIC' : 'BIC',
+        'ParallelUBMGMM' : 'ParallelUBMGMM'
+    },
+    modules = ('ParallelEM',)
+)
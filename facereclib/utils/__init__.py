@@ -7,9 +7,11 @@ import video
 import histogram
 import tests
 import resources
+import gabor
+import work_queue
 from logger import add_logger_command_line_option, set_verbosity_level, add_bob_handlers, debug, info, warn, error
 from annotations import read_annotations
-from grid import GridParameters
+from grid import GridParameters, split_by_costs, memory_in_bytes
 
 import os
 import bob
@@ -18,6 +18,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import shutil
+import tempfile
+import numpy
 from .logger import warn, info
 
 def read_annotations(file_name, annotation_type):
@@ -148,3 +151,110 @@ def read_annotations(file_name, annotation_type):
     warn("The eye annotations in file '%s' might be exchanged!" % file_name)
 
   return annotations
+
+
+class AnnotationIndex:
+  """A compact index of the annotations of many files, which is stored as a directory of numpy arrays.
+  The annotations are stored column-wise: the sorted relative paths of the files, the offsets of their entries,
+  and, for each entry, the index of the keypoint name and its position (y,x).
+  When the index is loaded, the arrays are memory-mapped, so that each lookup reads only the required parts."""
+
+  # the arrays that are stored in the index directory
+  ARRAYS = ('source', 'paths', 'missing', 'offsets', 'labels', 'label_ids', 'positions')
+  # the annotation types that contain only keypoint positions, which can be stored in the index
+  SUPPORTED_TYPES = ('eyecenter', 'multipie', 'scface', 'named', 'cosmin')
+
+  def __init__(self, directory):
+    """Loads the annotation index from the given directory"""
+    arrays = dict((name, numpy.load(os.path.join(directory, name + '.npy'), mmap_mode = 'r')) for name in self.ARRAYS)
+    self.source = tuple(str(s) for s in arrays['source'])
+    self.m_paths = arrays['paths']
+    self.m_missing = arrays['missing']
+    self.m_offsets = arrays['offsets']
+    self.m_labels = [str(label) for label in arrays['labels']]
+    self.m_label_ids = arrays['label_ids']
+    self.m_positions = arrays['positions']
+
+
+  def __len__(self):
+    return len(self.m_paths)
+
+
+  def __contains__(self, path):
+    return self.__index__(path) is not None
+
+
+  def __index__(self, path):
+    """Returns the index of the given path, or None if it is not in the index"""
+    index = numpy.searchsorted(self.m_paths, path)
+    if index < len(self.m_paths) and self.m_paths[index] == path:
+      return index
+    return None
+
+
+  def annotations(self, path):
+    """Returns the annotations of the file with the given relative path as a dictionary from keypoint name to the position (y,x).
+    If the annotation file was not found when the index was created, an IOError is raised; a KeyError is raised for unknown paths."""
+    index = self.__index__(path)
+    if index is None:
+      raise KeyError("The path '%s' is not in the annotation index" % path)
+    if self.m_missing[index]:
+      raise IOError("The annotation file of '%s' was not found" % path)
+    begin, end = self.m_offsets[index], self.m_offsets[index+1]
+    return dict((self.m_labels[label_id], (float(position[0]), float(position[1]))) for label_id, position in zip(self.m_label_ids[begin:end], self.m_positions[begin:end]))
+
+
+  @staticmethod
+  def supports(annotation_type):
+    """Returns True if annotations of the given type can be stored in an index.
+    Other types, e.g. 'enumerated', which returns a list of annotations including the gender, need to be read with read_annotations."""
+    return str(annotation_type) in AnnotationIndex.SUPPORTED_TYPES
+
+
+  @staticmethod
+  def create(directory, annotation_files, annotation_type, source = ()):
+    """Parses the given annotation files and writes the index into the given directory.
+    The annotation_files is a dictionary from the relative path of each file to the name of its annotation file.
+    The source is a list of strings that describes the origin of the annotations; it is stored in the index and can be used to check if the index is up to date.
+    The index is first written to a temporary directory, which is renamed at the end, so that concurrent processes never read an incomplete index.
+    A ValueError is raised for annotation types that are not supported (see :py:meth:`supports`)."""
+    if not AnnotationIndex.supports(annotation_type):
+      raise ValueError("The annotation type '%s' cannot be stored in an annotation index; only the types %s are supported" % (annotation_type, ", ".join(AnnotationIndex.SUPPORTED_TYPES)))
+    paths = sorted(annotation_files.keys())
+    labels = {}
+    missing = numpy.zeros((len(paths),), numpy.bool)
+    offsets = numpy.zeros((len(paths)+1,), numpy.int64)
+    label_ids, positions = [], []
+    for index, path in enumerate(paths):
+      try:
+        annotations = read_annotations(annotation_files[path], annotation_type) or {}
+      except IOError:
+        missing[index] = True
+        annotations = {}
+      for label in sorted(annotations.keys()):
+        if len(annotations[label]) != 2:
+          raise ValueError("The annotation '%s' in file '%s' is not a position (y,x) and cannot be stored in an annotation index" % (label, annotation_files[path]))
+        label_ids.append(labels.setdefault(label, len(labels)))
+        positions.append(annotations[label])
+      offsets[index+1] = len(label_ids)
+
+    arrays = {
+        'source' : numpy.array([str(s) for s in source], numpy.str_),
+        'paths' : numpy.array(paths, numpy.str_) if paths else numpy.zeros((0,), 'S1'),
+        'missing' : missing,
+        'offsets' : offsets,
+        'labels' : numpy.array(sorted(labels, key = labels.get), numpy.str_) if labels else numpy.zeros((0,), 'S1'),
+        'label_ids' : numpy.array(label_ids, numpy.int32),
+        'positions' : numpy.array(positions, numpy.float64).reshape((len(positions), 2))
+    }
+
+    temp_directory = tempfile.mkdtemp(prefix = os.path.basename(directory.rstrip(os.sep)) + '.', dir = os.path.dirname(os.path.abspath(directory)))
+    for name in AnnotationIndex.ARRAYS:
+      numpy.save(os.path.join(temp_directory, name + '.npy'), arrays[name])
+    try:
+      os.rename(temp_directory, directory)
+    except OSError:
+      # another process has created the index in the meantime
+      shutil.rmtree(temp_directory)
+    info("Wrote annotation index of %d files to '%s'" % (len(paths), directory))
+    return AnnotationIndex(directory)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+"""Shared Gabor wavelet transforms for all Gabor-based feature extractors and tools"""
+
+import bob
+import numpy
+import math
+import os
+import hashlib
+import collections
+
+from .logger import debug
+
+class GaborTransform:
+  """Computes Gabor wavelet transforms with the given parameters.
+  The bob.ip.GaborWaveletTransform (and, hence, its kernels) is kept for each image resolution.
+  The transforms of the latest images are cached in memory, so that several extractors can use the transform of the same image,
+  and, if a cache directory is given, the transforms are stored on disk as well."""
+
+  def __init__(self, parameters, cache_directory = None, cache_size = 4):
+    self.m_parameters = parameters
+    self.m_cache_directory = cache_directory
+    self.m_cache_size = cache_size
+    self.m_gwts = {}
+    self.m_trafo_images = collections.OrderedDict()
+
+
+  def gwt(self, shape = None):
+    """Returns the bob.ip.GaborWaveletTransform for images of the given shape"""
+    shape = tuple(shape) if shape is not None else None
+    if shape not in self.m_gwts:
+      self.m_gwts[shape] = bob.ip.GaborWaveletTransform(**self.m_parameters)
+    return self.m_gwts[shape]
+
+
+  @property
+  def number_of_kernels(self):
+    return self.gwt().number_of_kernels
+
+
+  def __key__(self, image):
+    """Returns a key that identifies the content of the given image"""
+    image = numpy.ascontiguousarray(image, numpy.float64)
+    return "%dx%d-%s" % (image.shape[0], image.shape[1], hashlib.sha1(image.data).hexdigest())
+
+
+  def __cache_file__(self, key):
+    return os.path.join(self.m_cache_directory, key + ".hdf5")
+
+
+  def trafo_image(self, image):
+    """Returns the complex Gabor wavelet transform of the given image with shape (kernels, height, width).
+    The returned array is shared between all users of this transform and must not be modified."""
+    key = self.__key__(image)
+    if key in self.m_trafo_images:
+      return self.m_trafo_images[key]
+
+    trafo_image = None
+    if self.m_cache_directory is not None and os.path.exists(self.__cache_file__(key)):
+      debug("Reading Gabor wavelet transform from file '%s'" % self.__cache_file__(key))
+      trafo_image = bob.io.load(self.__cache_file__(key))
+
+    if trafo_image is None:
+      gwt = self.gwt(image.shape)
+      trafo_image = gwt.empty_trafo_image(image)
+      gwt(image.astype(numpy.complex128), trafo_image)
+      if self.m_cache_directory is not None:
+        from . import ensure_dir
+        ensure_dir(self.m_cache_directory)
+        bob.io.save(trafo_image, self.__cache_file__(key))
+
+    self.m_trafo_images[key] = trafo_image
+    if len(self.m_trafo_images) > self.m_cache_size:
+      self.m_trafo_images.popitem(last = False)
+    return trafo_image
+
+
+  def __jets__(self, trafo_image, include_phases):
+    """Computes the (not normalized) Gabor jet image of shape (height, width, [2,] kernels) from the given transform"""
+    absolute = numpy.abs(trafo_image).transpose((1,2,0))
+    if not include_phases:
+      return absolute
+    jet_image = numpy.ndarray(absolute.shape[:2] + (2, absolute.shape[2]), numpy.float64)
+    jet_image[:,:,0,:] = absolute
+    jet_image[:,:,1,:] = numpy.angle(trafo_image).transpose((1,2,0))
+    return jet_image
+
+
+  def jet_image(self, image, include_phases):
+    """Returns the (not normalized) Gabor jet image of the given image, which is computed from the (cached) transform of the image.
+    The jet image is identical to the one of bob.ip.GaborWaveletTransform.compute_jets; the returned array is newly allocated."""
+    return self.__jets__(self.trafo_image(image), include_phases)
+
+
+# the transforms that are shared between all extractors and tools
+_transforms = {}
+
+def gabor_transform(
+    gabor_directions = 8,
+    gabor_scales = 5,
+    gabor_sigma = 2. * math.pi,
+    gabor_maximum_frequency = math.pi / 2.,
+    gabor_frequency_step = math.sqrt(.5),
+    gabor_power_of_k = 0,
+    gabor_dc_free = True,
+    cache_directory = None
+):
+  """Returns the shared GaborTransform for the given Gabor parameters (and cache directory)"""
+  parameters = {
+      'number_of_scales' : gabor_scales,
+      'number_of_angles' : gabor_directions,
+      'sigma' : gabor_sigma,
+      'k_max' : gabor_maximum_frequency,
+      'k_fac' : gabor_frequency_step,
+      'pow_of_k' : gabor_power_of_k,
+      'dc_free' : gabor_dc_free
+  }
+  key = (tuple(sorted(parameters.items())), cache_directory)
+  if key not in _transforms:
+    _transforms[key] = GaborTransform(parameters, cache_directory)
+  return _transforms[key]
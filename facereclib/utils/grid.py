@@ -17,6 +17,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import bisect
 
 PREDEFINED_QUEUES = {
   'default'     : {},
@@ -37,7 +38,7 @@ class GridParameters:
 
   def __init__(
     self,
-    # grid type, currently supported 'local' and 'sge'
+    # grid type, currently supported 'local', 'sge' and 'workers'
     grid = 'sge',
     # parameters for the splitting of jobs into array jobs
     number_of_preprocessings_per_job = 1000,
@@ -54,9 +55,24 @@ class GridParameters:
     enrollment_queue = 'default',
     scoring_queue = 'default',
 
-    # setup of the local submission and execution of job (only used if grid = 'local')
+    # setup of the local submission and execution of job (only used if grid = 'local' or grid = 'workers')
     number_of_parallel_processes = 1,
-    scheduler_sleep_time = 1.0 # sleep time for scheduler in seconds
+    scheduler_sleep_time = 1.0, # sleep time for scheduler in seconds
+
+    # setup of the worker processes (only used if grid = 'workers')
+    worker_grid = 'local', # where the number_of_parallel_processes workers run, either 'local' or 'sge' (one worker per task of an array job)
+    worker_queue = '8G', # the queue of the workers in the SGE grid
+    work_queue = 'sqlite', # the work queue, either 'sqlite' (single machine or SGE) or 'filesystem' (any machine that mounts the temp directory can join)
+    # the time in seconds after which work units of the 'filesystem' queue are given to other workers, when their worker stopped responding;
+    # the lease is renewed by a separate process every lease_time/4 seconds, but lease_time should still be longer than the longest single native (bob) call of a job
+    lease_time = 300.,
+
+    # balance the items of the parallel jobs of one stage by their estimated costs, keeping the number of jobs
+    balance_jobs = True,
+
+    # the memory that the workers on one machine may use at the same time, e.g. '32G' (default: the total memory of the machine)
+    # the memory required by a job is the 'memfree' of its queue
+    memory_limit = None
   ):
 
     self.grid_type = grid
@@ -76,6 +92,15 @@ class GridParameters:
     # the local setup
     self.number_of_parallel_processes = number_of_parallel_processes
     self.scheduler_sleep_time = scheduler_sleep_time
+    # the workers
+    self.worker_grid = worker_grid
+    self.worker_queue = self.queue(worker_queue)
+    self.work_queue = work_queue
+    self.lease_time = lease_time
+    # the job splitting
+    self.balance_jobs = balance_jobs
+    # the memory limit of the workers
+    self.memory_limit = memory_in_bytes(memory_limit)
 
 
 
@@ -93,4 +118,53 @@ class GridParameters:
 
   def is_local(self):
     """Returns whether this grid setup should use the local submission or the SGE grid."""
-    return self.grid_type == 'local'
+    return self.grid_type == 'local' or (self.grid_type == 'workers' and self.worker_grid == 'local')
+
+
+  def uses_workers(self):
+    """Returns whether the jobs are executed by worker processes, which pull their tasks from a work queue."""
+    return self.grid_type == 'workers'
+
+
+
+def memory_in_bytes(memory):
+  """Converts the given memory specification (e.g. the 'memfree' of a queue like '8G' or '512M') to bytes; None is returned unchanged."""
+  if memory is None or isinstance(memory, (int, long, float)):
+    return memory
+  units = {'K' : 1024, 'M' : 1024**2, 'G' : 1024**3, 'T' : 1024**4}
+  memory = memory.strip().upper()
+  if memory[-1] in units:
+    return int(float(memory[:-1]) * units[memory[-1]])
+  return int(memory)
+
+
+def split_by_costs(costs, number_of_jobs):
+  """Splits the items with the given (estimated) costs into at most the given number of contiguous index ranges [(first, last), ...], such that the total costs of the ranges are approximately equal.
+  Each range contains at least one item; if all costs are zero, all items are assumed to have the same cost."""
+  count = len(costs)
+  number_of_jobs = min(number_of_jobs, count)
+  if not sum(costs) > 0:
+    costs = [1.] * count
+  cumulative = []
+  total = 0.
+  for cost in costs:
+    total += max(cost, 0.)
+    cumulative.append(total)
+
+  ranges = []
+  first = 0
+  for job in range(number_of_jobs):
+    if job == number_of_jobs - 1:
+      last = count
+    else:
+      # end the range at the item boundary that is closest to an equal share of the remaining costs
+      done = cumulative[first-1] if first else 0.
+      share = done + (total - done) / (number_of_jobs - job)
+      last = bisect.bisect_left(cumulative, share) + 1
+      if last > 1 and share - cumulative[last-2] < cumulative[last-1] - share:
+        last -= 1
+      # leave at least one item for this and for each of the remaining jobs
+      last = max(first + 1, min(last, count - (number_of_jobs - job - 1)))
+    ranges.append((first, last))
+    first = last
+  return ranges
@@ -24,11 +24,90 @@ def sparsify(array):
   if len(array.shape) == 2 and array.shape[0] == 2:
     return array
   assert len(array.shape) == 1
-  indices = []
-  values = []
-  for i in range(array.shape[0]):
-    if array[i] != 0.:
-      indices.append(i)
-      values.append(array[i])
-
-  return numpy.array([indices, values], dtype = numpy.float64)
+  indices = numpy.nonzero(array)[0]
+  return numpy.array([indices, array[indices]], dtype = numpy.float64)
+
+
+def average(histograms):
+  """Computes the average of the given histograms, which are either all dense or all sparse.
+  The entries of sparse histograms are merged by their indices; the result is a sparse histogram with sorted indices."""
+  if histograms[0].ndim == 2 and histograms[0].shape[0] == 2:
+    indices, positions = numpy.unique(numpy.hstack([histogram[0] for histogram in histograms]), return_inverse = True)
+    values = numpy.bincount(positions, weights = numpy.hstack([histogram[1] for histogram in histograms]))
+    return numpy.array([indices, values / float(len(histograms))], dtype = numpy.float64)
+  return numpy.mean(numpy.array(histograms, dtype = numpy.float64), axis = 0)
+
+
+def _sparse_entries(histograms):
+  """Concatenates the entries of the given sparse histograms; returns the indices, the values and the number of the histogram of each entry."""
+  indices = numpy.hstack([histogram[0] for histogram in histograms]).astype(numpy.int64)
+  values = numpy.hstack([histogram[1] for histogram in histograms])
+  owners = numpy.repeat(numpy.arange(len(histograms)), [histogram.shape[1] for histogram in histograms])
+  return indices, values, owners
+
+def _dense_probe(probe, length):
+  """Returns the given (sparse or dense) probe histogram as a dense histogram with at least the given length."""
+  if probe.ndim == 2 and probe.shape[0] == 2:
+    length = max(length, int(probe[0].max()) + 1 if probe.shape[1] else 0)
+    dense = numpy.zeros((length,), numpy.float64)
+    dense[probe[0].astype(numpy.int64)] = probe[1]
+    return dense
+  return probe.flatten()
+
+
+class StackedHistograms:
+  """The histograms of several models, which are stacked once to be compared with many probes.
+  Sparse models are concatenated into their entries, dense models into blocks of rows."""
+
+  def __init__(self, models, block_size = 16):
+    self.count = len(models)
+    self.sparse = models[0].ndim == 2 and models[0].shape[0] == 2
+    if self.sparse:
+      self.indices, self.values, self.owners = _sparse_entries(models)
+      self.length = int(self.indices.max()) + 1 if len(self.indices) else 0
+    else:
+      # blocks of dense models limit the memory usage of the comparison
+      self.blocks = [numpy.array([model.flatten() for model in models[first:first+block_size]], dtype = numpy.float64) for first in range(0, len(models), block_size)]
+
+
+def _compare(models, probe, sparse_function, dense_function, block_size):
+  """Compares the probe with all models, using the given kernels for sparse and dense models."""
+  if not isinstance(models, StackedHistograms):
+    models = StackedHistograms(models, block_size)
+  if models.sparse:
+    dense_probe = _dense_probe(probe, models.length)
+    return sparse_function(models.values, dense_probe[models.indices], models.owners, models.count, dense_probe)
+  dense_probe = _dense_probe(probe, 0)
+  return numpy.hstack([dense_function(block, dense_probe) for block in models.blocks])
+
+
+def _chi_square_sparse(values, probe_values, owners, count, dense_probe):
+  """Chi-square distances of sparse models, computed from the model entries and the sum of the probe."""
+  sums = values + probe_values
+  # entries that are only in the probe contribute their probe value
+  terms = numpy.where(sums > 0., (values - probe_values) ** 2 / numpy.where(sums > 0., sums, 1.), 0.) - probe_values
+  return numpy.bincount(owners, weights = terms, minlength = count) + numpy.sum(dense_probe)
+
+def _chi_square_dense(models, probe):
+  """Chi-square distances of the rows of the given model matrix."""
+  sums = models + probe
+  return numpy.sum(numpy.where(sums > 0., (models - probe) ** 2 / numpy.where(sums > 0., sums, 1.), 0.), axis = 1)
+
+def chi_square(models, probe, block_size = 16):
+  """Computes the chi-square distances between all given models and the given probe histogram at once.
+  The models are either all dense or all sparse, or already stacked as :py:class:`StackedHistograms`; the probe might be sparse or dense."""
+  return _compare(models, probe, _chi_square_sparse, _chi_square_dense, block_size)
+
+
+def _intersection_sparse(values, probe_values, owners, count, dense_probe):
+  """Histogram intersections of sparse models; only bins that are contained in the model contribute."""
+  return numpy.bincount(owners, weights = numpy.minimum(values, probe_values), minlength = count)
+
+def _intersection_dense(models, probe):
+  """Histogram intersections of the rows of the given model matrix."""
+  return numpy.sum(numpy.minimum(models, probe), axis = 1)
+
+def histogram_intersection(models, probe, block_size = 16):
+  """Computes the histogram intersections between all given models and the given probe histogram at once.
+  The models are either all dense or all sparse, or already stacked as :py:class:`StackedHistograms`; the probe might be sparse or dense."""
+  return _compare(models, probe, _intersection_sparse, _intersection_dense, block_size)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+"""Lazy import of the classes of a package"""
+
+import sys
+import types
+import importlib
+
+
+class LazyModule (types.ModuleType):
+  """A replacement for a package module, which imports the modules that define the classes of the package only when the classes are accessed.
+  Use it at the end of the ``__init__.py`` of a package as::
+
+    sys.modules[__name__] = LazyModule(sys.modules[__name__], {'ClassName' : 'ModuleName', ...})
+  """
+
+  def __init__(self, module, attributes, modules = ()):
+    """Replaces the given package module.
+
+    attributes
+      A dictionary from the name of each class (or function) of the package to the name of the module of the package that defines it.
+
+    modules
+      The names of modules of the package that are accessible as attributes of the package.
+    """
+    types.ModuleType.__init__(self, module.__name__, module.__doc__)
+    self.__dict__.update(module.__dict__)
+    # keep the original module alive, since python clears the globals of deleted modules
+    self.__dict__['_LazyModule__module'] = module
+    self.__dict__['_LazyModule__attributes'] = dict(attributes)
+    self.__dict__['_LazyModule__attributes'].update((name, None) for name in modules)
+    self.__dict__['__all__'] = sorted(self.__dict__['_LazyModule__attributes'].keys())
+
+
+  def __getattr__(self, name):
+    attributes = self.__dict__['_LazyModule__attributes']
+    if name not in attributes:
+      raise AttributeError("module '%s' has no attribute '%s'" % (self.__name__, name))
+    importlib.import_module('.' + (attributes[name] or name), self.__name__)
+    self.__bind__()
+    return self.__dict__[name]
+
+
+  def __getattribute__(self, name):
+    value = types.ModuleType.__getattribute__(self, name)
+    if isinstance(value, types.ModuleType) and types.ModuleType.__getattribute__(self, '_LazyModule__attributes').get(name) is not None:
+      # a module of the package was imported directly (e.g. ``import package.ClassName``), which binds the module instead of its class
+      self.__bind__()
+      value = types.ModuleType.__getattribute__(self, name)
+    return value
+
+
+  def __bind__(self):
+    """Binds the classes of all modules of the package that are imported already.
+    Importing a module of the package binds the module to its name in the package, which is replaced by the class of the same name."""
+    for name, module_name in self.__dict__['_LazyModule__attributes'].iteritems():
+      if module_name is not None:
+        module = sys.modules.get(self.__name__ + '.' + module_name)
+        if module is not None and hasattr(module, name):
+          self.__dict__[name] = getattr(module, name)
+
+
+  def __dir__(self):
+    return sorted(set(self.__dict__.keys()) | set(self.__dict__['_LazyModule__attributes'].keys()))
@@ -19,8 +19,13 @@
 
 import imp
 import os
-import pkg_resources
-from .logger import info
+import sys
+import glob
+import hashlib
+import cPickle
+import tempfile
+import importlib
+from .logger import debug, info
 
 
 def read_config_file(file, keyword = None):
@@ -45,8 +50,76 @@ def read_config_file(file, keyword = None):
   return eval('config.' + keyword)
 
 
+class _EntryPoint:
+  """A light-weight copy of a pkg_resources.EntryPoint, which is stored in the resource registry"""
+
+  def __init__(self, entry_point):
+    self.name = entry_point.name
+    self.module_name = entry_point.module_name
+    self.attrs = tuple(entry_point.attrs)
+    self.dist = str(entry_point.dist)
+    self.project_name = entry_point.dist.project_name
+
+  def load(self):
+    """Imports the module of the entry point and returns the registered object"""
+    entry = importlib.import_module(self.module_name)
+    for attr in self.attrs:
+      entry = getattr(entry, attr)
+    return entry
+
+
+# the registry of all resources, which is read only once per process
+_registry = None
+
+def _installation_key():
+  """Returns a key that changes whenever packages (or their entry points) are installed, removed or changed"""
+  stamps = [sys.version]
+  for path in sys.path:
+    if os.path.exists(path):
+      stamps.append("%s:%s" % (path, os.path.getmtime(path)))
+    if os.path.isdir(path):
+      for entry_points in glob.glob(os.path.join(path, '*.egg-info', 'entry_points.txt')) + glob.glob(os.path.join(path, '*.dist-info', 'entry_points.txt')) + glob.glob(os.path.join(path, 'EGG-INFO', 'entry_points.txt')):
+        stamps.append("%s:%s" % (entry_points, os.path.getmtime(entry_points)))
+  return hashlib.sha1("\n".join(stamps)).hexdigest()
+
+def _registry_file(key):
+  """Returns the name of the file that caches the resource registry of the current installation"""
+  directory = os.environ.get('FACERECLIB_RESOURCE_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'facereclib'))
+  return os.path.join(directory, 'resources-%s.pickle' % key)
+
+def _get_registry():
+  """Returns the registry of all resources of all installed packages, which maps the keyword to the list of entry points.
+  The registry is cached on disk for the current installation, so that pkg_resources does not need to scan all packages in each process."""
+  global _registry
+  if _registry is None:
+    registry_file = _registry_file(_installation_key())
+    try:
+      with open(registry_file, 'rb') as f:
+        _registry = cPickle.load(f)
+    except Exception:
+      _registry = None
+
+    if _registry is None:
+      import pkg_resources
+      _registry = {}
+      for distribution in pkg_resources.working_set:
+        for group, entry_points in distribution.get_entry_map().iteritems():
+          if group.startswith('facereclib.'):
+            _registry.setdefault(group[len('facereclib.'):], []).extend(_EntryPoint(entry_point) for entry_point in entry_points.values())
+      # write the registry, ignoring any errors
+      try:
+        if not os.path.exists(os.path.dirname(registry_file)):
+          os.makedirs(os.path.dirname(registry_file))
+        handle, temp_file = tempfile.mkstemp(dir = os.path.dirname(registry_file), prefix = '.resources_')
+        with os.fdopen(handle, 'wb') as f:
+          cPickle.dump(_registry, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(temp_file, registry_file)
+      except Exception as e:
+        debug("Could not write the resource registry to '%s': %s" % (registry_file, e))
+  return _registry
+
 def _get_entry_points(keyword):
-  return  [entry_point for entry_point in pkg_resources.iter_entry_points('facereclib.' + keyword)]
+  return list(_get_registry().get(keyword, []))
 
 def resource_keys(keyword):
   """Reads and returns all resources that are registered with the given keyword."""
@@ -80,12 +153,12 @@ def load_resource(resource, keyword, imports = ['facereclib'], preferred_distrib
       index = -1
       if preferred_distribution:
         for i,p in enumerate(entry_points):
-          if p.dist.project_name == preferred_distribution: index = i
+          if p.project_name == preferred_distribution: index = i
 
       if index == -1:
         if len(entry_points) == 2:
-          if entry_points[0].dist.project_name == 'facereclib': index = 1
-          elif entry_points[1].dist.project_name == 'facereclib': index = 0
+          if entry_points[0].project_name == 'facereclib': index = 1
+          elif entry_points[1].project_name == 'facereclib': index = 0
 
       if index != -1:
         info("RESOURCES: Using the resource '%s' from '%s', and ignoring the one from '%s'" %(resource, entry_points[index].module_name, entry_points[1-index].module_name))
@@ -129,8 +202,8 @@ def read_file_resource(resource, keyword):
     # Now: check if there are only two entry points, and one is from the facereclib, then use the other one
     index = -1
     if len(entry_points) == 2:
-      if entry_points[0].dist.project_name == 'facereclib': index = 1
-      elif entry_points[1].dist.project_name == 'facereclib': index = 0
+      if entry_points[0].project_name == 'facereclib': index = 1
+      elif entry_points[1].project_name == 'facereclib': index = 0
 
     if index != -1:
       info("RESOURCES: Using the resource '%s' from '%s', and ignoring the one from '%s'" %(resource, entry_points[index].module_name, entry_points[1-index].module_name))
@@ -146,9 +219,9 @@ def print_resources(keyword):
   entry_points = _get_entry_points(keyword)
   last_dist = None
   for entry_point in entry_points:
-    if last_dist != str(entry_point.dist):
-      print "\n-", str(entry_point.dist) + ":"
-      last_dist = str(entry_point.dist)
+    if last_dist != entry_point.dist:
+      print "\n-", entry_point.dist + ":"
+      last_dist = entry_point.dist
 
     if len(entry_point.attrs):
       print "  +", entry_point.name, "  -->", entry_point.module_name, ":", entry_point.attrs[0]
@@ -8,71 +8,157 @@ import numpy
 
 class FrameContainer:
   """A class for reading, manipulating and saving video content.
-  A VideoFrameContainer contains data for each of several frames. The data for a frame may represent e.g. a still image, or features extracted from an image. When loaded from or saved to a HDF5 file format, the contents are as follows:
+  A VideoFrameContainer contains data for each of several frames. The data for a frame may represent e.g. a still image, or features extracted from an image.
+  When all frames (and all quality vectors) have the same shape, the contents of the HDF5 file are as follows:
+      /frame_ids, an integer vector with the frame_id of each frame
+      /frames, a list of the frame data, which is stored as a single stacked dataset
+      /qualities (optional), a 2D array that stores the vector of quality measures of each frame in one row
+  Otherwise (and in files written by older versions), the contents are:
       /data/<frame_id>, where each <frame_id> is an integer
       /quality/<frame_id> (optional), where each <frame_id> is an integer, stores a vector of quality measures
+
+  The frame data of a container read from file is loaded lazily, i.e., only when the frame is requested, so that selecting a few frames does not load the whole video.
   """
 
   def __init__(self, filename = None):
+    # the list of (frame_id, data, quality), where data is None for frames that are not loaded yet
     self._frames = []
+    # for each frame, the (key, position) in the file, from where its data is loaded
+    self._locations = []
+    self._filename = filename
     if filename:
-      # Read content (frames) from HDF5File
       f = bob.io.HDF5File(filename, "r")
-      f.cd('/data/')
-      for path in f.paths():
-        # Resolve frame_id
-        m = re.match('/data/([0-9]*)', path)
-        if not m: raise Exception('Failed to read frame_id')
-        frame_id = int(m.group(1))
-
-        # Read frame
-        data = f.read(path)
-        # - read corresponding quality vector if provided
-        if f.has_group('/quality') and f.has_key('/quality/' + str(frame_id)):
-          quality = f.read('/quality/' + str(frame_id))
-        else:
-          quality = None
-
-        self._frames.append((frame_id, data, quality))
+      if f.has_key('/frame_ids'):
+        # stacked layout; only the frame ids and the quality vectors are read
+        frame_ids = f.read('/frame_ids')
+        qualities = f.read('/qualities') if f.has_key('/qualities') else [None] * len(frame_ids)
+        for position, (frame_id, quality) in enumerate(zip(frame_ids, qualities)):
+          self._frames.append((int(frame_id), None, quality))
+          self._locations.append(('/frames', position))
+      else:
+        # one dataset per frame
+        f.cd('/data/')
+        for path in f.paths():
+          # Resolve frame_id
+          m = re.match('/data/([0-9]*)', path)
+          if not m: raise Exception('Failed to read frame_id')
+          frame_id = int(m.group(1))
+
+          # read corresponding quality vector if provided
+          if f.has_group('/quality') and f.has_key('/quality/' + str(frame_id)):
+            quality = f.read('/quality/' + str(frame_id))
+          else:
+            quality = None
+
+          self._frames.append((frame_id, None, quality))
+          self._locations.append((path, None))
 
       del f
 
-  def frames(self):
-    """Generator that returns the 3-tuple (frame_id, data, quality) for each frame."""
-    for frame in self._frames:
-      yield frame
+  def __len__(self):
+    return len(self._frames)
+
+  def frame_ids(self):
+    """Returns the list of frame_ids of all frames, without loading the frame data."""
+    return [frame[0] for frame in self._frames]
+
+  def qualities(self):
+    """Returns the list of quality vectors (or None) of all frames, without loading the frame data."""
+    return [frame[2] for frame in self._frames]
+
+  def frames(self, indices = None):
+    """Generator that returns the 3-tuple (frame_id, data, quality) for each frame, or only for the frames with the given indices (in the given order).
+    Only the data of the returned frames is loaded from file."""
+    f = None
+    for index in (range(len(self._frames)) if indices is None else indices):
+      frame_id, data, quality = self._frames[index]
+      if data is None:
+        # load the frame data from file; the file is opened only once for all frames
+        if f is None:
+          f = bob.io.HDF5File(self._filename, "r")
+        key, position = self._locations[index]
+        data = f.read(key) if position is None else f.read(key, position)
+      yield (frame_id, data, quality)
+    del f
+
+  def subset(self, indices):
+    """Returns a new FrameContainer with the frames of the given indices, keeping the order of the frames.
+    Frames that are not loaded yet are not loaded by this function."""
+    subset = FrameContainer()
+    subset._filename = self._filename
+    for index in sorted(set(indices)):
+      subset._frames.append(self._frames[index])
+      subset._locations.append(self._locations[index])
+    return subset
 
   def add_frame(self,frame_id,frame,quality=None):
     self._frames.append((frame_id,frame,quality))
+    self._locations.append(None)
+
+  def __is_stackable__(self, frames):
+    """Checks if all given frames and all quality vectors have the same shapes, so that they can be stored in the stacked layout"""
+    if not frames:
+      return False
+    first_data, first_quality = frames[0][1], frames[0][2]
+    for (frame_id, data, quality) in frames:
+      if data.shape != first_data.shape or data.dtype != first_data.dtype:
+        return False
+      if (quality is None) != (first_quality is None):
+        return False
+      if quality is not None and numpy.shape(quality) != numpy.shape(first_quality):
+        return False
+    return True
 
   def save(self,f):
     """ Save to the specified HDF5File """
-    f.create_group('/data')
-    f.create_group('/quality')
-    for (frame_id, data, quality) in self._frames:
-      f.set('/data/' + str(frame_id), data)
-      if quality is not None:
-        f.set('/quality/' + str(frame_id), quality)
+    frames = list(self.frames())
+    if self.__is_stackable__(frames):
+      f.set('/frame_ids', numpy.array([frame_id for (frame_id, data, quality) in frames], numpy.int64))
+      for (frame_id, data, quality) in frames:
+        f.append('/frames', data)
+      if frames[0][2] is not None:
+        f.set('/qualities', numpy.vstack([quality for (frame_id, data, quality) in frames]).astype(numpy.float64))
+    else:
+      f.create_group('/data')
+      f.create_group('/quality')
+      for (frame_id, data, quality) in frames:
+        f.set('/data/' + str(frame_id), data)
+        if quality is not None:
+          f.set('/quality/' + str(frame_id), quality)
 
   def __eq__(self, other):
     """Equality operator between frame containers."""
-    if len(self._frames) != len(other._frames): return False
-    for i in range(len(self._frames)):
-      if self._frames[i][0] != other._frames[i][0]: return False
-      if (numpy.abs(self._frames[i][1] - other._frames[i][1]) > 1e-5).any(): return False
-      if (self._frames[i][2] != other._frames[i][2]).any(): return False
+    if len(self) != len(other): return False
+    for frame, other_frame in zip(self.frames(), other.frames()):
+      if frame[0] != other_frame[0]: return False
+      if (numpy.abs(frame[1] - other_frame[1]) > 1e-5).any(): return False
+      if (frame[2] is None) != (other_frame[2] is None): return False
+      if frame[2] is not None and (frame[2] != other_frame[2]).any(): return False
     return True
 
 ###################################
 ### Frame selector classes ########
 
+def _sorted_indices(frame_container):
+  """Returns the indices of the frames of the given container, sorted by ascending frame_id."""
+  frame_ids = frame_container.frame_ids()
+  return sorted(range(len(frame_ids)), key=lambda i: frame_ids[i])
+
+
 class AllFrameSelector:
   """Selects all of the frames of a video."""
 
+  def __str__(self):
+    return "all"
+
+  def indices(self, frame_container):
+    """Returns the indices of all frames of the specified VideoFrameContainer, sorted by ascending frame_id."""
+    return _sorted_indices(frame_container)
+
   def __call__(self, frame_container):
     """Yields all frames of the specified VideoFrameContainer,
     sorted by ascending frame_id."""
-    for frame in sorted(frame_container.frames(), key=lambda x: x[0]):
+    for frame in frame_container.frames(self.indices(frame_container)):
       yield frame[1]
 
 
@@ -82,11 +168,18 @@ class FirstNFrameSelector:
   def __init__(self, N):
     self._N = N
 
+  def __str__(self):
+    return "first%d" % self._N
+
+  def indices(self, frame_container):
+    """Returns the indices of the N frames with the lowest frame_id."""
+    return _sorted_indices(frame_container)[:self._N]
+
   def __call__(self, frame_container):
-    """Yields the first N frames of the specified VideoFrameContainer. The video must contain at least N frames, otherwise the behaviour is unspecified."""
-    sorted_frames = sorted(frame_container.frames(), key=lambda x: x[0])
-    for n in range(self._N):
-      yield sorted_frames[n][1]
+    """Yields the first N frames of the specified VideoFrameContainer. The video must contain at least N frames, otherwise the behaviour is unspecified.
+    Only the selected frames are loaded."""
+    for frame in frame_container.frames(self.indices(frame_container)):
+      yield frame[1]
 
 
 class QualityNFrameSelector:
@@ -96,8 +189,56 @@ class QualityNFrameSelector:
     self._N = N
     self._k = k
 
+  def __str__(self):
+    return "quality%d-%d" % (self._N, self._k)
+
+  def indices(self, frame_container):
+    """Returns the indices of the N frames with highest quality, in descending order of quality (frames with the same quality are kept in their original order)."""
+    qualities = numpy.array([quality[self._k] for quality in frame_container.qualities()], numpy.float64)
+    candidates = numpy.arange(len(qualities))
+    if 0 < self._N < len(qualities):
+      # only the frames with at least the N'th highest quality need to be sorted
+      threshold = qualities[numpy.argpartition(-qualities, self._N - 1)[self._N - 1]]
+      candidates = numpy.flatnonzero(qualities >= threshold)
+    order = numpy.lexsort((candidates, -qualities[candidates]))
+    return [int(index) for index in candidates[order][:self._N]]
+
   def __call__(self, frame_container):
-    """Yields the N frames with highest value in the k'th field of their corresponding quality vectors (k>=0). The VideoFrameContainer must contain at least N frames, otherwise the behaviour is unspecified."""
-    sorted_frames = sorted(frame_container.frames(), key=lambda x: x[2][self._k], reverse=True)
-    for n in range(self._N):
-      yield sorted_frames[n][1]
+    """Yields the N frames with highest value in the k'th field of their corresponding quality vectors (k>=0). The VideoFrameContainer must contain at least N frames, otherwise the behaviour is unspecified.
+    Only the selected frames are loaded."""
+    for frame in frame_container.frames(self.indices(frame_container)):
+      yield frame[1]
+
+
+def restricts_frames(frame_selector):
+  """Returns True if the given frame selector can be used to restrict the frames of videos that are preprocessed and extracted.
+  For this, the selector needs to return the indices of the selected frames and define a string representation, which must not change between processes."""
+  str_function = getattr(frame_selector.__class__, '__str__', None)
+  return hasattr(frame_selector, 'indices') and str_function is not None and str_function is not object.__str__
+
+
+class UnionFrameSelector:
+  """Selects all frames that are selected by any of the given frame selectors.
+  This selector is used to restrict the preprocessing and feature extraction of videos to the frames that are used later on.
+  All frame selectors need to support the restriction, see :py:func:`restricts_frames`."""
+
+  def __init__(self, frame_selectors):
+    self._frame_selectors = list(frame_selectors)
+    for frame_selector in self._frame_selectors:
+      if not restricts_frames(frame_selector):
+        raise ValueError("The frame selector '%s' does not define the indices of the selected frames and a string representation" % frame_selector.__class__.__name__)
+
+  def __str__(self):
+    return "+".join(sorted(set(str(frame_selector) for frame_selector in self._frame_selectors)))
+
+  def indices(self, frame_container):
+    """Returns the indices of all frames that are selected by any of the frame selectors, in their original order."""
+    indices = set()
+    for frame_selector in self._frame_selectors:
+      indices.update(frame_selector.indices(frame_container))
+    return sorted(indices)
+
+  def __call__(self, frame_container):
+    """Yields the selected frames of the specified VideoFrameContainer, in their original order."""
+    for frame in frame_container.frames(self.indices(frame_container)):
+      yield frame[1]
@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+"""Work queues, from which worker processes pull the tasks of an experiment"""
+
+import os
+import time
+import errno
+import fcntl
+import hashlib
+import socket
+import sqlite3
+import cPickle
+import tempfile
+import multiprocessing
+from .logger import warn
+
+
+# the number of cores that the internal parallelization of a single job may use (None: no limit), see cores_for_job
+job_cores = None
+
+
+def cores_for_job(requested):
+  """Returns the number of processes or threads that a job may use for the given requested number.
+  Worker processes limit the number, since the other workers on the same machine use the remaining cores."""
+  return requested if job_cores is None else max(1, min(requested, job_cores))
+
+
+def worker_name():
+  """Returns a name for the current worker process, which is unique over all machines"""
+  return "%s-%d" % (socket.gethostname(), os.getpid())
+
+
+def machine_name(worker):
+  """Returns the name of the machine of the given worker name"""
+  return worker.rsplit('-', 1)[0]
+
+
+def total_memory():
+  """Returns the total memory of this machine in bytes, or None if it cannot be determined"""
+  try:
+    with open('/proc/meminfo') as f:
+      for line in f:
+        if line.startswith('MemTotal:'):
+          return int(line.split()[1]) * 1024
+  except IOError:
+    pass
+  return None
+
+
+def _check_dependencies(stage, dependencies, known_stages):
+  """Raises a ValueError if the given stage depends on stages that are not in the queue, e.g., on the ids of jobs that were submitted to the SGE grid"""
+  unknown = [dependency for dependency in dependencies if dependency not in known_stages]
+  if unknown:
+    raise ValueError("The stage '%s' depends on %s, which are not stages of the work queue" % (stage, unknown))
+
+
+class WorkUnit:
+  """A unit of work, i.e., the index range of the files (or models) of one stage of the tool chain.
+  An index range of None means that the whole stage is executed at once."""
+
+  def __init__(self, unit_id, stage, command, indices):
+    self.id = unit_id
+    self.stage = stage
+    self.command = command
+    self.indices = indices
+
+  def __str__(self):
+    return "%s%s" % (self.command, " with indices %s" % str(self.indices) if self.indices is not None else "")
+
+
+class SQLiteWorkQueue:
+  """A work queue that is stored in an SQLite database.
+  The stages of the experiment are added with their dependencies, and their work units are claimed by the workers in the order in which the stages were added.
+  A work unit can only be claimed when all work units of the stages it depends on are done, so that the work units of independent stages are executed concurrently.
+  Please note that SQLite databases should not be shared between machines via NFS."""
+
+  # work units are not leased, so that no heartbeat is required
+  lease_time = None
+
+  def __init__(self, filename):
+    self.m_filename = filename
+    self.m_connection = sqlite3.connect(filename, timeout = 600., isolation_level = None)
+    self.m_connection.executescript("""
+        CREATE TABLE IF NOT EXISTS stages (name TEXT PRIMARY KEY, command TEXT, position INTEGER, memory INTEGER);
+        CREATE TABLE IF NOT EXISTS dependencies (stage TEXT, dependency TEXT);
+        CREATE TABLE IF NOT EXISTS units (id INTEGER PRIMARY KEY AUTOINCREMENT, stage TEXT, first INTEGER, last INTEGER, state TEXT, worker TEXT, started REAL, finished REAL);
+    """)
+
+
+  def add_stage(self, name, command, index_ranges = None, dependencies = [], memory = 0):
+    """Adds a stage with the given name, which executes the given command for the given list of (first, last) index ranges (None: a single unit for the whole stage).
+    The stage is executed only after all work units of the given stages are done.
+    Each work unit of the stage requires the given memory in bytes, see :py:meth:`claim`."""
+    cursor = self.m_connection.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+      known = set(row[0] for row in cursor.execute("SELECT name FROM stages"))
+      _check_dependencies(name, dependencies, known)
+      position = len(known)
+      cursor.execute("INSERT INTO stages VALUES (?, ?, ?, ?)", (name, command, position, memory or 0))
+      cursor.executemany("INSERT INTO dependencies VALUES (?, ?)", [(name, dependency) for dependency in dependencies])
+      for indices in (index_ranges if index_ranges is not None else [None]):
+        first, last = indices if indices is not None else (None, None)
+        cursor.execute("INSERT INTO units (stage, first, last, state) VALUES (?, ?, ?, 'waiting')", (name, first, last))
+      cursor.execute("COMMIT")
+    except:
+      cursor.execute("ROLLBACK")
+      raise
+
+
+  def claim(self, worker, memory_limit = None):
+    """Claims the next work unit that can be executed for the given worker.
+    If a memory limit is given, the work units running on the machine of the worker may require at most this memory in total (a single work unit is always allowed).
+    Returns None if there is currently no such work unit."""
+    cursor = self.m_connection.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+      machine = machine_name(worker) + '-'
+      used = cursor.execute("""
+          SELECT COALESCE(SUM(stages.memory), 0), COUNT(*) FROM units JOIN stages ON units.stage = stages.name
+          WHERE units.state = 'running' AND substr(units.worker, 1, ?) = ?""", (len(machine), machine)).fetchone()
+      available = memory_limit - used[0] if memory_limit is not None and used[1] else None
+      row = cursor.execute("""
+          SELECT units.id, units.stage, stages.command, units.first, units.last FROM units JOIN stages ON units.stage = stages.name
+          WHERE units.state = 'waiting' AND (? IS NULL OR stages.memory <= ?) AND NOT EXISTS (
+              SELECT 1 FROM dependencies JOIN units AS required ON required.stage = dependencies.dependency
+              WHERE dependencies.stage = units.stage AND required.state != 'done')
+          ORDER BY stages.position, units.id LIMIT 1""", (available, available)).fetchone()
+      if row is not None:
+        cursor.execute("UPDATE units SET state = 'running', worker = ?, started = ? WHERE id = ?", (worker, time.time(), row[0]))
+      cursor.execute("COMMIT")
+    except:
+      cursor.execute("ROLLBACK")
+      raise
+    if row is None:
+      return None
+    return WorkUnit(row[0], row[1], row[2], (row[3], row[4]) if row[3] is not None else None)
+
+
+  def __set_state__(self, unit, state):
+    self.m_connection.execute("UPDATE units SET state = ?, finished = ? WHERE id = ?", (state, time.time(), unit.id))
+
+
+  def heartbeat(self, unit):
+    """Work units are not leased in this queue, so this function does nothing."""
+    pass
+
+
+  def complete(self, unit):
+    """Marks the given work unit as done."""
+    self.__set_state__(unit, 'done')
+
+
+  def fail(self, unit):
+    """Marks the given work unit as failed."""
+    self.__set_state__(unit, 'failed')
+
+
+  def status(self):
+    """Returns a dictionary with the number of work units in each state ('waiting', 'running', 'done' or 'failed')."""
+    status = dict((state, 0) for state in ('waiting', 'running', 'done', 'failed'))
+    status.update(self.m_connection.execute("SELECT state, COUNT(*) FROM units GROUP BY state").fetchall())
+    return status
+
+
+  def finished(self):
+    """Returns True if all work units are done, or if any work unit failed (in which case the remaining work units are not executed)."""
+    status = self.status()
+    return status['failed'] > 0 or status['waiting'] + status['running'] == 0
+
+
+
+class FileSystemWorkQueue:
+  """A work queue that is stored as files in a directory, which might be shared between several machines, e.g., via NFS.
+  Each work unit is a file, which is moved between the sub-directories 'waiting', 'running', 'done' and 'failed' using atomic renames.
+  A worker claims a work unit by renaming it into 'running', and holds the lease on the unit as long as it updates the modification time of the unit file (see :py:meth:`heartbeat`).
+  Work units whose lease is expired, e.g., because their worker crashed, are moved back to 'waiting', so that other workers can claim them.
+  Hence, workers can join (or leave) a running experiment from any machine that mounts the directory."""
+
+  STATES = ('waiting', 'running', 'done', 'failed')
+
+  def __init__(self, directory, lease_time = 300.):
+    self.m_directory = directory
+    self.lease_time = lease_time
+    for sub_dir in ('stages',) + self.STATES:
+      if not os.path.exists(os.path.join(directory, sub_dir)):
+        try:
+          os.makedirs(os.path.join(directory, sub_dir))
+        except OSError as e:
+          if e.errno != errno.EEXIST: raise
+    # the stages are never modified after they are written, so we can cache them
+    self.m_stages = {}
+    # the lock file of the workers on this machine, which is stored locally, since file locks are not reliable on NFS
+    self.m_machine_lock = os.path.join(tempfile.gettempdir(), 'facereclib-work-queue-%s.lock' % hashlib.sha1(os.path.abspath(directory)).hexdigest())
+
+
+  def __path__(self, state, name = ''):
+    return os.path.join(self.m_directory, state, name)
+
+
+  def __list__(self, state):
+    # files starting with '.' are temporary files
+    return sorted(name for name in os.listdir(self.__path__(state)) if not name.startswith('.'))
+
+
+  def __write__(self, filename, data):
+    """Writes the given data to a temporary file first, so that it appears atomically."""
+    handle, temp_file = tempfile.mkstemp(dir = os.path.dirname(filename), prefix = '.')
+    with os.fdopen(handle, 'wb') as f:
+      cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+    os.rename(temp_file, filename)
+
+
+  def __rename__(self, source, target):
+    """Renames the given file; returns False if the file does not exist (anymore), i.e., when another worker renamed it first."""
+    try:
+      os.rename(source, target)
+      return True
+    except OSError as e:
+      if e.errno != errno.ENOENT: raise
+      return False
+
+
+  def __stage__(self, position):
+    """Returns the stage with the given position, or None if it is not written yet."""
+    if position not in self.m_stages:
+      filename = self.__path__('stages', position)
+      if not os.path.exists(filename):
+        return None
+      with open(filename, 'rb') as f:
+        self.m_stages[position] = cPickle.load(f)
+    return self.m_stages[position]
+
+
+  def __now__(self):
+    """Returns the current time of the file system, which might differ from the clock of this machine."""
+    clock = self.__path__('running', '.clock-%s' % worker_name())
+    with open(clock, 'w'):
+      pass
+    now = os.path.getmtime(clock)
+    os.remove(clock)
+    return now
+
+
+  def add_stage(self, name, command, index_ranges = None, dependencies = [], memory = 0):
+    """Adds a stage with the given name, which executes the given command for the given list of (first, last) index ranges (None: a single unit for the whole stage).
+    The stage is executed only after all work units of the given stages are done.
+    Each work unit of the stage requires the given memory in bytes, see :py:meth:`claim`."""
+    stages = self.__list__('stages')
+    _check_dependencies(name, dependencies, set(self.__stage__(position)['name'] for position in stages))
+    position = "%04d" % len(stages)
+    units = list(index_ranges) if index_ranges is not None else [None]
+    # write the stage before its work units, so that the work units can be executed as soon as they appear
+    self.__write__(self.__path__('stages', position), {'name' : name, 'command' : command, 'units' : units, 'dependencies' : list(dependencies), 'memory' : memory or 0})
+    for index in range(len(units)):
+      open(self.__path__('waiting', "%s-%06d" % (position, index)), 'w').close()
+
+
+  def __stages_done__(self, stage_names):
+    """Checks if all units of the stages with the given names are done."""
+    done = self.__list__('done')
+    for position in self.__list__('stages'):
+      stage = self.__stage__(position)
+      if stage['name'] in stage_names and sum(1 for unit in done if unit.startswith(position + '-')) < len(stage['units']):
+        return False
+    return True
+
+
+  def __expire_leases__(self):
+    """Moves the work units with expired leases back to 'waiting'."""
+    now = None
+    for lease in self.__list__('running'):
+      try:
+        heartbeat = os.path.getmtime(self.__path__('running', lease))
+      except OSError:
+        continue
+      now = now or self.__now__()
+      if now - heartbeat > self.lease_time and self.__rename__(self.__path__('running', lease), self.__path__('waiting', lease.split('@')[0])):
+        warn("The lease of work unit '%s' of worker '%s' expired; the unit is executed again" % tuple(lease.split('@', 1)))
+
+
+  def __used_memory__(self, machine):
+    """Returns the number of work units running on the given machine and the memory that they require."""
+    running = [lease.split('@', 1) for lease in self.__list__('running')]
+    running = [unit_id for (unit_id, worker) in running if machine_name(worker) == machine]
+    return len(running), sum(self.__stage__(unit_id.split('-')[0])['memory'] for unit_id in running)
+
+
+  def claim(self, worker, memory_limit = None):
+    """Claims the next work unit that can be executed for the given worker.
+    If a memory limit is given, the work units running on the machine of the worker may require at most this memory in total (a single work unit is always allowed).
+    Returns None if there is currently no such work unit."""
+    self.__expire_leases__()
+    if memory_limit is None:
+      return self.__claim__(worker, None)
+    # the check of the memory and the claim of the work unit must not be interleaved with the other workers on this machine
+    with open(self.m_machine_lock, 'a') as lock:
+      fcntl.flock(lock, fcntl.LOCK_EX)
+      try:
+        count, used = self.__used_memory__(machine_name(worker))
+        return self.__claim__(worker, memory_limit - used if count else None)
+      finally:
+        fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+  def __claim__(self, worker, available):
+    """Claims the next work unit that can be executed and that requires at most the given available memory (None: any)."""
+    ready = {}
+    for unit_id in self.__list__('waiting'):
+      position, index = unit_id.split('-')
+      stage = self.__stage__(position)
+      if stage is None or (available is not None and stage['memory'] > available):
+        continue
+      if position not in ready:
+        ready[position] = self.__stages_done__(stage['dependencies'])
+      if ready[position] and self.__rename__(self.__path__('waiting', unit_id), self.__path__('running', '%s@%s' % (unit_id, worker))):
+        # we own the lease of this work unit now
+        unit = WorkUnit(unit_id, stage['name'], stage['command'], stage['units'][int(index)])
+        unit.worker = worker
+        self.heartbeat(unit)
+        return unit
+    return None
+
+
+  def heartbeat(self, unit):
+    """Renews the lease of the given work unit."""
+    try:
+      os.utime(self.__path__('running', '%s@%s' % (unit.id, unit.worker)), None)
+    except OSError:
+      warn("The lease of work unit '%s' was lost" % unit.id)
+
+
+  def __finish__(self, unit, state):
+    if not self.__rename__(self.__path__('running', '%s@%s' % (unit.id, unit.worker)), self.__path__(state, unit.id)):
+      warn("The lease of work unit '%s' was lost, so it might be executed more than once" % unit.id)
+
+
+  def complete(self, unit):
+    """Marks the given work unit as done."""
+    self.__finish__(unit, 'done')
+
+
+  def fail(self, unit):
+    """Marks the given work unit as failed."""
+    self.__finish__(unit, 'failed')
+
+
+  def status(self):
+    """Returns a dictionary with the number of work units in each state ('waiting', 'running', 'done' or 'failed')."""
+    return dict((state, len(self.__list__(state))) for state in self.STATES)
+
+
+  def finished(self):
+    """Returns True if all work units are done, or if any work unit failed (in which case the remaining work units are not executed)."""
+    status = self.status()
+    return status['failed'] > 0 or status['waiting'] + status['running'] == 0
+
+
+
+class Heartbeat:
+  """Renews the lease of a work unit regularly while the work unit is executed::
+
+    with Heartbeat(queue, unit):
+      ...
+
+  The lease is renewed by a separate process, since the long calls of bob (e.g. the training of a GMM) hold the GIL, which would starve a thread of this process.
+  The heartbeat process stops when the worker process dies."""
+
+  def __init__(self, queue, unit):
+    self.m_queue = queue
+    self.m_unit = unit
+    self.m_stop = multiprocessing.Event()
+    self.m_process = None
+
+  def __beat__(self, worker_pid):
+    while not self.m_stop.wait(self.m_queue.lease_time / 4.):
+      if os.getppid() != worker_pid:
+        # the worker died, so its lease must expire
+        break
+      self.m_queue.heartbeat(self.m_unit)
+
+  def __enter__(self):
+    if self.m_queue.lease_time is not None:
+      self.m_process = multiprocessing.Process(target = self.__beat__, args = (os.getpid(),))
+      self.m_process.daemon = True
+      self.m_process.start()
+    return self
+
+  def __exit__(self, *args):
+    self.m_stop.set()
+    if self.m_process is not None:
+      self.m_process.join()
@@ -117,7 +117,9 @@ setup(
         'isv               = facereclib.configurations.grid.isv_training:grid',
         'ivector           = facereclib.configurations.grid.ivector_training:grid',
         'local-p4          = facereclib.configurations.grid.local:grid',
-        'local-p16         = facereclib.configurations.grid.local:grid_p16'
+        'local-p16         = facereclib.configurations.grid.local:grid_p16',
+        'local-workers     = facereclib.configurations.grid.local:grid_workers',
+        'filesystem-workers = facereclib.configurations.grid.local:grid_filesystem'
       ],
 
       # registered tests (will, e.g., be run in the xbob.db.aggregator)